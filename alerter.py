@@ -1,3 +1,5 @@
+import argparse
+import sys
 import yaml
 import requests
 import os
@@ -23,8 +25,18 @@ def send_telegram_alert(bot_token, chat_id, message):
         # Log to stderr which can be seen in docker logs for the healthcheck
         logging.error(f"Failed to send Telegram alert: {e}")
 
-def main():
-    """Main function to load config and send alert."""
+def check_health(health_url):
+    """Queries the /healthz endpoint of the metrics server. Returns None if healthy, otherwise the reason."""
+    try:
+        response = requests.get(health_url, timeout=10)
+    except requests.exceptions.RequestException as e:
+        return f"Health endpoint not reachable: {e}"
+    if response.status_code != 200:
+        return response.text.strip() or f"Health endpoint returned status {response.status_code}"
+    return None
+
+def send_alert(failure=None):
+    """Loads the alert settings and sends an alert: about the failed health check if given, otherwise about a crash."""
     config_path = '/app/config.yaml'
     if not os.path.exists(config_path):
         logging.error(f"Configuration file not found at {config_path}")
@@ -50,13 +62,38 @@ def main():
         return
 
     container_hostname = platform.node() or 'unknown container'
-    message = (
-        f"<b>🚨 Health Check Failed!</b>\n\n"
-        f"The main process <code>flathunt.py</code> is no longer running in container <code>{container_hostname}</code>.\n\n"
-        f"The container has been marked as unhealthy and requires manual investigation."
-    )
+    if failure:
+        message = (
+            f"<b>🚨 Health Check Failed!</b>\n\n"
+            f"<code>flathunt.py</code> in container <code>{container_hostname}</code> is running but unhealthy:\n"
+            f"{failure}"
+        )
+    else:
+        message = (
+            f"<b>🚨 Health Check Failed!</b>\n\n"
+            f"The main process <code>flathunt.py</code> is no longer running in container <code>{container_hostname}</code>.\n\n"
+            f"The container has been marked as unhealthy and requires manual investigation."
+        )
     
     send_telegram_alert(bot_token, chat_id, message)
 
+def main():
+    """Main function: checks the health endpoint if given, and sends an alert."""
+    parser = argparse.ArgumentParser(description="Sends a Telegram alert when flathunt is down or unhealthy")
+    parser.add_argument("--health-url", help="Check this /healthz URL and only alert if it reports a problem")
+    args = parser.parse_args()
+
+    if not args.health_url:
+        send_alert()
+        return 0
+
+    failure = check_health(args.health_url)
+    if failure is None:
+        return 0
+    logging.error(f"Health check failed: {failure}")
+    send_alert(failure)
+    # A failed health check exits non-zero, so it can be used as a Docker HEALTHCHECK
+    return 1
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
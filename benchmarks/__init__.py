@@ -0,0 +1,2 @@
+"""Benchmarks for flathunter. Run them from the repository root, e.g.
+   python -m benchmarks.e2e --filters 20 --listings 50"""
@@ -0,0 +1,192 @@
+"""End-to-end benchmark of a flathunt cycle: N filters with M listings each are
+   crawled from recorded pages, stored in an SQLite stand-in for the Supabase
+   database and sent to a fake Telegram endpoint. Reports wall time, database
+   round-trips, HTTP calls and peak memory.
+
+   python -m benchmarks.e2e --filters 20 --listings 50 --delivery queue"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yaml
+
+from benchmarks.pages import WG_GESUCHT_URL, wg_gesucht_page
+from flathunter.config import Config
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.outbox import OutboxDispatcher
+from flathunter.parse_pool import ParsePool
+from flathunter.response_archive import ResponseArchive
+from flathunter.telegram_delivery import TelegramDeliveryQueue
+
+# The SQLite stand-in for Supabase lives with the tests, which import their helpers as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test"))
+from sqlite_supabase import SqliteSupabaseClient  # noqa: E402 pylint: disable=wrong-import-position
+
+
+LISTINGS_SCHEMA = (
+    "CREATE TABLE listings ("
+    "property_id INTEGER NOT NULL, user_id TEXT NOT NULL, filter_id TEXT NOT NULL, "
+    "crawler TEXT NOT NULL, details TEXT, processed BOOLEAN NOT NULL DEFAULT false, "
+    "created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP, updated_at TEXT, "
+    "UNIQUE (property_id, crawler, user_id, filter_id))"
+)
+
+
+class FakeTelegramServer:
+    """Local HTTP server answering sendMessage calls like the Telegram Bot API"""
+
+    def __init__(self):
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                server.requests += 1
+                body = json.dumps({"ok": True, "result": {}}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def api_url(self):
+        """sendMessage URL template, in the format of TelegramDeliveryQueue.API_URL"""
+        return "http://127.0.0.1:%d/bot{token}/sendMessage" % self.httpd.server_address[1]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def record_fixtures(archive_path, filters, listings):
+    """Record one result page per filter, with `listings` listings each, and return the filter URLs"""
+    archive = ResponseArchive(archive_path, ResponseArchive.MODE_RECORD)
+    urls = []
+    for filter_no in range(filters):
+        url = WG_GESUCHT_URL.format(filter=filter_no)
+        first_id = 1000000 + filter_no * listings
+        archive.store(url, wg_gesucht_page(range(first_id, first_id + listings)))
+        urls.append(url)
+    archive.close()
+    return urls
+
+
+def benchmark_config(workdir, delivery, batch_size, parse_workers):
+    """Configuration replaying the recorded pages and notifying a single receiver"""
+    settings = {
+        "database_location": workdir,
+        "notifiers": ["telegram"],
+        "message": "{title}\n{rooms} rooms, {size}, {price}\n{url}",
+        "telegram": {"bot_token": "benchmark", "receiver_ids": [1]},
+        "archive": {"path": os.path.join(workdir, "archive"), "mode": ResponseArchive.MODE_REPLAY},
+        "processing": {"batch_size": batch_size, "parse_workers": parse_workers},
+    }
+    if delivery in ("queue", "outbox"):
+        settings["telegram"]["delivery"] = {"workers": 4, "global_rate": 100000, "chat_rate": 100000}
+    if delivery == "outbox":
+        settings["telegram"]["outbox"] = {"batch_size": 100, "interval": 0.05}
+    return Config(string=yaml.safe_dump(settings))
+
+
+def run_benchmark(filters=10, listings=50, cycles=2, batch_size=25, delivery="inline", parse_workers=1):
+    """Run `cycles` flathunt cycles over all filters and return the measurements"""
+    with tempfile.TemporaryDirectory() as workdir, FakeTelegramServer() as telegram:
+        urls = record_fixtures(os.path.join(workdir, "archive"), filters, listings)
+        config = benchmark_config(workdir, delivery, batch_size, parse_workers)
+        database = SqliteSupabaseClient(LISTINGS_SCHEMA)
+        api_url, TelegramDeliveryQueue.API_URL = TelegramDeliveryQueue.API_URL, telegram.api_url
+        tracemalloc.start()
+        try:
+            started = time.perf_counter()
+            cycle_times = []
+            found = 0
+            for _ in range(cycles):
+                cycle_started = time.perf_counter()
+                for (filter_no, url) in enumerate(urls):
+                    id_watch = IdMaintainer(database, "user-%d" % filter_no, "filter-%d" % filter_no)
+                    hunter = Hunter(config.overlay({"urls": [url]}), id_watch, id_watch.already_seen_filter)
+                    found += hunter.hunt()
+                cycle_times.append(time.perf_counter() - cycle_started)
+            # Wait for queued notifications, so that delivery is part of the measurement
+            OutboxDispatcher.shutdown_shared(timeout=60)
+            TelegramDeliveryQueue.shutdown_shared(timeout=60)
+            ParsePool.shutdown_shared()
+            wall_time = time.perf_counter() - started
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            TelegramDeliveryQueue.API_URL = api_url
+            database.close()
+        archive = ResponseArchive.for_config(config)
+        return {
+            "filters": filters,
+            "listings": listings,
+            "cycles": cycles,
+            "delivery": delivery,
+            "new_exposes": found,
+            "wall_time": wall_time,
+            "cycle_times": cycle_times,
+            "db_round_trips": database.round_trips,
+            "page_fetches": archive.replayed,
+            "telegram_calls": telegram.requests,
+            "peak_memory": peak_memory,
+        }
+
+
+def format_report(report):
+    """Format the measurements as a table"""
+    rows = [
+        ("filters x listings", "%d x %d" % (report["filters"], report["listings"])),
+        ("cycles", report["cycles"]),
+        ("delivery", report["delivery"]),
+        ("new exposes", report["new_exposes"]),
+        ("wall time", "%.3fs" % report["wall_time"]),
+        ("cycle times", ", ".join("%.3fs" % cycle_time for cycle_time in report["cycle_times"])),
+        ("db round-trips", report["db_round_trips"]),
+        ("http calls", "%d pages, %d telegram" % (report["page_fetches"], report["telegram_calls"])),
+        ("peak memory", "%.1f MiB" % (report["peak_memory"] / 2**20)),
+    ]
+    return "\n".join("%-20s %s" % row for row in rows)
+
+
+def main():
+    """Run the benchmark from the command line"""
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of flathunt cycles")
+    parser.add_argument("--filters", type=int, default=10, help="Number of filters")
+    parser.add_argument("--listings", type=int, default=50, help="Listings per filter")
+    parser.add_argument("--cycles", type=int, default=2, help="Cycles to run; later cycles find no new listings")
+    parser.add_argument("--batch-size", type=int, default=25, help="Processor micro-batch size")
+    parser.add_argument("--parse-workers", type=int, default=1, help="Processes for parsing result pages")
+    parser.add_argument("--delivery", choices=["inline", "queue", "outbox"], default="inline",
+                        help="How Telegram messages are sent")
+    parser.add_argument("--json", action="store_true", help="Print the measurements as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run_benchmark(args.filters, args.listings, args.cycles, args.batch_size, args.delivery,
+                           args.parse_workers)
+    print(json.dumps(report) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
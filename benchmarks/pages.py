@@ -0,0 +1,162 @@
+"""Generated search result pages in the markup the crawlers parse. Pages are
+   deterministic, so benchmark runs are comparable"""
+import json
+
+WG_GESUCHT_URL = "https://www.wg-gesucht.de/wg-zimmer-in-Berlin.8.0.1.0.html?filter={filter}"
+
+WG_GESUCHT_ENTRY = """
+<div id="liste-details-ad-{id}" class="wgg_card offer_list_item">
+  <div class="card_image">
+    <a href="/wg-zimmer-in-Berlin-Mitte.{id}.html" style="background-image: url(https://img.wg-gesucht.de/{id}.jpg);"></a>
+  </div>
+  <h3 class="truncate_title"><a href="/wg-zimmer-in-Berlin-Mitte.{id}.html">Sunny room number {id} near the park</a></h3>
+  <div class="col-xs-11"><span>{rooms} Zimmer Wohnung | Berlin Mitte | Musterstrasse {id}</span></div>
+  <div class="middle">
+    <div class="col-xs-3"><b>{price} &euro;</b></div>
+    <div class="text-center">01.05.2024 - 30.09.2024</div>
+    <div class="text-right"><b>{size} m²</b></div>
+  </div>
+</div>
+"""
+
+
+def wg_gesucht_page(listing_ids):
+    """A WG-Gesucht result list with one card per listing id"""
+    entries = "".join(WG_GESUCHT_ENTRY.format(**_listing(listing_id)) for listing_id in listing_ids)
+    return "<html><body><div id=\"main_column\">%s</div></body></html>" % entries
+
+
+IMMOWELT_ENTRY = """
+<div class="EstateItem">
+  <a id="selectable-{id}" href="https://www.immowelt.de/expose/{id}">
+    <picture><source data-srcset="https://media.immowelt.org/{id}.jpg"/></picture>
+    <h2>Helle Wohnung Nummer {id} mit Balkon</h2>
+    <div data-test="price">{price} &euro;</div>
+    <div data-test="area">{size} m²</div>
+    <div data-test="rooms">{rooms} Zi.</div>
+    <div class="IconFact-e8a23"><span>Berlin (Mitte), Musterstrasse {id}</span></div>
+  </a>
+</div>
+"""
+
+
+def immowelt_page(listing_ids):
+    """An Immowelt result list"""
+    entries = "".join(IMMOWELT_ENTRY.format(**_listing(listing_id)) for listing_id in listing_ids)
+    return "<html><body><main>%s</main></body></html>" % entries
+
+
+EBAY_ENTRY = """
+<li class="ad-listitem">
+  <article class="aditem" data-adid="{id}">
+    <div class="galleryimage-element" data-imgsrc="https://img.kleinanzeigen.de/{id}.jpg"></div>
+    <div class="aditem-main--top--left">10115 Mitte</div>
+    <h2><a class="ellipsis" href="/s-anzeige/wohnung-{id}/{id}">Schoene Wohnung Nummer {id}</a></h2>
+    <p class="aditem-main--middle--price">{price} &euro;</p>
+    <span class="simpletag tag-small">{size} m²</span>
+    <span class="simpletag tag-small">{rooms} Zimmer</span>
+  </article>
+</li>
+"""
+
+
+def ebay_kleinanzeigen_page(listing_ids):
+    """An Ebay Kleinanzeigen result list"""
+    entries = "".join(EBAY_ENTRY.format(**_listing(listing_id)) for listing_id in listing_ids)
+    return '<html><body><ul id="srchrslt-adtable">%s</ul></body></html>' % entries
+
+
+IMMOBILIARE_ENTRY = """
+<li class="listing-item js-row-detail" data-id="{id}">
+  <div class="showcase__item"><img src="https://pic.im-cdn.it/{id}.jpg"/></div>
+  <p class="titolo text-primary"><a href="https://www.immobiliare.it/annunci/{id}/">Bilocale via Roma {id}</a></p>
+  <ul>
+    <li class="lif__pricing">&euro; {price}/mese</li>
+    <li class="lif__item"><span>{price}</span></li>
+    <li class="lif__item"><span>{rooms}</span> locali</li>
+    <li class="lif__item"><span>{size}</span> m²</li>
+  </ul>
+</li>
+"""
+
+
+def immobiliare_page(listing_ids):
+    """An Immobiliare result list"""
+    entries = "".join(IMMOBILIARE_ENTRY.format(**_listing(listing_id)) for listing_id in listing_ids)
+    return "<html><body><ul>%s</ul></body></html>" % entries
+
+
+def subito_page(listing_ids):
+    """A Subito result page, which embeds the search results as JSON"""
+    items = [
+        {
+            "item": {
+                "urn": "id:ad:%d:list:%d" % (listing_id, listing_id),
+                "subject": "Bilocale arredato numero %d" % listing_id,
+                "urls": {"default": "https://www.subito.it/appartamenti/%d.htm" % listing_id},
+                "images": [
+                    {"scale": [{"secureuri": "https://images.sbito.it/%d-%d.jpg" % (listing_id, idx)}] * 5}
+                    for idx in range(5)
+                ],
+                "features": {
+                    "/price": {"values": [{"key": "%d €/mese" % listing["price"]}]},
+                    "/room": {"values": [{"key": str(listing["rooms"])}]},
+                    "/size": {"values": [{"key": "%d mq" % listing["size"]}]},
+                },
+                "geo": {
+                    "town": {"value": "Milano"},
+                    "city": {"shortName": "MI"},
+                    "region": {"value": "Lombardia"},
+                },
+            }
+        }
+        for listing_id in listing_ids
+        for listing in [_listing(listing_id)]
+    ]
+    data = json.dumps({"props": {"state": {"items": {"list": items}}}})
+    return '<html><body><script id="__NEXT_DATA__" type="application/json">%s</script></body></html>' % data
+
+
+IDEALISTA_ENTRY = """
+<article class="item" data-element-id="{id}">
+  <picture class="item-multimedia no-pictures"><img src="https://img3.idealista.com/{id}.jpg"/></picture>
+  <a class="item-link" href="/inmueble/{id}/">Piso en calle Mayor {id}, Madrid</a>
+  <span class="item-price">{price}&euro;/mes</span>
+  <span class="item-detail">{rooms} hab.</span>
+  <span class="item-detail">{size} m²</span>
+  <span class="item-detail">Planta 3ª exterior con ascensor</span>
+</article>
+"""
+
+
+def idealista_page(listing_ids):
+    """An Idealista result list"""
+    entries = "".join(IDEALISTA_ENTRY.format(**_listing(listing_id)) for listing_id in listing_ids)
+    return "<html><body><section>%s</section></body></html>" % entries
+
+
+IMMOBILIENSCOUT_ENTRY = """
+<li class="result-list__listing">
+  <div class="result-list-entry__gallery-container">
+    <div class="gallery-container"><img src="https://pictures.immobilienscout24.de/{id}.jpg"/></div>
+  </div>
+  <a class="result-list-entry__brand-title-container" href="/expose/{id}">NEU Wohnung Nummer {id} am Park</a>
+  <div class="result-list-entry__address">Musterstrasse {id}, Mitte, Berlin</div>
+  <dl data-is24-qa="attributes">
+    <dd>{price} &euro;</dd>
+    <dd>{size} m²</dd>
+    <dd>{rooms} Zi.</dd>
+  </dl>
+</li>
+"""
+
+
+def immobilienscout_page(listing_ids):
+    """An ImmoScout24 result list"""
+    entries = "".join(IMMOBILIENSCOUT_ENTRY.format(**_listing(listing_id)) for listing_id in listing_ids)
+    return '<html><body><ul id="resultListItems">%s</ul></body></html>' % entries
+
+
+def _listing(listing_id):
+    """Deterministic listing attributes for an id"""
+    return {"id": listing_id, "rooms": 1 + listing_id % 4, "price": 400 + listing_id % 800, "size": 12 + listing_id % 60}
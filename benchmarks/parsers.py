@@ -0,0 +1,135 @@
+"""Micro-benchmarks of the crawlers' result page parsers. Each parser turns a
+   generated page into exposes (building the soup and running extract_data);
+   the benchmark reports listings per second and memory allocated per page, and
+   can compare against a saved baseline, failing if a parser got slower.
+
+   python -m benchmarks.parsers --save-baseline baseline.json
+   python -m benchmarks.parsers --baseline baseline.json --threshold 0.2"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks import pages
+from flathunter.abstract_crawler import make_soup
+from flathunter.crawl_ebaykleinanzeigen import CrawlEbayKleinanzeigen
+from flathunter.crawl_idealista import CrawlIdealista
+from flathunter.crawl_immobiliare import CrawlImmobiliare
+from flathunter.crawl_immobilienscout import CrawlImmobilienscout
+from flathunter.crawl_immowelt import CrawlImmowelt
+from flathunter.crawl_wggesucht import CrawlWgGesucht
+from flathunter.crawler_subito import CrawlSubito
+
+PARSERS = {
+    "CrawlEbayKleinanzeigen": (CrawlEbayKleinanzeigen, pages.ebay_kleinanzeigen_page),
+    "CrawlIdealista": (CrawlIdealista, pages.idealista_page),
+    "CrawlImmobiliare": (CrawlImmobiliare, pages.immobiliare_page),
+    "CrawlImmobilienscout": (CrawlImmobilienscout, pages.immobilienscout_page),
+    "CrawlImmowelt": (CrawlImmowelt, pages.immowelt_page),
+    "CrawlSubito": (CrawlSubito, pages.subito_page),
+    "CrawlWgGesucht": (CrawlWgGesucht, pages.wg_gesucht_page),
+}
+
+
+def parse_page(crawler, markup):
+    """Parse a result page the way Crawler.get_results does"""
+    return crawler.extract_data(make_soup(markup))
+
+
+def benchmark_parser(name, listings=50, repeat=5):
+    """Measure one parser on a page with `listings` listings. Timing is the best
+    of `repeat` runs; allocations are measured on a separate, traced run"""
+    crawler_class, page = PARSERS[name]
+    # extract_data only depends on the class, so the constructor (which may read settings) is skipped
+    crawler = crawler_class.__new__(crawler_class)
+    markup = page(range(10000000, 10000000 + listings))
+
+    exposes = parse_page(crawler, markup)
+    if len(exposes) != listings:
+        raise AssertionError("%s extracted %d of %d listings" % (name, len(exposes), listings))
+
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse_page(crawler, markup)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        parse_page(crawler, markup)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"listings_per_second": listings / best, "seconds_per_page": best, "peak_bytes_per_page": peak}
+
+
+def run_benchmarks(names=None, listings=50, repeat=5):
+    """Benchmark the given parsers (all by default)"""
+    return {name: benchmark_parser(name, listings, repeat) for name in (names or sorted(PARSERS))}
+
+
+def regressions(results, baseline, threshold=0.2):
+    """Return a description of every parser whose throughput dropped, or whose memory
+    use grew, by more than `threshold` compared to the baseline"""
+    found = []
+    for (name, result) in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if result["listings_per_second"] < expected["listings_per_second"] * (1 - threshold):
+            found.append(
+                "%s: %.0f listings/s, baseline %.0f"
+                % (name, result["listings_per_second"], expected["listings_per_second"])
+            )
+        if result["peak_bytes_per_page"] > expected["peak_bytes_per_page"] * (1 + threshold):
+            found.append(
+                "%s: %d bytes/page, baseline %d"
+                % (name, result["peak_bytes_per_page"], expected["peak_bytes_per_page"])
+            )
+    return found
+
+
+def format_results(results):
+    """Format the measurements as a table"""
+    lines = ["%-24s %14s %12s %14s" % ("parser", "listings/s", "ms/page", "KiB/page")]
+    for (name, result) in results.items():
+        lines.append(
+            "%-24s %14.0f %12.2f %14.1f"
+            % (name, result["listings_per_second"], result["seconds_per_page"] * 1000,
+               result["peak_bytes_per_page"] / 1024)
+        )
+    return "\n".join(lines)
+
+
+def main():
+    """Run the parser benchmarks from the command line"""
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the crawler result page parsers")
+    parser.add_argument("parsers", nargs="*", help="Parsers to run (default: all of %s)" % ", ".join(sorted(PARSERS)))
+    parser.add_argument("--listings", type=int, default=50, help="Listings per page")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per parser; the best is reported")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Write the results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against the results in FILE")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Tolerated relative regression")
+    args = parser.parse_args()
+    unknown = set(args.parsers) - set(PARSERS)
+    if unknown:
+        parser.error("unknown parsers: %s" % ", ".join(sorted(unknown)))
+
+    results = run_benchmarks(args.parsers, args.listings, args.repeat)
+    print(format_results(results))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            found = regressions(results, json.load(file), args.threshold)
+        if found:
+            print("\nRegressions beyond %d%%:\n%s" % (args.threshold * 100, "\n".join(found)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,16 +9,24 @@ import os
 import logging
 import sys
 import time
-import yaml
 from pprint import pformat
 
 from flathunter.idmaintainer import IdMaintainer
 from flathunter.hunter import Hunter
 from flathunter.config import Config
+from flathunter.cycle_report import CycleReporter
 from flathunter.heartbeat import Heartbeat
+from flathunter.metrics import REGISTRY, MetricsServer
 from flathunter.user_manager import UserManager
 from flathunter.oxylab_client import PushPullScraperAPIsClient
 from flathunter.supabase_client import SupabaseClient
+from flathunter.outbox import Outbox, OutboxDispatcher, outbox_path
+from flathunter.parse_pool import ParsePool
+from flathunter.profiler import SamplingProfiler
+from flathunter.response_archive import ResponseArchive
+from flathunter.scheduler import FilterScheduler
+from flathunter.sharding import WorkerLease
+from flathunter.telegram_delivery import TelegramDeliveryQueue
 
 
 # init logging
@@ -48,6 +56,24 @@ else:
 logging.basicConfig(format=LOG_FORMAT, datefmt="%Y/%m/%d %H:%M:%S", level=logging.INFO)
 __log__ = logging.getLogger("flathunt")
 
+CYCLE_SECONDS = REGISTRY.histogram(
+    "flathunt_cycle_seconds",
+    "Time between the starts of consecutive refresh cycles; above refresh_interval, filter runs delay the loop",
+    buckets=(60, 120, 300, 450, 600, 900, 1200, 1800, 3600),
+)
+FILTER_RUN_SECONDS = REGISTRY.histogram("flathunt_filter_run_seconds", "Duration of a filter run", ["filter_id"])
+FILTER_RUN_ERRORS = REGISTRY.counter("flathunt_filter_run_errors_total", "Filter runs that failed", ["filter_id"])
+SCHEDULE_LAG_SECONDS = REGISTRY.histogram(
+    "flathunt_schedule_lag_seconds", "How late filter runs start compared to their schedule"
+)
+ACTIVE_FILTERS = REGISTRY.gauge("flathunt_active_filters", "Filters scheduled on this worker")
+LAST_RUN_TIMESTAMP = REGISTRY.gauge(
+    "flathunt_last_filter_run_timestamp_seconds", "Unix time at which the last successful filter run completed"
+)
+
+# Seconds after which a filter whose OxyLab job was still pending is tried again
+OXYLAB_POLL_INTERVAL = 5
+
 
 def create_user_config(base_config, user_data):
     """
@@ -58,31 +84,32 @@ def create_user_config(base_config, user_data):
         user_data: User data from database
 
     Returns:
-        User-specific Config object
+        User-specific Config object, overlaying the base configuration
     """
-    # Create a new config dict based on base config
-    # Copy from base_config.config (the actual configuration dictionary)
-    user_config_dict = base_config.config.copy()
+    overrides = {}
 
     # Override with user-specific settings
     if user_data.get("filter_url"):
-        user_config_dict["urls"] = [user_data["filter_url"]]
+        overrides["urls"] = [user_data["filter_url"]]
 
     # Add job_id if available
     if user_data.get("oxylabs_job_id"):
-        user_config_dict["oxylabs_job_id"] = user_data["oxylabs_job_id"]
+        overrides["oxylabs_job_id"] = user_data["oxylabs_job_id"]
 
+    # Nested telegram settings are copied before being overridden, so the base config stays untouched
+    telegram = None
     if user_data.get("receiver_ids"):
-        if "telegram" not in user_config_dict:
-            user_config_dict["telegram"] = {}
-        # Make sure to copy existing telegram config but override receiver_ids
-        if "telegram" in base_config.config:
-            user_config_dict["telegram"] = base_config.config["telegram"].copy()
-        user_config_dict["telegram"]["receiver_ids"] = user_data["receiver_ids"]
+        telegram = dict(base_config.get("telegram") or {}, receiver_ids=user_data["receiver_ids"])
+
+    # Per-filter digest threshold overrides the global one
+    if user_data.get("digest_threshold"):
+        telegram = dict(telegram or base_config.get("telegram") or {})
+        telegram["digest"] = dict(telegram.get("digest") or {}, threshold=user_data["digest_threshold"])
 
-    # Convert config dict to YAML string and create Config object
-    config_yaml = yaml.dump(user_config_dict)
-    return Config(string=config_yaml)
+    if telegram is not None:
+        overrides["telegram"] = telegram
+
+    return base_config.overlay(overrides)
 
 
 def launch_flat_hunt_for_user(user_config, user_id, filter_id, supabase_client):
@@ -94,6 +121,9 @@ def launch_flat_hunt_for_user(user_config, user_id, filter_id, supabase_client):
         user_id: User ID for logging and ID tracking
         filter_id: Filter ID for the user
         supabase_client: Supabase client instance
+
+    Returns:
+        None if the hunt succeeded, otherwise the error message
     """
     # Create user-specific ID maintainer
     id_watch = IdMaintainer(supabase_client, user_id, filter_id)
@@ -103,28 +133,170 @@ def launch_flat_hunt_for_user(user_config, user_id, filter_id, supabase_client):
     __log__.info(f"Starting flat hunt for user {user_id} with filter {filter_id}")
 
     try:
-        hunter.hunt_flats()
+        with FILTER_RUN_SECONDS.time(filter_id=filter_id):
+            hunter.hunt()
+        # Only successful runs keep the health check happy
+        LAST_RUN_TIMESTAMP.set(time.time())
         __log__.info(f"Completed flat hunt for user {user_id} with filter {filter_id}")
+        return None
     except Exception as e:
+        FILTER_RUN_ERRORS.inc(filter_id=filter_id)
         __log__.error(f"Error hunting flats for user {user_id} with filter {filter_id}: {e}")
+        return str(e)
+
+
+def create_oxylab_jobs(oxylab_client, scheduler, jobs, lead_time):
+    """
+    Create an OxyLab scraper job for every filter run that starts within `lead_time`
+    seconds. A push-pull job scrapes its URL only once, so every run gets a job of its
+    own, created ahead of the run to give OxyLab time to complete it. Jobs of runs that
+    were moved further away, by a changed or adapted interval, are dropped and created
+    again when the run comes up
+
+    Args:
+        oxylab_client: OxyLab client instance
+        scheduler: Filter scheduler
+        jobs: Jobs of the runs that have not started yet, as (job id, creation time) by filter id
+        lead_time: Seconds before a run at which its job is created
+
+    Returns:
+        Unix time at which the next job is due to be created, or None if there is none
+    """
+    now = scheduler.clock()
+    for filter_id in list(jobs):
+        entry = scheduler.entries.get(filter_id)
+        if entry is None or entry.due - lead_time > now:
+            del jobs[filter_id]
+
+    next_job = None
+    for filter_id, entry in scheduler.entries.items():
+        if filter_id in jobs or not entry.data.get("filter_url"):
+            continue
+        if entry.due - lead_time > now:
+            next_job = min(next_job or float("inf"), entry.due - lead_time)
+            continue
+        try:
+            # Create scraper job payload
+            payload = {"source": "universal", "url": entry.data["filter_url"], "render": ""}
+            job_id = oxylab_client.create_job(payload).get("id")
+            if job_id:
+                jobs[filter_id] = (job_id, now)
+                __log__.info(f"Created OxyLab job {job_id} for filter {filter_id}")
+        except Exception as e:
+            __log__.error(f"Error creating OxyLab job for filter {filter_id}: {e}")
+    return next_job
+
+
+def take_oxylab_job(oxylab_client, jobs, filter_id, timeout, now):
+    """
+    Take the OxyLab job of a filter run that is about to start, without waiting for it.
+    A job that is still pending stays, and the run is to be retried shortly; a job that
+    failed, or is pending for longer than `timeout` seconds, is dropped and the run
+    fetches its page directly
+
+    Args:
+        oxylab_client: OxyLab client instance
+        jobs: Jobs of the runs that have not started yet, as (job id, creation time) by filter id
+        filter_id: Filter that is about to be crawled
+        timeout: Seconds after which a pending job is given up on
+        now: Current time, on the clock of the scheduler
+
+    Returns:
+        Tuple of (ready, job id). The job id is None if the run has no usable job
+    """
+    if filter_id not in jobs:
+        return True, None
+    (job_id, created) = jobs[filter_id]
+    try:
+        status = oxylab_client.check_job_status(job_id)
+    except Exception as e:
+        __log__.error(f"Error checking OxyLab job {job_id} for filter {filter_id}: {e}")
+        status = None
+    if status == "pending" and now - created < timeout:
+        return False, job_id
+    del jobs[filter_id]
+    if status != "done":
+        __log__.warning(f"OxyLab job {job_id} for filter {filter_id} is {status}, fetching directly")
+        return True, None
+    return True, job_id
+
+
+def health_check(max_staleness, started, scheduled_filters=None):
+    """
+    Build the health check of the metrics server: healthy while a filter run
+    succeeded in the last `max_staleness` seconds, or while no filters are
+    scheduled. Staleness counts from the start of the process, or from the last
+    time the schedule was empty, if that was later
+
+    Args:
+        max_staleness: Seconds without a successful filter run after which the process is unhealthy
+        started: Unix time at which the process started
+        scheduled_filters: Function returning the number of scheduled filters
+
+    Returns:
+        Function returning (healthy, message)
+    """
+    idle_since = started
+
+    def check():
+        nonlocal idle_since
+        if scheduled_filters is not None and not scheduled_filters():
+            idle_since = time.time()
+            return True, "OK, no filters scheduled"
+        age = time.time() - max(LAST_RUN_TIMESTAMP.value(), idle_since)
+        if age > max_staleness:
+            return False, f"No filter run succeeded in the last {age:.0f}s (limit {max_staleness}s)"
+        return True, f"OK, last filter run succeeded {age:.0f}s ago"
+
+    return check
 
 
 def launch_flat_hunt_multi_user(base_config):
     """
-    Launch flat hunting for multiple users sequentially
+    Launch flat hunting for multiple users. Each filter is crawled at its own
+    scraping interval, in the order in which the filters become due. With sharding
+    configured, the filters are shared with the other live workers
 
     Args:
         base_config: Base configuration
     """
 
+    # The cycle report and the profiler attribute time to the stages of the filter runs
+    cycle_reporter = CycleReporter.for_config(base_config)
+    profiler = SamplingProfiler.for_config(base_config)
+    profile_settings = base_config.get("profiling") or dict()
+    if cycle_reporter or profiler:
+        processing = base_config.get("processing", dict()) or dict()
+        base_config = base_config.overlay({"processing": dict(processing, instrument=True)})
+
     user_manager = UserManager(base_config)
     supabase_client = SupabaseClient(base_config)
     admin_heartbeat = Heartbeat(base_config)
+    scheduler = FilterScheduler.from_config(base_config)
+    worker_lease = WorkerLease.from_config(base_config, supabase_client)
+    schedule_settings = base_config.get("loop", dict()).get("schedule") or dict()
+    refresh_interval = schedule_settings.get("refresh_interval", 5 * 60)
+    heartbeat_interval = schedule_settings.get("heartbeat_interval", 10 * 60)
+    oxylab_lead_time = schedule_settings.get("oxylabs_lead_time", 30)
+    oxylab_job_timeout = schedule_settings.get("oxylabs_job_timeout", 300)
+    next_refresh = 0
+    next_heartbeat = time.time() + heartbeat_interval
     counter = 0
+    last_refresh = None
+
+    # Serve metrics and the health check, if a metrics port is configured
+    metrics_settings = base_config.get("metrics") or dict()
+    MetricsServer.for_config(
+        base_config, health_check(metrics_settings.get("max_staleness", 3600), time.time(), lambda: len(scheduler))
+    )
+    ACTIVE_FILTERS.set_function(lambda: len(scheduler.entries))
+    PushPullScraperAPIsClient.cost_per_result = (base_config.get("oxylabs") or dict()).get("cost_per_result", 0)
 
-    # Initialize OxyLab client if credentials are available
+    # Initialize OxyLab client if credentials are available. Not needed when replaying archived pages
     oxylab_client = None
-    if base_config.get("oxylabs"):
+    oxylab_jobs = {}
+    archive = ResponseArchive.for_config(base_config)
+    if base_config.get("oxylabs") and not (archive and archive.replaying):
         oxylab_username = base_config.get("oxylabs", {}).get("user")
         oxylab_password = base_config.get("oxylabs", {}).get("password")
         if oxylab_username and oxylab_password:
@@ -135,79 +307,131 @@ def launch_flat_hunt_multi_user(base_config):
         __log__.info("Starting multi-user flat hunting")
 
         while base_config.get("loop", dict()).get("active", False):
-            counter += 1
+            # Reload the active filters and bring the schedule up to date
+            if time.time() >= next_refresh:
+                if cycle_reporter:
+                    cycle_reporter.finish_cycle()
+                    cycle_reporter.start_cycle(counter + 1)
+                # Profile the first cycles, then write the profile and carry on without the profiler
+                if profiler and counter == 0:
+                    __log__.info(f"Profiling the first {profile_settings['cycles']} cycles")
+                    profiler.start()
+                elif profiler and counter == profile_settings["cycles"]:
+                    profiler.stop()
+                    profiler.write(profile_settings.get("path", "profiles"))
+                    profiler = None
+                counter += 1
+                next_refresh = time.time() + refresh_interval
+                if last_refresh is not None:
+                    CYCLE_SECONDS.observe(time.time() - last_refresh)
+                last_refresh = time.time()
+                try:
+                    filters_dict = user_manager.refresh_active_filters()
+                    __log__.info(f"Found {len(filters_dict)} active filters")
+                except Exception as e:
+                    __log__.error(f"Error fetching filters: {e}")
+                    filters_dict = None
 
-            # Get active filters for this cycle
-            try:
-                filters_dict = user_manager.get_active_filters()
-                __log__.info(f"Found {len(filters_dict)} active filters")
-            except Exception as e:
-                __log__.error(f"Error fetching filters: {e}")
-                time.sleep(base_config.get("loop", dict()).get("sleeping_time", 60 * 10))
+                # Only keep the filters this worker is responsible for
+                if filters_dict is not None and worker_lease:
+                    try:
+                        filters_dict = worker_lease.owned(filters_dict)
+                    except Exception as e:
+                        __log__.error(f"Error renewing worker lease, keeping current filters: {e}")
+                        filters_dict = None
+
+                if filters_dict is not None:
+                    added = scheduler.sync(filters_dict)
+                    if added:
+                        __log__.info(f"Scheduled {len(added)} new filters")
+
+                    # Poll filters that find many new listings more often, idle ones less
+                    if scheduler.adaptive:
+                        window = scheduler.adaptive.get("window", 24 * 3600)
+                        scheduler.adapt(user_manager.get_new_listing_counts(window), window)
+
+                if not scheduler:
+                    __log__.warning("No active filters found, sleeping...")
+
+            # Send admin telegram notification, with the schedule lag since the last one
+            if time.time() >= next_heartbeat:
+                next_heartbeat = time.time() + heartbeat_interval
+                runs, mean_lag, max_lag = scheduler.lag_report()
+                __log__.info(
+                    f"Completed {runs} filter runs in refresh cycle {counter}, "
+                    f"lag behind schedule: mean {mean_lag:.1f}s, max {max_lag:.1f}s"
+                )
+                if worker_lease is None or worker_lease.is_leader():
+                    admin_heartbeat.send_heartbeat()
+
+            # Start the OxyLab scraper jobs of the filter runs coming up
+            next_job = None
+            if oxylab_client:
+                next_job = create_oxylab_jobs(oxylab_client, scheduler, oxylab_jobs, oxylab_lead_time)
+
+            scheduled = scheduler.pop_due()
+            if scheduled is None:
+                # Sleep until the next filter is due, waking up for refreshes, heartbeats and OxyLab jobs
+                wait = scheduler.wait_time()
+                wake_up = min(next_refresh, next_heartbeat, next_job or float("inf")) - time.time()
+                time.sleep(max(0, min(wake_up, wait) if wait is not None else wake_up))
                 continue
 
-            if not filters_dict:
-                __log__.warning("No active filters found, sleeping...")
-                time.sleep(base_config.get("loop", dict()).get("sleeping_time", 60 * 10))
-                continue
+            filter_id, filter_data = scheduled.filter_id, scheduled.data
 
-            # Initialize OxyLab scraper jobs for each filter
+            # Retry the filter shortly if OxyLab has not completed the job of this run yet
+            job_id = None
             if oxylab_client:
-                for filter_id, filter_data in filters_dict.items():
-                    try:
-                        if filter_data.get("filter_url") and not filter_data.get("oxylabs_job_id"):
-                            # Create scraper job payload
-                            payload = {"source": "universal", "url": filter_data["filter_url"], "render": ""}
-
-                            # Create job and store job ID in filter_data
-                            job_info = oxylab_client.create_job(payload)
-                            job_id = job_info.get("id")
-
-                            if job_id:
-                                filter_data["oxylabs_job_id"] = job_id
-                                # TODO: Update filter_data in database with job_id
-                                __log__.info(f"Created OxyLab job {job_id} for filter {filter_id}")
-
-                    except Exception as e:
-                        __log__.error(f"Error creating OxyLab job for filter {filter_id}: {e}")
-
-            # Add common 30-second delay before processing filters
-            __log__.info("Waiting 30 seconds for OxyLab jobs to initialize...")
-            time.sleep(30)
-            
-            # Process each filter sequentially
-            for i, (filter_id, filter_data) in enumerate(filters_dict.items(), 1):
-                try:
-                    user_id = filter_data.get("user_id")
-                    __log__.info(f"Processing filter {filter_id} for user {user_id} ({i}/{len(filters_dict)})")
-
-                    # Create filter-specific config
-                    user_config = create_user_config(base_config, filter_data)
+                ready, job_id = take_oxylab_job(
+                    oxylab_client, oxylab_jobs, filter_id, oxylab_job_timeout, scheduler.clock()
+                )
+                if not ready:
+                    scheduler.postpone(scheduled, OXYLAB_POLL_INTERVAL)
+                    continue
 
-                    # Hunt flats for this filter
-                    launch_flat_hunt_for_user(user_config, user_id, filter_id, supabase_client)
+            SCHEDULE_LAG_SECONDS.observe(max(0, scheduled.last_run - scheduled.due))
+            user_id = filter_data.get("user_id")
+            error = None
+            started = time.time()
+            try:
+                __log__.info(
+                    f"Processing filter {filter_id} for user {user_id} "
+                    f"({scheduled.last_run - scheduled.due:.1f}s behind schedule)"
+                )
 
-                    # Small delay between filters to avoid overwhelming servers
-                    if i < len(filters_dict):
-                        time.sleep(5)
+                # Create filter-specific config, with the OxyLab job of this run
+                run_data = dict(filter_data, oxylabs_job_id=job_id) if job_id else filter_data
+                user_config = create_user_config(base_config, run_data)
 
-                except Exception as e:
-                    __log__.error(f"Error processing filter {filter_id}: {e}")
-                    continue
-            
-            #send admin telegram notification
-            admin_heartbeat.send_heartbeat()
+                # Hunt flats for this filter
+                error = launch_flat_hunt_for_user(user_config, user_id, filter_id, supabase_client)
 
-            # Sleep before next cycle
-            sleep_time = base_config.get("loop", dict()).get("sleeping_time", 60 * 10)
-            __log__.info(f"Completed cycle {counter}, sleeping for {sleep_time} seconds")
-            time.sleep(sleep_time)
+            except Exception as e:
+                __log__.error(f"Error processing filter {filter_id}: {e}")
+                error = str(e)
+            finally:
+                scheduler.reschedule(scheduled)
+                if cycle_reporter:
+                    cycle_reporter.record_run(
+                        filter_id, user_id, started, time.time() - started, scheduled.last_run - scheduled.due, error
+                    )
 
     except KeyboardInterrupt:
         __log__.info("Received interrupt signal, stopping...")
     except Exception as e:
         __log__.error(f"Error in multi-user flat hunting: {e}")
     finally:
+        if worker_lease:
+            worker_lease.release()
+        if cycle_reporter:
+            cycle_reporter.close()
+        if profiler:
+            profiler.stop()
+            profiler.write(profile_settings.get("path", "profiles"))
+        OutboxDispatcher.shutdown_shared(timeout=60)
+        TelegramDeliveryQueue.shutdown_shared(timeout=60)
+        ParsePool.shutdown_shared()
+        MetricsServer.shutdown_shared()
         user_manager.close()
         supabase_client.close()
 
@@ -226,12 +450,49 @@ def main():
         help="Config file to use. If not set, try to use '%s/config.yaml' "
         % os.path.dirname(os.path.abspath(__file__)),
     )
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument(
+        "--record-responses",
+        metavar="DIR",
+        help="Archive every page fetched by the crawlers in DIR, for later replay",
+    )
+    archive_group.add_argument(
+        "--replay-responses",
+        metavar="DIR",
+        help="Serve crawler pages from the archive in DIR instead of the network",
+    )
+    parser.add_argument(
+        "--profile-cycles",
+        type=int,
+        metavar="N",
+        help="Profile the first N cycles with a sampling profiler and write flamegraph input per stage",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default="profiles",
+        metavar="DIR",
+        help="Directory for the profiles written with --profile-cycles (default: profiles)",
+    )
+    parser.add_argument(
+        "--replay-failed",
+        action="store_true",
+        help="Queue notifications that previously failed to send for another delivery attempt",
+    )
     args = parser.parse_args()
 
     # load config
     config_handle = args.config
     config = Config(config_handle.name)
 
+    if args.record_responses:
+        config = config.overlay({"archive": {"path": args.record_responses, "mode": ResponseArchive.MODE_RECORD}})
+    elif args.replay_responses:
+        config = config.overlay({"archive": {"path": args.replay_responses, "mode": ResponseArchive.MODE_REPLAY}})
+
+    if args.profile_cycles:
+        config = config.overlay({"profiling": dict(config.get("profiling") or {}, cycles=args.profile_cycles,
+                                                   path=args.profile_dir)})
+
     # check config
     notifiers = config.get("notifiers", list())
     if "mattermost" in notifiers and not config.get("mattermost", dict()).get("webhook_url"):
@@ -247,6 +508,14 @@ def main():
         __log__.error("No Supabase database configuration found. Multi-user mode requires database access.")
         return
 
+    if args.replay_failed:
+        if not config.get("telegram", dict()).get("outbox"):
+            __log__.error("No Telegram outbox configured, there are no failed notifications to replay")
+            return
+        outbox = Outbox(outbox_path(config))
+        __log__.info("Queued %d failed notifications for replay", outbox.requeue_failed())
+        outbox.close()
+
     # adjust log level, if required
     if config.get("verbose"):
         __log__.setLevel(logging.DEBUG)
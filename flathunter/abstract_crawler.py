@@ -1,21 +1,32 @@
-"""Interface for webcrawlers. Crawler implementations should subclass this"""
+"""Interface for webcrawlers. Crawler implementations should subclass this.
+
+Selenium, BeautifulSoup and random_user_agent are slow to import (random_user_agent
+loads its whole user agent database), so they are only imported on first use."""
 import re
+import copy
 import urllib
 import json
 import logging
 import requests
-import selenium
 from time import sleep as sleep
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium import webdriver
-from bs4 import BeautifulSoup
-from random_user_agent.user_agent import UserAgent
-from random_user_agent.params import HardwareType, Popularity
 from flathunter import proxies
+from flathunter.metrics import REGISTRY
+from flathunter.parse_pool import ParsePool
+from flathunter.response_archive import ResponseArchive
+
+
+PAGE_FETCHES = REGISTRY.counter("flathunt_page_fetches_total", "Pages fetched from the network", ["crawler"])
+PAGE_FETCH_ERRORS = REGISTRY.counter(
+    "flathunt_page_fetch_errors_total", "Page fetches that raised an error or returned no content", ["crawler"]
+)
+PAGE_FETCH_SECONDS = REGISTRY.histogram("flathunt_page_fetch_seconds", "Time spent fetching a page", ["crawler"])
+
+
+def make_soup(markup):
+    """Parse HTML into a BeautifulSoup object"""
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(markup, "html.parser")
 
 
 class Crawler:
@@ -27,16 +38,23 @@ class Crawler:
     def __init__(self, config):
         self.config = config
 
-    user_agent_rotator = UserAgent(
-        popularity=[Popularity.COMMON._value_], hardware_types=[HardwareType.COMPUTER._value_]
-    )
+    def bind(self, config):
+        """Return a shallow copy of this crawler that reads settings from another
+        config. Expensive state such as a Selenium driver is shared with the original"""
+        bound = copy.copy(self)
+        bound.config = config
+        return bound
+
+    _user_agent_rotator = None
 
     HEADERS = {
         "Connection": "keep-alive",
         "Pragma": "no-cache",
         "Cache-Control": "no-cache",
         "Upgrade-Insecure-Requests": "1",
-        "User-Agent": user_agent_rotator.get_random_user_agent(),
+        # Replaced by a random user agent before the first request
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
         "Accept": "text/html,application/xhtml+xml,application/xml;"
         "q=0.9,image/webp,image/apng,*/*;q=0.8,"
         "application/signed-exchange;v=b3;q=0.9",
@@ -47,7 +65,22 @@ class Crawler:
         "Accept-Language": "en-US,en;q=0.9",
     }
 
+    @staticmethod
+    def user_agent_rotator():
+        """Return the shared random user agent generator, creating it on first use"""
+        if Crawler._user_agent_rotator is None:
+            from random_user_agent.user_agent import UserAgent
+            from random_user_agent.params import HardwareType, Popularity
+
+            Crawler._user_agent_rotator = UserAgent(
+                popularity=[Popularity.COMMON._value_], hardware_types=[HardwareType.COMPUTER._value_]
+            )
+        return Crawler._user_agent_rotator
+
     def configure_driver(self, driver_path, driver_arguments):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
         chrome_options = Options()
         if driver_arguments is not None:
             for driver_argument in driver_arguments:
@@ -59,23 +92,75 @@ class Crawler:
 
     def rotate_user_agent(self):
         """Choose a new random user agent"""
-        self.HEADERS["User-Agent"] = self.user_agent_rotator.get_random_user_agent()
+        self.HEADERS["User-Agent"] = self.user_agent_rotator().get_random_user_agent()
 
     # pylint: disable=unused-argument
     def get_page(self, search_url, driver=None, page_no=None):
         """Applies a page number to a formatted search URL and fetches the exposes at that page"""
 
-        return self.get_soup_from_url(search_url)
+        return make_soup(self.fetch_page_markup(search_url, driver, page_no))
+
+    def fetch_page_markup(self, search_url, driver=None, page_no=None):
+        """Fetches the raw HTML of a page of search results, recording it in or
+        replaying it from the response archive if one is configured"""
+
+        return self.archived(search_url, lambda: self.get_page_markup(search_url, driver, page_no))
+
+    # pylint: disable=unused-argument
+    def get_page_markup(self, search_url, driver=None, page_no=None):
+        """Fetches the raw HTML of a page of search results, without parsing it"""
+
+        return self.get_markup_from_url(search_url)
 
     def get_soup_from_url(self, url, driver=None, captcha_api_key=None, checkbox=None, afterlogin_string=None):
         """Creates a Soup object from the HTML at the provided URL"""
 
+        return make_soup(
+            self.archived(
+                url,
+                lambda: self.get_markup_from_url(
+                    url,
+                    driver=driver,
+                    captcha_api_key=captcha_api_key,
+                    checkbox=checkbox,
+                    afterlogin_string=afterlogin_string,
+                ),
+            )
+        )
+
+    def archived(self, url, fetch):
+        """Calls `fetch` to load the HTML at a URL, unless a response archive is configured,
+        which then records the response or replays it without touching the network"""
+
+        archive = ResponseArchive.for_config(self.config)
+        if archive is None:
+            return self.measured(fetch)
+        return archive.fetch(url, lambda: self.measured(fetch))
+
+    def measured(self, fetch):
+        """Calls `fetch`, counting and timing it in the page fetch metrics"""
+
+        crawler = self.get_name()
+        PAGE_FETCHES.inc(crawler=crawler)
+        try:
+            with PAGE_FETCH_SECONDS.time(crawler=crawler):
+                markup = fetch()
+        except Exception:
+            PAGE_FETCH_ERRORS.inc(crawler=crawler)
+            raise
+        if not markup:
+            PAGE_FETCH_ERRORS.inc(crawler=crawler)
+        return markup
+
+    def get_markup_from_url(self, url, driver=None, captcha_api_key=None, checkbox=None, afterlogin_string=None):
+        """Fetches the HTML at the provided URL"""
+
         self.rotate_user_agent()
         resp = requests.get(url, headers=self.HEADERS, timeout=1)
         if resp.status_code != 200 and resp.status_code != 405:
             self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
         if self.config.use_proxy():
-            return self.get_soup_with_proxy(url)
+            return self.get_markup_with_proxy(url)
         if driver is not None:
             driver.get(url)
             if re.search("initGeetest", driver.page_source):
@@ -83,11 +168,15 @@ class Crawler:
             elif re.search("g-recaptcha", driver.page_source):
                 self.resolvecaptcha(driver, checkbox, afterlogin_string, captcha_api_key)
 
-            return BeautifulSoup(driver.page_source, "html.parser")
-        return BeautifulSoup(resp.content, "html.parser")
+            return driver.page_source
+        return resp.content
 
     def get_soup_with_proxy(self, url):
         """Will try proxies until it's possible to crawl and return a soup"""
+        return make_soup(self.get_markup_with_proxy(url))
+
+    def get_markup_with_proxy(self, url):
+        """Will try proxies until it's possible to crawl and return the HTML"""
         resolved = False
         resp = None
 
@@ -123,7 +212,7 @@ class Crawler:
         if not resp:
             raise Exception("An error occurred while fetching proxies or content")
 
-        return BeautifulSoup(resp.content, "html.parser")
+        return resp.content
 
     # pylint: disable=no-self-use
     def extract_data(self, soup):
@@ -135,29 +224,50 @@ class Crawler:
         """Loads the exposes from the site, starting at the provided URL"""
         self.__log__.debug("Got search URL %s", search_url)
 
-        # load first page
-        soup = self.get_page(search_url)
-
-        # get data from first page
-        entries = self.extract_data(soup)
+        # load and parse first page, in a worker process if a parse pool is configured
+        parse_pool = ParsePool.for_config(self.config)
+        if parse_pool is not None:
+            entries = parse_pool.extract(self, self.fetch_page_markup(search_url))
+        else:
+            entries = self.extract_data(self.get_page(search_url))
         self.__log__.debug("Number of found entries: %d", len(entries))
 
         return entries
 
+    def iter_results(self, search_url, max_pages=None):
+        """Yields the exposes from the site page by page, starting at the provided URL.
+        Crawlers that load several pages override this, so that only one page of
+        exposes is held in memory at a time"""
+        yield from self.get_results(search_url, max_pages)
+
     def crawl(self, url, max_pages=None):
-        """Load as many exposes as possible from the provided URL"""
+        """Load as many exposes as possible from the provided URL. Exposes are yielded
+        as each page is loaded, and pages are only loaded as the exposes are consumed"""
         if re.search(self.URL_PATTERN, url):
             try:
-                return self.get_results(url, max_pages)
+                yield from self.iter_results(url, max_pages)
             except requests.exceptions.ConnectionError:
                 self.__log__.warning("Connection to %s failed. Retrying.", url.split("/")[2])
-                return []
-        return []
 
     def get_name(self):
         """Returns the name of this crawler"""
         return type(self).__name__
 
+    @classmethod
+    def url_host(cls):
+        """Returns the host matched by URL_PATTERN, or None if the pattern
+        is not a plain URL prefix"""
+        if cls.URL_PATTERN is None:
+            return None
+        pattern = getattr(cls.URL_PATTERN, "pattern", cls.URL_PATTERN)
+        if re.search(r"[\[\](){}*+?|^$.]", re.sub(r"\\.", "", pattern)):
+            return None
+        return urllib.parse.urlparse(re.sub(r"\\(.)", r"\1", pattern)).netloc.lower() or None
+
+    def loads_expose_details(self):
+        """True if the crawler implements get_expose_details"""
+        return type(self).get_expose_details is not Crawler.get_expose_details
+
     def get_expose_details(self, expose):
         """Loads additional detalis for an expose. Should be implemented in the subclass"""
         return expose
@@ -241,6 +351,11 @@ class Crawler:
         driver.switch_to.default_content()
 
     def _wait_for_captcha_resolution(self, driver, checkbox: bool, afterlogin_string=""):
+        import selenium.common.exceptions
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.wait import WebDriverWait
+
         if checkbox:
             try:
                 element = WebDriverWait(driver, 120).until(
@@ -255,7 +370,12 @@ class Crawler:
             except selenium.common.exceptions.TimeoutException:
                 print("Selenium.Timeoutexception")
 
-    def _check_if_iframe_visible(self, driver: selenium.webdriver.Chrome):
+    def _check_if_iframe_visible(self, driver: "selenium.webdriver.Chrome"):
+        from selenium.common.exceptions import NoSuchElementException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.wait import WebDriverWait
+
         try:
             iframe = WebDriverWait(driver, 10).until(
                 EC.visibility_of_element_located(
@@ -266,7 +386,12 @@ class Crawler:
         except NoSuchElementException:
             print("No iframe found, therefore no chaptcha verification necessary")
 
-    def _check_if_iframe_not_visible(self, driver: selenium.webdriver.Chrome):
+    def _check_if_iframe_not_visible(self, driver: "selenium.webdriver.Chrome"):
+        from selenium.common.exceptions import NoSuchElementException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.wait import WebDriverWait
+
         try:
             iframe = WebDriverWait(driver, 10).until(
                 EC.invisibility_of_element(
@@ -8,6 +8,16 @@ class Processor:
     def process_expose(self, expose):
         """Mutate the expose. Should be implemented in the subclass"""
 
+    def process_batch(self, exposes):
+        """Process a list of exposes and return the resulting list. Subclasses
+        that can issue one bulk call per batch should override this; the default
+        falls back to processing one expose at a time"""
+        return [self.process_expose(expose) for expose in exposes]
+
     def process_exposes(self, exposes):
         """Apply the processor to every expose in the sequence"""
         return map(self.process_expose, exposes)
+
+    def supports_batching(self):
+        """True if the subclass provides its own process_batch implementation"""
+        return type(self).process_batch is not Processor.process_batch
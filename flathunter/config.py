@@ -1,6 +1,9 @@
 """Wrap configuration options as an object"""
 import os
+import re
 import logging
+from collections import ChainMap
+from urllib.parse import urlparse
 import yaml
 
 from flathunter.crawl_ebaykleinanzeigen import CrawlEbayKleinanzeigen
@@ -27,15 +30,20 @@ class Config:
             self.__log__.info("Using config %s", filename)
             with open(filename) as file:
                 self.config = yaml.safe_load(file)
-        self.__searchers__ = [
-            CrawlImmobilienscout(self),
-            CrawlWgGesucht(self),
-            CrawlEbayKleinanzeigen(self),
-            CrawlImmowelt(self),
-            CrawlSubito(self),
-            CrawlImmobiliare(self),
-            CrawlIdealista(self),
-        ]
+        self.parent = None
+        self.__searchers__ = None
+        self.__dispatch__ = None
+
+    def overlay(self, overrides):
+        """Return a config that reads the keys in `overrides` first and falls back to
+        this config for everything else. Nothing is copied or re-parsed, and the search
+        plugins of this config are shared with the overlay"""
+        config = Config.__new__(Config)
+        config.config = ChainMap(overrides, self.config)
+        config.parent = self
+        config.__searchers__ = None
+        config.__dispatch__ = None
+        return config
 
     def __iter__(self):
         """Emulate dictionary"""
@@ -58,11 +66,58 @@ class Config:
     def set_searchers(self, searchers):
         """Update the active search plugins"""
         self.__searchers__ = searchers
+        self.__dispatch__ = None
 
     def searchers(self):
-        """Get the list of search plugins"""
+        """Get the list of search plugins. Plugins are created on first use; overlays
+        use lightweight copies of their parent's plugins bound to the overlay"""
+        if self.__searchers__ is None:
+            if self.parent is not None:
+                self.__searchers__ = [searcher.bind(self) for searcher in self.parent.searchers()]
+            else:
+                self.__searchers__ = [
+                    CrawlImmobilienscout(self),
+                    CrawlWgGesucht(self),
+                    CrawlEbayKleinanzeigen(self),
+                    CrawlImmowelt(self),
+                    CrawlSubito(self),
+                    CrawlImmobiliare(self),
+                    CrawlIdealista(self),
+                ]
         return self.__searchers__
 
+    def searchers_for_url(self, url):
+        """Get the search plugins responsible for a URL. Candidates are looked up
+        by host, so only their URL patterns need to be checked"""
+        if self.__dispatch__ is None:
+            self.__dispatch__ = self.build_dispatch_index()
+        index, fallback = self.__dispatch__
+        candidates = index.get(urlparse(url).netloc.lower(), fallback)
+        return [searcher for searcher in candidates if re.search(searcher.URL_PATTERN, url)]
+
+    def build_dispatch_index(self):
+        """Map each host to the search plugins handling it. Plugins whose URL pattern
+        does not name a single host are checked for every URL"""
+        if self.parent is not None:
+            # Reuse the parent's index, swapping in the plugins bound to this config
+            if self.parent.__dispatch__ is None:
+                self.parent.__dispatch__ = self.parent.build_dispatch_index()
+            bound = dict(zip(map(id, self.parent.searchers()), self.searchers()))
+            index, fallback = self.parent.__dispatch__
+            return (
+                {host: [bound[id(searcher)] for searcher in searchers] for (host, searchers) in index.items()},
+                [bound[id(searcher)] for searcher in fallback],
+            )
+        index = {}
+        fallback = []
+        for searcher in self.searchers():
+            host = searcher.url_host()
+            if host is None:
+                fallback.append(searcher)
+            else:
+                index.setdefault(host, []).append(searcher)
+        return {host: searchers + fallback for (host, searchers) in index.items()}, fallback
+
     def get_filter(self):
         """Read the configured filter"""
         builder = Filter.builder()
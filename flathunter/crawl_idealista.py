@@ -3,10 +3,8 @@ import logging
 import re
 
 import requests
-from bs4 import BeautifulSoup
 from flathunter.abstract_crawler import Crawler
-from random_user_agent.user_agent import UserAgent
-from flathunter.oxylab_client import PushPullScraperAPIsClient
+from flathunter.oxylab_client import SCRAPER_API_REQUESTS, PushPullScraperAPIsClient
 
 
 class CrawlIdealista(Crawler):
@@ -25,19 +23,19 @@ class CrawlIdealista(Crawler):
             # self.capthca_scraper_api_key = capthca_scraper_api.get('api_key', '')
 
     # pylint: disable=unused-argument
-    def get_page(self, search_url, driver=None, page_no=None):
-        """Applies a page number to a formatted search URL and fetches the exposes at that page"""
+    def get_page_markup(self, search_url, driver=None, page_no=None):
+        """Fetches the raw HTML of a page of search results, without parsing it"""
 
         if self.config.use_proxy():
-            return self.get_soup_with_proxy(search_url)
+            return self.get_markup_with_proxy(search_url)
 
-        return self.get_soup_from_url(
+        return self.get_markup_from_url(
             search_url,
             capthca_scraper_api_user=self.scraper_api_key_user,
             capthca_scraper_api_password=self.scraper_api_password,
         )
 
-    def get_soup_from_url(
+    def get_markup_from_url(
         self,
         url,
         driver=None,
@@ -56,10 +54,10 @@ class CrawlIdealista(Crawler):
                 # Use the existing job ID to fetch results
                 oxylabs_client = PushPullScraperAPIsClient(self.scraper_api_key_user, self.scraper_api_password)
                 job_result = oxylabs_client.wait_for_and_get_job_results(job_id)
-                return BeautifulSoup(job_result["results"][0]["content"], "html.parser")
+                return job_result["results"][0]["content"]
             else:
                 # If no job ID is available, fall back to direct fetching
-                return self.get_soup_from_url_direct_fetching(
+                return self.get_markup_from_url_direct_fetching(
                     url,
                     capthca_scraper_api_user=capthca_scraper_api_user,
                     capthca_scraper_api_password=capthca_scraper_api_password,
@@ -67,9 +65,9 @@ class CrawlIdealista(Crawler):
 
         except Exception as e:
             self.__log__.exception("Failed to fetch or parse content from URL: %s", url)
-            return BeautifulSoup("", "html.parser")  # Safe fallback
+            return ""  # Safe fallback
 
-    def get_soup_from_url_direct_fetching(
+    def get_markup_from_url_direct_fetching(
         self,
         url,
         driver=None,
@@ -79,7 +77,7 @@ class CrawlIdealista(Crawler):
         checkbox=None,
         afterlogin_string=None,
     ):
-        """Creates a Soup object from the HTML at the provided URL"""
+        """Fetches the HTML at the provided URL through the Oxylabs realtime API"""
 
         # Structure payload.
         payload = {"url": url, "render": ""}
@@ -90,7 +88,9 @@ class CrawlIdealista(Crawler):
                 auth=(capthca_scraper_api_user, capthca_scraper_api_password),
                 json=payload,
             )
+            SCRAPER_API_REQUESTS.inc(api="realtime", method="POST", outcome="ok" if resp.ok else "error")
             resp.raise_for_status()
+            PushPullScraperAPIsClient.record_result("realtime")
 
             data = resp.json()
             results = data.get("results", [])
@@ -104,13 +104,13 @@ class CrawlIdealista(Crawler):
 
             if status_code not in [200] or not content:
                 self.__log__.error("Unexpected response (%s)", status_code)
-                return BeautifulSoup("", "html.parser")  # Safe fallback
+                return ""  # Safe fallback
 
-            return BeautifulSoup(content, "html.parser")
+            return content
 
         except Exception as e:
             self.__log__.exception("Failed to fetch or parse content from URL: %s", url)
-            return BeautifulSoup("", "html.parser")  # Safe fallback
+            return ""  # Safe fallback
 
     # pylint: disable=too-many-locals
     def extract_data(self, soup):
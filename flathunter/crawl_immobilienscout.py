@@ -5,8 +5,6 @@ import datetime
 import json
 
 from flathunter.abstract_crawler import Crawler
-from selenium.common.exceptions import JavascriptException
-from jsonpath_ng import jsonpath, parse
 
 
 class CrawlImmobilienscout(Crawler):
@@ -45,6 +43,10 @@ class CrawlImmobilienscout(Crawler):
 
     def get_results(self, search_url, max_pages=None):
         """Loads the exposes from the ImmoScout site, starting at the provided URL"""
+        return list(self.iter_results(search_url, max_pages))
+
+    def iter_results(self, search_url, max_pages=None):
+        """Yields the exposes from the ImmoScout site page by page, starting at the provided URL"""
         # convert to paged URL
         # if '/P-' in search_url:
         #     search_url = re.sub(r"/Suche/(.+?)/P-\d+", "/Suche/\1/P-{0}", search_url)
@@ -62,7 +64,8 @@ class CrawlImmobilienscout(Crawler):
 
         # If we are using Selenium, just parse the results from the JSON in the page response
         if self.driver is not None:
-            return self.get_entries_from_javascript()
+            yield from self.get_entries_from_javascript()
+            return
 
         try:
             no_of_results = int(
@@ -75,20 +78,24 @@ class CrawlImmobilienscout(Crawler):
             no_of_results = 0
 
         # get data from first page
-        entries = self.extract_data(soup)
+        cur_entry = self.extract_data(soup)
+        found = len(cur_entry)
+        yield from cur_entry
 
         # iterate over all remaining pages
-        while len(entries) < min(no_of_results, self.RESULT_LIMIT) and (max_pages is None or page_no < max_pages):
-            self.__log__.debug("Next Page, Number of entries : %d, no of results: %d", len(entries), no_of_results)
+        while found < min(no_of_results, self.RESULT_LIMIT) and (max_pages is None or page_no < max_pages):
+            self.__log__.debug("Next Page, Number of entries : %d, no of results: %d", found, no_of_results)
             page_no += 1
             soup = self.get_page(search_url, self.driver, page_no)
             cur_entry = self.extract_data(soup)
             if cur_entry is list():
                 break
-            entries.extend(cur_entry)
-        return entries
+            found += len(cur_entry)
+            yield from cur_entry
 
     def get_entries_from_javascript(self):
+        from selenium.common.exceptions import JavascriptException
+
         try:
             result_json = self.driver.execute_script("return window.IS24.resultList;")
         except JavascriptException:
@@ -97,10 +104,14 @@ class CrawlImmobilienscout(Crawler):
         return self.get_entries_from_json(result_json)
 
     def get_entries_from_json(self, json):
+        from jsonpath_ng import parse
+
         jsonpath_expr = parse("$..['resultlist.realEstate']")
         return [self.extract_entry_from_javascript(entry.value) for entry in jsonpath_expr.find(json)]
 
     def extract_entry_from_javascript(self, entry):
+        from jsonpath_ng import parse
+
         image_path = parse("$..galleryAttachments..['@xlink.href']")
         return {
             "id": int(entry["@id"]),
@@ -2,8 +2,6 @@
 import logging
 import re
 import requests
-from bs4 import BeautifulSoup
-
 from flathunter.abstract_crawler import Crawler
 from flathunter.string_utils import remove_prefix
 
@@ -80,9 +78,9 @@ class CrawlWgGesucht(Crawler):
         )
         return address
 
-    def get_soup_from_url(self, url, driver=None, captcha_api_key=None, checkbox=None, afterlogin_string=None):
+    def get_markup_from_url(self, url, driver=None, captcha_api_key=None, checkbox=None, afterlogin_string=None):
         """
-        Creates a Soup object from the HTML at the provided URL
+        Fetches the HTML at the provided URL
 
         Overwrites the method inherited from abstract_crawler. This is
         necessary as we need to reload the page once for all filters to
@@ -98,10 +96,10 @@ class CrawlWgGesucht(Crawler):
         if resp.status_code != 200:
             self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
         if self.config.use_proxy():
-            return self.get_soup_with_proxy(url)
+            return self.get_markup_with_proxy(url)
         if driver is not None:
             driver.get(url)
             if re.search("g-recaptcha", driver.page_source):
                 self.resolvecaptcha(driver, checkbox, afterlogin_string, captcha_api_key)
-            return BeautifulSoup(driver.page_source, "html.parser")
-        return BeautifulSoup(resp.content, "html.parser")
+            return driver.page_source
+        return resp.content
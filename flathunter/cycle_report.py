@@ -0,0 +1,192 @@
+"""Structured reports of the multi-user hunting loop. Every refresh cycle is
+   written as one JSON line listing the filter runs of the cycle: how long each
+   run took, how late it started, how much of it was spent crawling, in the
+   database and sending notifications, how many listings were parsed and how
+   many were new. The command line aggregates the reports per filter:
+
+   python -m flathunter.cycle_report cycles.jsonl --sort seconds --top 20"""
+import argparse
+import json
+import logging
+import math
+import threading
+import time
+
+from flathunter.stage_metrics import StageMetrics
+
+
+class CycleReporter:
+    """Collects the filter runs of the current cycle, with the stage metrics of
+    their processor chains, and appends a record per cycle to a JSON lines file"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    # Stages of the processor chain, by what they spend their time on
+    STAGE_KINDS = {
+        "crawl": "fetch",
+        "SaveAllExposesProcessor": "db",
+        "MarkAsProcessedProcessor": "db",
+        "SenderTelegram": "send",
+        "SenderMattermost": "send",
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.cycle = None
+        self.started = None
+        self.runs = []
+        self.stages = {}
+        StageMetrics.add_sink(self.collect_stages)
+
+    @classmethod
+    def for_config(cls, config):
+        """Return a reporter if a report file is set in the reporting section, otherwise None"""
+        settings = config.get("reporting") or dict()
+        if not settings.get("cycle_report"):
+            return None
+        return cls(settings["cycle_report"])
+
+    def collect_stages(self, record):
+        """Stage metrics sink: keep the stages of a run until the run is recorded"""
+        if record.get("filter_id") is not None:
+            with self.lock:
+                self.stages[str(record["filter_id"])] = record["stages"]
+
+    def start_cycle(self, cycle):
+        """Begin collecting the runs of a new cycle"""
+        self.cycle = cycle
+        self.started = time.time()
+        self.runs = []
+
+    def record_run(self, filter_id, user_id, started, seconds, lag, error=None):
+        """Add a filter run to the current cycle"""
+        with self.lock:
+            stages = self.stages.pop(str(filter_id), [])
+        run = {
+            "filter_id": str(filter_id),
+            "user_id": user_id,
+            "started_at": round(started, 3),
+            "seconds": round(seconds, 6),
+            "lag": round(lag, 3),
+            "fetch_seconds": 0.0,
+            "db_seconds": 0.0,
+            "send_seconds": 0.0,
+            "listings": 0,
+            "new_listings": 0,
+            "errors": int(error is not None),
+            "error": error,
+        }
+        for stage in stages:
+            kind = self.STAGE_KINDS.get(stage["stage"].split("#")[0])
+            if kind is not None:
+                run[kind + "_seconds"] = round(run[kind + "_seconds"] + stage["seconds"], 6)
+            run["errors"] += stage["errors"]
+        if stages:
+            # Parsed listings leave the crawl; new ones are those passing the already-seen filter
+            new_listings = [stage["items_out"] for stage in stages if stage["stage"] == "Filter"]
+            run["listings"] = stages[0]["items_out"]
+            run["new_listings"] = new_listings[0] if new_listings else stages[-1]["items_out"]
+        self.runs.append(run)
+
+    def finish_cycle(self):
+        """Write the record of the current cycle, if it had any runs"""
+        if self.cycle is None or not self.runs:
+            return None
+        record = {
+            "cycle": self.cycle,
+            "started_at": round(self.started, 3),
+            "seconds": round(time.time() - self.started, 3),
+            "runs": self.runs,
+        }
+        try:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record, sort_keys=True) + "\n")
+        except OSError as e:
+            self.__log__.error("Failed to write cycle report: %s", e)
+        self.runs = []
+        return record
+
+    def close(self):
+        """Write the current cycle and stop collecting stage metrics"""
+        self.finish_cycle()
+        StageMetrics.remove_sink(self.collect_stages)
+
+
+def read_reports(paths):
+    """Yield the cycle records of the given report files"""
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def aggregate(records):
+    """Summarise the runs of every filter over the given cycle records"""
+    runs_by_filter = {}
+    for record in records:
+        for run in record["runs"]:
+            runs_by_filter.setdefault(run["filter_id"], []).append(run)
+    summary = []
+    for (filter_id, runs) in runs_by_filter.items():
+        seconds = [run["seconds"] for run in runs]
+        summary.append({
+            "filter_id": filter_id,
+            "runs": len(runs),
+            "seconds": sum(seconds) / len(runs),
+            "p95_seconds": percentile(seconds, 0.95),
+            "max_seconds": max(seconds),
+            "fetch_seconds": sum(run["fetch_seconds"] for run in runs) / len(runs),
+            "db_seconds": sum(run["db_seconds"] for run in runs) / len(runs),
+            "send_seconds": sum(run["send_seconds"] for run in runs) / len(runs),
+            "lag": sum(run["lag"] for run in runs) / len(runs),
+            "listings": sum(run["listings"] for run in runs),
+            "new_listings": sum(run["new_listings"] for run in runs),
+            "errors": sum(run["errors"] for run in runs),
+        })
+    return summary
+
+
+def format_summary(summary):
+    """Format the per-filter summary as a table"""
+    columns = ["filter_id", "runs", "seconds", "p95_seconds", "max_seconds", "fetch_seconds", "db_seconds",
+               "send_seconds", "lag", "listings", "new_listings", "errors"]
+    lines = [" ".join("%12s" % column[:12] for column in columns)]
+    for row in summary:
+        lines.append(" ".join(
+            "%12.3f" % row[column] if isinstance(row[column], float) else "%12s" % row[column] for column in columns
+        ))
+    return "\n".join(lines)
+
+
+def main():
+    """Aggregate cycle reports from the command line"""
+    parser = argparse.ArgumentParser(description="Summarise the cycle reports of flathunt per filter")
+    parser.add_argument("reports", nargs="+", help="Cycle report files (JSON lines)")
+    parser.add_argument("--sort", default="seconds",
+                        choices=["seconds", "p95_seconds", "max_seconds", "fetch_seconds", "db_seconds",
+                                 "send_seconds", "lag", "listings", "new_listings", "errors", "runs"],
+                        help="Column to sort by, descending")
+    parser.add_argument("--top", type=int, help="Only show the first N filters")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    records = list(read_reports(args.reports))
+    summary = sorted(aggregate(records), key=lambda row: row[args.sort], reverse=True)[:args.top]
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    runs = sum(len(record["runs"]) for record in records)
+    print("%d cycles, %d filter runs, %d filters" % (len(records), runs, len(summary)))
+    print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 """Built-in expose processor implementations. Used by the processor pipelines
    in flathunter and in the webservice"""
-import re
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
 from flathunter.abstract_processor import Processor
 
 
@@ -28,27 +32,74 @@ class AddressResolver(Processor):
         """Fetches the expose from the expose URL and extracts the address"""
         if expose["address"].startswith("http"):
             url = expose["address"]
-            for searcher in self.config.searchers():
-                if re.search(searcher.URL_PATTERN, url):
-                    expose["address"] = searcher.load_address(url)
-                    self.__log__.debug("Loaded address %s for url %s", expose["address"], url)
-                    break
+            for searcher in self.config.searchers_for_url(url):
+                expose["address"] = searcher.load_address(url)
+                self.__log__.debug("Loaded address %s for url %s", expose["address"], url)
+                break
         return expose
 
 
 class CrawlExposeDetails(Processor):
-    """Processor to extract additional apartment details by parsing page at expose URL"""
+    """Processor to extract additional apartment details by parsing page at expose URL.
+    Detail pages of a batch are fetched concurrently, with a cap on parallel requests
+    per host, and the details are cached by expose id"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
 
     def __init__(self, config):
         self.config = config
+        settings = self.config.get("expose_details", dict()) or dict()
+        self.workers = settings.get("workers", 8)
+        self.per_host = settings.get("per_host", 2)
+        self.cache_size = settings.get("cache_size", 1000)
+        self.host_limits = {}
+        self.host_limits_lock = threading.Lock()
 
     def process_expose(self, expose):
         """Fetches the page at exposes['url'] and extracts additional details from it"""
-        for searcher in self.config.searchers():
-            if re.search(searcher.URL_PATTERN, expose["url"]):
-                expose = searcher.get_expose_details(expose)
+        key = (expose.get("crawler"), expose.get("id"))
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        if cached is not None:
+            expose.update(cached)
+            return expose
+
+        # Only crawlers that actually load details need to be considered
+        for searcher in self.config.searchers_for_url(expose["url"]):
+            if searcher.loads_expose_details():
+                before = dict(expose)
+                with self.host_limit(expose["url"]):
+                    expose = searcher.get_expose_details(expose)
+                self.remember(key, {k: v for (k, v) in expose.items() if before.get(k) != v})
         return expose
 
+    def process_batch(self, exposes):
+        """Fetch the detail pages of a batch of exposes concurrently"""
+        if len(exposes) < 2 or self.workers < 2:
+            return [self.process_expose(expose) for expose in exposes]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(exposes))) as executor:
+            return list(executor.map(self.process_expose, exposes))
+
+    def host_limit(self, url):
+        """Semaphore limiting the number of parallel requests to the host of a URL"""
+        host = urlparse(url).netloc
+        with self.host_limits_lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_limits[host]
+
+    def remember(self, key, details):
+        """Cache the details loaded for an expose"""
+        with self._cache_lock:
+            self._cache[key] = details
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
 
 class LambdaProcessor(Processor):
     """Processor to apply arbitrary logic to each expose"""
@@ -0,0 +1,86 @@
+"""Persistent cache for Google Maps travel durations, shared across users and runs"""
+import logging
+import re
+import sqlite3 as lite
+import threading
+import time
+
+
+class DurationCache:
+    """SQLite-backed LRU cache with a time-to-live for Distance Matrix results.
+    Entries are keyed on the normalised origin, destination, travel mode and
+    arrival time slot"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = lite.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS durations ("
+                "key TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "last_used REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS durations_last_used ON durations (last_used)")
+
+    @classmethod
+    def shared(cls, path, settings=None):
+        """Return the process-wide cache for the given database file"""
+        with cls._shared_lock:
+            if path not in cls._shared:
+                settings = settings or dict()
+                cls._shared[path] = cls(
+                    path,
+                    ttl=settings.get("ttl", 7 * 24 * 3600),
+                    max_entries=settings.get("max_entries", 10000),
+                )
+            return cls._shared[path]
+
+    @staticmethod
+    def normalize(location):
+        """Normalise an address so that trivially different spellings share an entry"""
+        return re.sub(r"[\s,]+", " ", location).strip().lower()
+
+    def key(self, origin, dest, mode, arrival):
+        """Build the cache key for a lookup"""
+        return "|".join([self.normalize(origin), self.normalize(dest), mode, str(arrival)])
+
+    def get(self, key):
+        """Return the cached value for a key, or None if it is missing or expired"""
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT value FROM durations WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE durations SET last_used = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries if the cache is full"""
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO durations (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            (count,) = self.connection.execute("SELECT COUNT(*) FROM durations").fetchone()
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM durations WHERE key IN "
+                    "(SELECT key FROM durations ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
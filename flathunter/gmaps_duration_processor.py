@@ -1,11 +1,13 @@
 """Calculate Google-Maps distances between specific locations and the target flat"""
 import logging
 import datetime
+import os
 import time
 import urllib
 import requests
 
 from flathunter.abstract_processor import Processor
+from flathunter.duration_cache import DurationCache
 
 
 class GMapsDurationProcessor(Processor):
@@ -15,41 +17,132 @@ class GMapsDurationProcessor(Processor):
     GM_MODE_BICYCLE = "bicycling"
     GM_MODE_DRIVING = "driving"
 
+    # Distance Matrix request limits
+    MAX_ORIGINS = 25
+    MAX_DESTINATIONS = 25
+    MAX_ELEMENTS = 100
+
     __log__ = logging.getLogger("flathunt")
 
     def __init__(self, config):
         self.config = config
+        cache_settings = self.config.get("google_maps_api", dict()).get("cache")
+        if cache_settings:
+            path = cache_settings.get("path") or os.path.join(self.config.database_location(), "gmaps_cache.db")
+            self.cache = DurationCache.shared(path, cache_settings)
+        else:
+            self.cache = None
 
     def process_expose(self, expose):
         """Calculate the durations for an expose"""
         expose["durations"] = self.get_formatted_durations(expose["address"]).strip()
         return expose
 
+    def process_batch(self, exposes):
+        """Calculate the durations for a batch of exposes, using the exposes as origins
+        of shared Distance Matrix requests"""
+        durations = self.get_formatted_durations_batch([expose["address"] for expose in exposes])
+        for expose in exposes:
+            expose["durations"] = durations[expose["address"]]
+        return exposes
+
     def get_formatted_durations(self, address):
         """Return a formatted list of GoogleMaps durations"""
-        out = ""
+        return self.get_formatted_durations_batch([address])[address]
+
+    def get_formatted_durations_batch(self, addresses):
+        """Return a formatted list of GoogleMaps durations for each of the given addresses.
+        All destinations travelled to with the same mode are requested together"""
+        targets = self.get_duration_targets()
+        addresses = list(dict.fromkeys(addresses))
+        modes = {}
+        for (_, _, dest, mode) in targets:
+            modes.setdefault(mode, [])
+            if dest not in modes[mode]:
+                modes[mode].append(dest)
+
+        distances = {}
+        for mode, destinations in modes.items():
+            distances[mode] = self.get_gmaps_distances(addresses, destinations, mode)
+
+        out = {}
+        for address in addresses:
+            lines = [
+                "> %s (%s): %s" % (name, title, distances[mode].get((address, dest)))
+                for (name, title, dest, mode) in targets
+            ]
+            out[address] = "\n".join(lines).strip()
+        return out
+
+    def get_duration_targets(self):
+        """Return the configured (name, mode title, destination, mode) combinations"""
+        targets = []
+        if "key" not in self.config.get("google_maps_api", dict()):
+            return targets
         for duration in self.config.get("durations", list()):
             if "destination" in duration and "name" in duration:
-                dest = duration.get("destination")
-                name = duration.get("name")
                 for mode in duration.get("modes", list()):
-                    if "gm_id" in mode and "title" in mode and "key" in self.config.get("google_maps_api", dict()):
-                        duration = self.get_gmaps_distance(address, dest, mode["gm_id"])
-                        out += "> %s (%s): %s\n" % (name, mode["title"], duration)
+                    if "gm_id" in mode and "title" in mode:
+                        targets.append((duration["name"], mode["title"], duration["destination"], mode["gm_id"]))
+        return targets
 
-        return out.strip()
+    @staticmethod
+    def arrival_time():
+        """Timestamp for next monday at 9:00:00 o'clock"""
+        now = datetime.datetime.today().replace(hour=9, minute=0, second=0, microsecond=0)
+        next_monday = now + datetime.timedelta(days=(7 - now.weekday()))
+        return str(int(time.mktime(next_monday.timetuple())))
 
     def get_gmaps_distance(self, address, dest, mode):
         """Get the distance"""
-        # get timestamp for next monday at 9:00:00 o'clock
-        now = datetime.datetime.today().replace(hour=9, minute=0, second=0)
-        next_monday = now + datetime.timedelta(days=(7 - now.weekday()))
-        arrival_time = str(int(time.mktime(next_monday.timetuple())))
+        return self.get_gmaps_distances([address], [dest], mode).get((address, dest))
+
+    def get_gmaps_distances(self, origins, destinations, mode):
+        """Get the distances between every origin and destination for a travel mode, as
+        a dict keyed by (origin, destination). Cached results are reused, the remaining
+        pairs are requested in as few Distance Matrix calls as possible"""
+        arrival_time = self.arrival_time()
+        distances = {}
+        missing_origins = []
+        missing_destinations = []
+        for origin in origins:
+            for dest in destinations:
+                cached = None
+                if self.cache is not None:
+                    cached = self.cache.get(self.cache.key(origin, dest, mode, arrival_time))
+                if cached is not None:
+                    distances[(origin, dest)] = cached
+                    continue
+                if origin not in missing_origins:
+                    missing_origins.append(origin)
+                if dest not in missing_destinations:
+                    missing_destinations.append(dest)
+
+        for dest_chunk in self.chunks(missing_destinations, self.MAX_DESTINATIONS):
+            origins_per_request = max(1, min(self.MAX_ORIGINS, self.MAX_ELEMENTS // len(dest_chunk)))
+            for origin_chunk in self.chunks(missing_origins, origins_per_request):
+                fetched = self.fetch_gmaps_distances(origin_chunk, dest_chunk, mode, arrival_time)
+                for (pair, distance) in fetched.items():
+                    if pair in distances:
+                        continue
+                    distances[pair] = distance
+                    if self.cache is not None and distance is not None:
+                        self.cache.put(self.cache.key(pair[0], pair[1], mode, arrival_time), distance)
+        return distances
+
+    @staticmethod
+    def chunks(items, size):
+        """Split a list into lists of at most `size` items"""
+        return [items[idx : idx + size] for idx in range(0, len(items), size)]
+
+    def fetch_gmaps_distances(self, origins, destinations, mode, arrival_time):
+        """Request the distances between all origins and destinations with a single
+        Distance Matrix call"""
 
         # decode from unicode and url encode addresses
-        address = urllib.parse.quote_plus(address.strip().encode("utf8"))
-        dest = urllib.parse.quote_plus(dest.strip().encode("utf8"))
-        self.__log__.debug("Got address: %s", address)
+        origin_param = "|".join(urllib.parse.quote_plus(origin.strip().encode("utf8")) for origin in origins)
+        dest_param = "|".join(urllib.parse.quote_plus(dest.strip().encode("utf8")) for dest in destinations)
+        self.__log__.debug("Got addresses: %s", origin_param)
 
         # get google maps config stuff
         base_url = self.config.get("google_maps_api", dict()).get("url")
@@ -65,19 +158,20 @@ class GMapsDurationProcessor(Processor):
             base_url = base_url.replace("&key={key}", "")
 
         # retrieve the result
-        url = base_url.format(dest=dest, mode=mode, origin=address, key=gm_key, arrival=arrival_time)
+        url = base_url.format(dest=dest_param, mode=mode, origin=origin_param, key=gm_key, arrival=arrival_time)
         result = requests.get(url).json()
         if result["status"] != "OK":
-            self.__log__.error("Failed retrieving distance to address %s: %s", address, result)
-            return None
+            self.__log__.error("Failed retrieving distances from addresses %s: %s", origins, result)
+            return {}
 
-        # get the fastest route
+        # rows follow the order of the origins, elements the order of the destinations
         distances = dict()
-        for row in result["rows"]:
-            for element in row["elements"]:
+        for (origin, row) in zip(origins, result["rows"]):
+            for (dest, element) in zip(destinations, row["elements"]):
                 if "status" in element and element["status"] != "OK":
-                    self.__log__.warning("For address %s we got the status message: %s", address, element["status"])
+                    self.__log__.warning("For address %s we got the status message: %s", origin, element["status"])
                     self.__log__.debug("We got this result: %s", repr(result))
+                    distances[(origin, dest)] = None
                     continue
                 self.__log__.debug(
                     "Got distance and duration: %s / %s (%i seconds)",
@@ -85,8 +179,8 @@ class GMapsDurationProcessor(Processor):
                     element["duration"]["text"],
                     element["duration"]["value"],
                 )
-                distances[element["duration"]["value"]] = "%s (%s)" % (
+                distances[(origin, dest)] = "%s (%s)" % (
                     element["duration"]["text"],
                     element["distance"]["text"],
                 )
-        return distances[min(distances.keys())] if distances else None
+        return distances
@@ -1,7 +1,7 @@
 """Providing heartbeat messages"""
 import logging
+import time
 from datetime import datetime, timedelta, timezone
-from sqlalchemy import text
 from flathunter.config import Config
 from flathunter.sender_telegram import SenderTelegram
 from flathunter.supabase_client import SupabaseClient
@@ -12,6 +12,12 @@ class Heartbeat:
 
     __log__ = logging.getLogger("flathunt")
 
+    # Time window of the "new listings" statistics
+    WINDOW = timedelta(minutes=10)
+
+    # Checkpoint while no listings have been counted
+    EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
     def __init__(self, config):
         self.config = config
         if not isinstance(self.config, Config):
@@ -22,16 +28,24 @@ class Heartbeat:
             self.notifier = SenderTelegram(config, admin_config=True)
         else:
             self.notifier = None
-        
+
         try:
             self.supabase_client = SupabaseClient(config)
         except Exception as e:
             self.__log__.error(f"Failed to initialize SupabaseClient in Heartbeat: {e}")
             self.supabase_client = None
 
+        # All-time totals, counted in full once per recount interval and kept up to
+        # date in between from the listings added since the last heartbeat
+        schedule_settings = self.config.get("loop", dict()).get("schedule") or dict()
+        self.recount_interval = schedule_settings.get("heartbeat_recount_interval", 24 * 3600)
+        self.next_recount = 0
+        self.total_listings = 0
+        self.listings_by_user = {}
+        self.checkpoint = self.EPOCH
+
     def send_heartbeat(self):
         """Send a new heartbeat message"""
-        session = None
         try:
             if not self.notifier:
                 return
@@ -42,26 +56,7 @@ class Heartbeat:
                 )
                 return
 
-            # Define the time window
-            ten_minutes_ago = datetime.now(timezone.utc) - timedelta(minutes=10)
-
-            session = self.supabase_client.get_session()
-
-            # Query for total listings
-            total_listings_query = text("SELECT COUNT(*) FROM public.listings WHERE created_at > :created_after")
-            total_listings = session.execute(total_listings_query, {'created_after': ten_minutes_ago}).scalar_one_or_none() or 0
-
-            # Query for unique users
-            unique_users_query = text("SELECT COUNT(DISTINCT user_id) FROM public.listings WHERE created_at > :created_after")
-            unique_users = session.execute(unique_users_query, {'created_after': ten_minutes_ago}).scalar_one_or_none() or 0
-
-            # Query for overall total listings
-            overall_total_listings_query = text("SELECT COUNT(*) FROM public.listings")
-            overall_total_listings = session.execute(overall_total_listings_query).scalar_one_or_none() or 0
-
-            # Query for total unique users
-            total_unique_users_query = text("SELECT COUNT(DISTINCT user_id) FROM public.listings")
-            total_unique_users = session.execute(total_unique_users_query).scalar_one_or_none() or 0
+            total_listings, unique_users, overall_total_listings, total_unique_users = self.listing_stats()
 
             message = (
                 f"Heartbeat check:\n"
@@ -73,8 +68,54 @@ class Heartbeat:
 
         except Exception as e:
             self.__log__.error(f"Failed to send heartbeat message: {e}")
-            if session:
-                session.rollback()
-        finally:
-            if session:
-                session.close()
+
+    def listing_stats(self):
+        """
+        Collect the listing statistics of the heartbeat message. Only the listings
+        created since the last heartbeat are read, with a single aggregate query;
+        the whole table is scanned only once per recount interval. The checkpoint
+        is the latest created_at seen by the database, so the application clock
+        does not decide which listings were counted already. Listings committed
+        after newer ones were counted are only picked up by the next recount.
+
+        Returns:
+            Tuple of (new listings, users with new listings, total listings, total users)
+        """
+        if time.time() >= self.next_recount:
+            self._recount()
+
+        query = (
+            "SELECT user_id, "
+            "COUNT(*) FILTER (WHERE created_at > :window_start) AS recent, "
+            "COUNT(*) FILTER (WHERE created_at > :checkpoint) AS added, "
+            "MAX(created_at) FILTER (WHERE created_at > :checkpoint) AS latest "
+            "FROM public.listings WHERE created_at > :window_start OR created_at > :checkpoint GROUP BY user_id"
+        )
+        params = {"window_start": datetime.now(timezone.utc) - self.WINDOW, "checkpoint": self.checkpoint}
+        rows = self.supabase_client.execute_select(query, params)
+
+        for row in rows:
+            if row["added"]:
+                self.total_listings += row["added"]
+                self.listings_by_user[row["user_id"]] = self.listings_by_user.get(row["user_id"], 0) + row["added"]
+        self._advance_checkpoint(rows)
+        recent = [row["recent"] for row in rows if row["recent"]]
+        return sum(recent), len(recent), self.total_listings, len(self.listings_by_user)
+
+    def _recount(self):
+        """Count all listings per user. Corrects the running totals for listings
+        committed after newer ones were counted, and for deletions"""
+        rows = self.supabase_client.execute_select(
+            "SELECT user_id, COUNT(*) AS listings, MAX(created_at) AS latest FROM public.listings GROUP BY user_id"
+        )
+        self.listings_by_user = {row["user_id"]: row["listings"] for row in rows}
+        self.total_listings = sum(self.listings_by_user.values())
+        self.checkpoint = self.EPOCH
+        self._advance_checkpoint(rows)
+        self.next_recount = time.time() + self.recount_interval
+
+    def _advance_checkpoint(self, rows):
+        """Move the checkpoint to the latest created_at of the counted listings"""
+        latest = [row["latest"] for row in rows if row["latest"] is not None]
+        if latest:
+            self.checkpoint = max(latest)
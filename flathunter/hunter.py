@@ -1,6 +1,5 @@
 """Default Flathunter implementation for the command line"""
 import logging
-from itertools import chain
 
 from flathunter.config import Config
 from flathunter.filter import Filter
@@ -20,17 +19,22 @@ class Hunter:
         self.already_seen_filter = already_seen_filter
 
     def crawl_for_exposes(self, max_pages=None):
-        """Trigger a new crawl of the configured URLs"""
-        return chain(
-            *[
-                searcher.crawl(url, max_pages)
-                for searcher in self.config.searchers()
-                for url in self.config.get("urls", list())
-            ]
-        )
+        """Trigger a new crawl of the configured URLs. Exposes are yielded page by page,
+        as the processor chain consumes them"""
+        for url in self.config.get("urls", list()):
+            for searcher in self.config.searchers_for_url(url):
+                yield from searcher.crawl(url, max_pages)
 
     def hunt_flats(self, max_pages=None):
-        """Crawl, process and filter exposes"""
+        """Crawl, process and filter exposes, and return the new ones"""
+        result = []
+        self.hunt(max_pages, result.append)
+        return result
+
+    def hunt(self, max_pages=None, on_expose=None):
+        """Crawl, process and filter exposes without keeping them: every new expose is
+        passed to `on_expose`, if given, and dropped. Memory use is bounded by a page of
+        results and the processor batches. Returns the number of new exposes"""
 
         # We build a filter set that only contains the already_seen_filter.
         # This ensures the processor chain receives the correct object type.
@@ -45,14 +49,29 @@ class Hunter:
             .save_all_exposes(self.id_watch)
             .send_messages()
             .mark_as_processed(self.id_watch)
+            .instrument(self.run_labels())
             .build()
         )
 
-        result = []
-        # We need to iterate over this list to force the evaluation of the pipeline
+        found = 0
+        # We need to iterate over the exposes to force the evaluation of the pipeline
 
-        for expose in processor_chain.process(self.crawl_for_exposes(max_pages)):
-            self.__log__.info("New offer: %s", expose["title"])
-            result.append(expose)
+        try:
+            for expose in processor_chain.process(self.crawl_for_exposes(max_pages)):
+                self.__log__.info("New offer: %s", expose["title"])
+                found += 1
+                if on_expose is not None:
+                    on_expose(expose)
+        finally:
+            if processor_chain.metrics:
+                processor_chain.metrics.report()
 
-        return result
+        return found
+
+    def run_labels(self):
+        """Identify the user and filter of a run in its stage metrics"""
+        return {
+            label: getattr(self.id_watch, label)
+            for label in ("user_id", "filter_id")
+            if getattr(self.id_watch, label, None) is not None
+        }
@@ -4,9 +4,13 @@ import sqlite3 as lite
 import datetime
 import json
 import logging
+from typing import TYPE_CHECKING
 
 from flathunter.abstract_processor import Processor
-from flathunter.supabase_client import SupabaseClient
+
+if TYPE_CHECKING:
+    # Only needed for annotations; importing it pulls in SQLAlchemy
+    from flathunter.supabase_client import SupabaseClient
 
 
 class SaveAllExposesProcessor(Processor):
@@ -21,16 +25,28 @@ class SaveAllExposesProcessor(Processor):
         self.id_watch.save_expose(expose)
         return expose
 
+    def process_batch(self, exposes):
+        """Save a batch of exposes with a single insert"""
+        self.id_watch.save_exposes(exposes)
+        return exposes
+
 
 class AlreadySeenFilter:
-    """Filter exposes that have already been processed"""
+    """Filter exposes that have already been processed, or that were let through
+    before in the same run (an expose listed on two result pages, or found by two
+    URLs of a filter, before it was marked as processed)"""
 
     def __init__(self, id_watch):
         self.id_watch = id_watch
+        self.passed = set()
 
     def is_interesting(self, expose):
         """Returns true if an expose should be kept in the pipeline"""
-        return not self.id_watch.is_processed(expose["id"], expose["crawler"])
+        key = (int(expose["id"]), expose["crawler"])
+        if key in self.passed or self.id_watch.is_processed(expose["id"], expose["crawler"]):
+            return False
+        self.passed.add(key)
+        return True
 
 
 class IdMaintainer:
@@ -38,7 +54,7 @@ class IdMaintainer:
 
     __log__ = logging.getLogger("flathunt")
 
-    def __init__(self, supabase_client: SupabaseClient, user_id: str, filter_id: str):
+    def __init__(self, supabase_client: "SupabaseClient", user_id: str, filter_id: str):
         self.supabase = supabase_client
         self.user_id = user_id
         self.filter_id = filter_id
@@ -90,6 +106,24 @@ class IdMaintainer:
         except Exception as e:
             self.__log__.error(f"Error marking expose {expose_id} as processed for user {self.user_id}: {e}")
 
+    def mark_exposes_processed(self, exposes):
+        """Mark a batch of exposes as processed with a single update statement"""
+        keys = {(int(expose["id"]), expose["crawler"]) for expose in exposes}
+        if not keys:
+            return
+        self.__log__.debug("mark_exposes_processed(%d exposes) for user %s", len(keys), self.user_id)
+        try:
+            values = ", ".join(f"({expose_id}, '{crawler}')" for (expose_id, crawler) in keys)
+            query = (
+                f"UPDATE listings SET processed = true, updated_at = now() "
+                f"WHERE (property_id, crawler) IN ({values}) "
+                f"AND user_id = '{self.user_id}' AND filter_id = '{self.filter_id}'"
+            )
+            self.supabase.execute_commit(query)
+            self.processed_ids.update(keys)
+        except Exception as e:
+            self.__log__.error(f"Error marking {len(keys)} exposes as processed for user {self.user_id}: {e}")
+
     def save_expose(self, expose):
         """Saves an expose to a database"""
         self.__log__.debug("save_expose for user %s: %s", self.user_id, expose["id"])
@@ -108,3 +142,25 @@ class IdMaintainer:
             self.supabase.execute_commit(query)
         except Exception as e:
             self.__log__.error(f"Error saving expose {expose.get('id')} for user {self.user_id}: {e}")
+
+    def save_exposes(self, exposes):
+        """Saves a batch of exposes to the database with a single multi-row insert"""
+        if not exposes:
+            return
+        self.__log__.debug("save_exposes for user %s: %d exposes", self.user_id, len(exposes))
+        try:
+            rows = []
+            for expose in exposes:
+                details = json.dumps(expose).replace("'", "''")  # Basic SQL injection prevention for JSON
+                rows.append(
+                    f"({int(expose['id'])}, '{self.user_id}', '{self.filter_id}', "
+                    f"'{expose['crawler']}', '{details}', false)"
+                )
+            query = (
+                f"INSERT INTO listings (property_id, user_id, filter_id, crawler, details, processed) "
+                f"VALUES {', '.join(rows)} "
+                f"ON CONFLICT (property_id, crawler, user_id, filter_id) DO NOTHING"
+            )
+            self.supabase.execute_commit(query)
+        except Exception as e:
+            self.__log__.error(f"Error saving {len(exposes)} exposes for user {self.user_id}: {e}")
@@ -0,0 +1,80 @@
+"""Render notification messages for exposes from the configured message template"""
+import html
+from collections import OrderedDict
+from string import Formatter
+
+
+class MessageRenderer:
+    """Renders the configured message template for exposes. The template is parsed
+    once into literal text and placeholders. Rendered messages are cached by expose
+    and the raw values of its placeholders, so the receivers of a sender, and the
+    senders sharing a template and escaping mode, reuse the same rendering"""
+
+    FIELDS = ["title", "rooms", "size", "price", "url", "address", "durations"]
+    CACHE_SIZE = 1024
+    CONVERSIONS = {"s": str, "r": repr, "a": ascii}
+
+    _renderers = {}
+
+    def __init__(self, template, escape_html=False):
+        self.template = template
+        self.escape_html = escape_html
+        self.segments = list(Formatter().parse(template))
+        self.fields = sorted({field for (_, field, _, _) in self.segments if field is not None})
+        unknown = set(self.fields) - set(self.FIELDS)
+        if unknown:
+            raise KeyError("Unknown placeholders in message template: %s" % ", ".join(sorted(unknown)))
+        self.cache = OrderedDict()
+
+    @classmethod
+    def for_config(cls, config, escape_html=False):
+        """Return the shared renderer for the message template of a config"""
+        template = config.get("message", "")
+        key = (template, escape_html)
+        if key not in cls._renderers:
+            cls._renderers[key] = cls(template, escape_html)
+        return cls._renderers[key]
+
+    def render(self, expose):
+        """Render the message for an expose"""
+        values = tuple(self.raw_value(expose, field) for field in self.fields)
+        # An expose that was re-listed or edited keeps its id, so the values are part of the key
+        key = (expose.get("crawler"), expose.get("id"), values)
+        try:
+            message = self.cache.get(key)
+        except TypeError:
+            # Unhashable values are rendered without caching
+            return self.format(self.values(expose))
+        if message is not None:
+            self.cache.move_to_end(key)
+            return message
+        message = self.format(self.values(expose))
+        self.cache[key] = message
+        if len(self.cache) > self.CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return message
+
+    def format(self, values):
+        """Fill the placeholder values into the parsed template"""
+        parts = []
+        for (literal, field, format_spec, conversion) in self.segments:
+            parts.append(literal)
+            if field is not None:
+                value = values[field]
+                if conversion:
+                    value = self.CONVERSIONS[conversion](value)
+                parts.append(format(value, format_spec or ""))
+        return "".join(parts).strip()
+
+    @staticmethod
+    def raw_value(expose, field):
+        """Value of a placeholder, before escaping"""
+        return expose.get(field, "") if field == "durations" else expose[field]
+
+    def values(self, expose):
+        """Collect the placeholder values used by the template"""
+        values = {}
+        for field in self.fields:
+            value = self.raw_value(expose, field)
+            values[field] = html.escape(str(value)) if self.escape_html else value
+        return values
@@ -0,0 +1,292 @@
+"""Process metrics in the Prometheus text format. Modules define the counters,
+   gauges and histograms they update on the shared registry; with a metrics port
+   configured, flathunt serves them over HTTP, together with a health check"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    """Escape a label value for the text format"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    """Format label names and values as {name="value",...}"""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join("%s=\"%s\"" % (name, _escape(value)) for (name, value) in pairs)
+
+
+def _format_value(value):
+    """Format a sample value, using the text format's spelling of infinity"""
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class Metric:
+    """A named metric with one value (or histogram) per combination of labels"""
+
+    TYPE = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        """The label values in declaration order"""
+        if set(labels) != set(self.label_names):
+            raise ValueError("%s expects labels %s, got %s" % (self.name, self.label_names, tuple(labels)))
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) for every sample"""
+        with self.lock:
+            return [("", key, (), value) for (key, value) in sorted(self.values.items())]
+
+    def render(self):
+        """The metric in the text exposition format"""
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s %s" % (self.name, self.TYPE)]
+        for (suffix, key, extra, value) in self.samples():
+            lines.append(
+                "%s%s%s %s" % (self.name, suffix, _format_labels(self.label_names, key, extra), _format_value(value))
+            )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    TYPE = "counter"
+
+    def inc(self, amount=1, **labels):
+        """Increase the count for the given labels"""
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Current count for the given labels"""
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+
+class Gauge(Metric):
+    """Value that can go up and down, or is read from a function when scraped"""
+
+    TYPE = "gauge"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.function = None
+
+    def set(self, value, **labels):
+        """Set the value for the given labels"""
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, function):
+        """Read the value from `function` on every scrape. The function returns a
+        number, or for labelled gauges a dict of label values tuples to numbers"""
+        self.function = function
+
+    def value(self, **labels):
+        """Current value for the given labels"""
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [("", tuple(map(str, key)), (), value) for (key, value) in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Distribution of observed values, counted in cumulative buckets"""
+
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        """Record a value for the given labels"""
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block of code, also if it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        """Number of values observed for the given labels"""
+        with self.lock:
+            counts, _ = self.values.get(self.key(labels), ([0], 0.0))
+            return sum(counts)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for (key, (counts, total)) in sorted(self.values.items()):
+                cumulative = 0
+                for (bound, count) in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append(("_bucket", key, (("le", _format_value(float(bound))),), cumulative))
+                samples.append(("_sum", key, (), total))
+                samples.append(("_count", key, (), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Collection of metrics, rendered together when scraped"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        """Add a metric; metrics are registered once, by name"""
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError("Metric %s is already registered" % metric.name)
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        """Register a new counter"""
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        """Register a new gauge"""
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        """Register a new histogram"""
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """All metrics in the text exposition format"""
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        rendered = []
+        for metric in metrics:
+            try:
+                rendered.append(metric.render() + "\n")
+            except Exception as e:
+                # A failing gauge function must not take the other metrics down with it
+                self.__log__.error("Failed to collect metric %s: %s", metric.name, e)
+        return "".join(rendered)
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    """HTTP server exposing the registry at /metrics, and the result of a health
+    check at /healthz (200 if healthy, 503 otherwise)"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, port, host="0.0.0.0", registry=REGISTRY, health=None):
+        self.registry = registry
+        self.health = health
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] == "/metrics":
+                    server.respond(self, 200, server.registry.render(), server.CONTENT_TYPE)
+                elif self.path.split("?")[0] == "/healthz":
+                    healthy, message = server.check_health()
+                    server.respond(self, 200 if healthy else 503, message + "\n", "text/plain; charset=utf-8")
+                else:
+                    server.respond(self, 404, "Not found\n", "text/plain; charset=utf-8")
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def for_config(cls, config, health=None):
+        """Start the process-wide metrics server if a port is set in the metrics
+        section, and return it; otherwise return None"""
+        settings = config.get("metrics") or dict()
+        if not settings.get("port"):
+            return None
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(settings["port"], settings.get("host", "0.0.0.0"), health=health)
+                cls.__log__.info("Serving metrics on port %d", cls._shared.port)
+            return cls._shared
+
+    @classmethod
+    def shutdown_shared(cls):
+        """Stop the process-wide metrics server, if one was started"""
+        with cls._shared_lock:
+            shared, cls._shared = cls._shared, None
+        if shared is not None:
+            shared.close()
+
+    @property
+    def port(self):
+        """Port the server listens on"""
+        return self.httpd.server_address[1]
+
+    def check_health(self):
+        """Return (healthy, message) from the health check"""
+        if self.health is None:
+            return True, "OK"
+        try:
+            return self.health()
+        except Exception as e:
+            return False, "Health check failed: %s" % e
+
+    @staticmethod
+    def respond(handler, status, body, content_type):
+        """Write a response to a request"""
+        body = body.encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def close(self):
+        """Stop serving"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
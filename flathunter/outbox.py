@@ -0,0 +1,239 @@
+"""Durable outbox for Telegram notifications. Senders write messages to a local
+   SQLite table; a background dispatcher drains it in bulk and records the
+   delivery status, so a crash or Telegram outage neither loses nor duplicates
+   notifications"""
+import json
+import logging
+import os
+import sqlite3 as lite
+import threading
+import time
+
+from flathunter.metrics import REGISTRY
+from flathunter.telegram_delivery import TelegramDeliveryQueue
+
+OUTBOX_MESSAGES = REGISTRY.gauge("flathunt_outbox_messages", "Notifications in the outbox, by status", ["status"])
+
+
+def outbox_path(config):
+    """Location of the outbox database for the given configuration"""
+    settings = config.get("telegram", dict()).get("outbox") or dict()
+    return settings.get("path") or os.path.join(config.database_location(), "outbox.db")
+
+
+class Outbox:
+    """SQLite-backed table of outbound messages and their delivery status"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = lite.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "bot_token TEXT NOT NULL, "
+                "chat_id TEXT NOT NULL, "
+                "dedup_key TEXT, "
+                "payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, "
+                "updated_at REAL NOT NULL, "
+                "UNIQUE (chat_id, dedup_key))"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, id)")
+
+    def add(self, bot_token, payload, dedup_key=None):
+        """Store a message for delivery. Messages with a dedup_key are only stored once
+        per chat; returns False if the message was already in the outbox"""
+        now = time.time()
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO outbox "
+                "(bot_token, chat_id, dedup_key, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (bot_token, str(payload["chat_id"]), dedup_key, json.dumps(payload), self.STATUS_PENDING, now, now),
+            )
+            return cursor.rowcount > 0
+
+    def claim(self, limit):
+        """Mark up to `limit` pending messages as being sent and return them
+        as (id, bot_token, payload) tuples"""
+        with self.lock, self.connection:
+            rows = self.connection.execute(
+                "SELECT id, bot_token, payload FROM outbox WHERE status = ? ORDER BY id LIMIT ?",
+                (self.STATUS_PENDING, limit),
+            ).fetchall()
+            if rows:
+                self.connection.executemany(
+                    "UPDATE outbox SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    [(self.STATUS_SENDING, time.time(), row[0]) for row in rows],
+                )
+        return [(message_id, bot_token, json.loads(payload)) for (message_id, bot_token, payload) in rows]
+
+    def mark(self, message_ids, status):
+        """Set the status of a batch of messages"""
+        if not message_ids:
+            return
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE outbox SET status = ?, updated_at = ? WHERE id = ?",
+                [(status, now, message_id) for message_id in message_ids],
+            )
+
+    def recover(self):
+        """Return messages that were in flight when the process stopped to the queue"""
+        return self._move(self.STATUS_SENDING, self.STATUS_PENDING)
+
+    def requeue_failed(self):
+        """Queue messages that previously failed for another delivery attempt"""
+        return self._move(self.STATUS_FAILED, self.STATUS_PENDING)
+
+    def prune(self, max_age):
+        """Delete delivered messages older than `max_age` seconds"""
+        with self.lock, self.connection:
+            return self.connection.execute(
+                "DELETE FROM outbox WHERE status = ? AND updated_at < ?", (self.STATUS_SENT, time.time() - max_age)
+            ).rowcount
+
+    def counts(self):
+        """Return the number of messages per status"""
+        with self.lock:
+            return dict(self.connection.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.connection.close()
+
+    def _move(self, from_status, to_status):
+        with self.lock, self.connection:
+            return self.connection.execute(
+                "UPDATE outbox SET status = ?, updated_at = ? WHERE status = ?", (to_status, time.time(), from_status)
+            ).rowcount
+
+
+class OutboxDispatcher:
+    """Background thread that drains the outbox into the Telegram delivery queue
+    and writes the delivery status back in bulk"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, outbox, delivery_queue, batch_size=100, interval=1.0, retention=7 * 24 * 3600):
+        self.outbox = outbox
+        self.delivery_queue = delivery_queue
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retention = retention
+        self.results_lock = threading.Lock()
+        self.delivered = []
+        self.failed = []
+        self.in_flight = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="outbox-dispatcher", daemon=True)
+
+    @classmethod
+    def shared(cls, path, settings=None, delivery_settings=None):
+        """Return the process-wide dispatcher, creating and starting it on first use"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                settings = settings or dict()
+                cls._shared = cls(
+                    Outbox(path),
+                    TelegramDeliveryQueue.shared(delivery_settings),
+                    batch_size=settings.get("batch_size", 100),
+                    interval=settings.get("interval", 1.0),
+                )
+                cls._shared.start()
+            return cls._shared
+
+    @classmethod
+    def shutdown_shared(cls, timeout=None):
+        """Drain and stop the process-wide dispatcher, if one was started"""
+        with cls._shared_lock:
+            shared, cls._shared = cls._shared, None
+        if shared is not None:
+            shared.stop(timeout)
+            shared.outbox.close()
+
+    def start(self):
+        """Recover messages left in flight by a previous run and start dispatching"""
+        recovered = self.outbox.recover()
+        if recovered:
+            self.__log__.info("Replaying %d notifications left in flight by a previous run", recovered)
+        self.outbox.prune(self.retention)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """Wait for queued messages to be delivered, then stop the dispatcher"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.in_flight or self.outbox.counts().get(Outbox.STATUS_PENDING):
+            if deadline is not None and time.monotonic() >= deadline:
+                self.__log__.warning("Stopping outbox dispatcher with undelivered notifications")
+                break
+            time.sleep(0.05)
+        self.stopped.set()
+        self.thread.join(max(self.interval, 1))
+        self.flush()
+
+    def run(self):
+        """Dispatcher loop"""
+        while not self.stopped.is_set():
+            try:
+                self.flush()
+                dispatched = self.dispatch()
+            except Exception as e:
+                self.__log__.error("Error dispatching notifications from outbox: %s", e)
+                dispatched = 0
+            if dispatched < self.batch_size:
+                self.stopped.wait(self.interval)
+
+    def dispatch(self):
+        """Claim a batch of pending messages and hand them to the delivery queue"""
+        messages = self.outbox.claim(self.batch_size)
+        with self.results_lock:
+            self.in_flight += len(messages)
+        for (message_id, bot_token, payload) in messages:
+            self.delivery_queue.enqueue(bot_token, payload, self.callback_for(message_id))
+        return len(messages)
+
+    def callback_for(self, message_id):
+        """Build the delivery callback for a single outbox message"""
+
+        def record(delivered):
+            with self.results_lock:
+                (self.delivered if delivered else self.failed).append(message_id)
+                self.in_flight -= 1
+
+        return record
+
+    def flush(self):
+        """Write the delivery status of finished messages back to the outbox"""
+        with self.results_lock:
+            delivered, self.delivered = self.delivered, []
+            failed, self.failed = self.failed, []
+        self.outbox.mark(delivered, Outbox.STATUS_SENT)
+        self.outbox.mark(failed, Outbox.STATUS_FAILED)
+
+
+def _outbox_counts():
+    """Message counts of the process-wide outbox, for the outbox gauge"""
+    dispatcher = OutboxDispatcher._shared
+    if dispatcher is None:
+        return {}
+    return {(status,): count for (status, count) in dispatcher.outbox.counts().items()}
+
+
+OUTBOX_MESSAGES.set_function(_outbox_counts)
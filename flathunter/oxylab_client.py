@@ -2,24 +2,51 @@ import time
 
 import requests
 
+from flathunter.metrics import REGISTRY
+
 SCRAPER_APIS_BASE_URL = "https://data.oxylabs.io/v1"
 
+SCRAPER_API_REQUESTS = REGISTRY.counter(
+    "flathunt_scraper_api_requests_total", "Requests to the Oxylabs APIs", ["api", "method", "outcome"]
+)
+SCRAPER_API_RESULTS = REGISTRY.counter(
+    "flathunt_scraper_api_results_total", "Billable results retrieved from the Oxylabs APIs", ["api"]
+)
+SCRAPER_API_SPEND = REGISTRY.counter(
+    "flathunt_scraper_api_spend_total", "Estimated Oxylabs spend, at oxylabs.cost_per_result per result", ["api"]
+)
+
 
 class PushPullScraperAPIsClient:
+    # Price of a single result, set from the oxylabs.cost_per_result setting
+    cost_per_result = 0.0
+
+    @classmethod
+    def record_result(cls, api):
+        """Count a billable result in the scraper API metrics"""
+        SCRAPER_API_RESULTS.inc(api=api)
+        SCRAPER_API_SPEND.inc(cls.cost_per_result, api=api)
+
     def __init__(self, username: str, password: str):
         self.username = username
         self.password = password
 
     def _make_request(self, method: str, url: str, payload: dict = None) -> dict:
-        response = requests.request(
-            method=method,
-            url=url,
-            auth=(self.username, self.password),
-            json=payload,
-        )
+        try:
+            response = requests.request(
+                method=method,
+                url=url,
+                auth=(self.username, self.password),
+                json=payload,
+            )
+        except requests.exceptions.RequestException:
+            SCRAPER_API_REQUESTS.inc(api="push_pull", method=method, outcome="error")
+            raise
 
         if response.status_code >= 400:
+            SCRAPER_API_REQUESTS.inc(api="push_pull", method=method, outcome="error")
             raise requests.exceptions.HTTPError(response.status_code, response.text)
+        SCRAPER_API_REQUESTS.inc(api="push_pull", method=method, outcome="ok")
 
         return response.json()
 
@@ -42,10 +69,12 @@ class PushPullScraperAPIsClient:
         return response.get("status")
 
     def get_job_results(self, job_id: int) -> dict:
-        return self._make_request(
+        results = self._make_request(
             "GET",
             f"{SCRAPER_APIS_BASE_URL}/queries/{job_id}/results",
         )
+        self.record_result("push_pull")
+        return results
 
     def wait_for_and_get_job_results(self, job_id: int) -> dict:
         max_attempts = 3
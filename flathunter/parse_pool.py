@@ -0,0 +1,65 @@
+"""Process pool for parsing search result pages. Building the soup and extracting
+   the exposes is CPU-bound and holds the GIL, so with several filters or expose
+   detail threads running, parsing in worker processes keeps the crawler responsive"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_crawlers = {}
+
+
+def extract_exposes(crawler_class, markup):
+    """Parse raw HTML and extract the exposes, in a worker process. Crawlers only
+    need their class to extract data, so they are created without running their
+    constructors (which may start a browser)"""
+    from flathunter.abstract_crawler import make_soup
+
+    if crawler_class not in _crawlers:
+        _crawlers[crawler_class] = crawler_class.__new__(crawler_class)
+    return _crawlers[crawler_class].extract_data(make_soup(markup))
+
+
+class ParsePool:
+    """Pool of worker processes receiving raw HTML and returning expose dicts"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, workers):
+        # Worker processes are spawned rather than forked, as the parent runs delivery threads
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    @classmethod
+    def for_config(cls, config):
+        """Return the process-wide pool if processing.parse_workers is above one, or None"""
+        workers = (config.get("processing") or dict()).get("parse_workers", 1)
+        if workers <= 1:
+            return None
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls.__log__.info("Parsing search results in %d worker processes", workers)
+                cls._shared = cls(workers)
+            return cls._shared
+
+    @classmethod
+    def shutdown_shared(cls):
+        """Stop the process-wide pool, if one was started"""
+        with cls._shared_lock:
+            shared, cls._shared = cls._shared, None
+        if shared is not None:
+            shared.close()
+
+    def submit(self, crawler, markup):
+        """Start parsing a page for a crawler; returns a future for the list of exposes"""
+        return self.executor.submit(extract_exposes, type(crawler), markup)
+
+    def extract(self, crawler, markup):
+        """Parse a page for a crawler and return the list of exposes"""
+        return self.submit(crawler, markup).result()
+
+    def close(self):
+        """Wait for pending pages and stop the worker processes"""
+        self.executor.shutdown(wait=True)
@@ -1,5 +1,7 @@
 """Utility classes for building chains for processors"""
+import time
 from functools import reduce
+from itertools import chain
 
 from flathunter.abstract_processor import Processor
 from flathunter.default_processors import AddressResolver
@@ -10,6 +12,7 @@ from flathunter.sender_mattermost import SenderMattermost
 from flathunter.sender_telegram import SenderTelegram
 from flathunter.gmaps_duration_processor import GMapsDurationProcessor
 from flathunter.idmaintainer import SaveAllExposesProcessor
+from flathunter.stage_metrics import StageMetrics
 
 
 class MarkAsProcessedProcessor(Processor):
@@ -23,6 +26,30 @@ class MarkAsProcessedProcessor(Processor):
         self.id_watch.mark_processed(expose["id"], expose["crawler"])
         return expose
 
+    def process_batch(self, exposes):
+        """Mark a batch of exposes as processed with a single update"""
+        self.id_watch.mark_exposes_processed(exposes)
+        return exposes
+
+
+def batched(exposes, size, max_wait=None):
+    """Group a sequence of exposes into lists of at most `size` items. A batch is
+    also flushed when an item arrives `max_wait` seconds or more after the first
+    item of the batch. The sequence is consumed lazily, so the timeout is only
+    checked when an item arrives: while the source is blocked, a partial batch
+    waits for the next item or the end of the sequence"""
+    batch = []
+    started = None
+    for expose in exposes:
+        if not batch:
+            started = time.monotonic()
+        batch.append(expose)
+        if len(batch) >= size or (max_wait is not None and time.monotonic() - started >= max_wait):
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 
 class ProcessorChainBuilder:
     """Builder pattern for building chains of processors"""
@@ -30,6 +57,7 @@ class ProcessorChainBuilder:
     def __init__(self, config):
         self.processors = []
         self.config = config
+        self.metrics = None
 
     def send_messages(self, receivers=None):
         notifiers = self.config.get("notifiers", list())
@@ -78,20 +106,52 @@ class ProcessorChainBuilder:
         self.processors.append(MarkAsProcessedProcessor(id_watch))
         return self
 
+    def instrument(self, labels=None):
+        """Time the stages of the chain, if enabled in the configuration"""
+        self.metrics = StageMetrics.for_config(self.config, labels)
+        return self
+
     def build(self):
         """Build the processor chain"""
-        return ProcessorChain(self.processors)
+        processing = self.config.get("processing", dict()) or dict()
+        return ProcessorChain(
+            self.processors,
+            batch_size=processing.get("batch_size", ProcessorChain.DEFAULT_BATCH_SIZE),
+            batch_max_wait=processing.get("batch_max_wait", ProcessorChain.DEFAULT_BATCH_MAX_WAIT),
+            metrics=self.metrics,
+        )
 
 
 class ProcessorChain:
     """Class to hold a chain of processors"""
 
-    def __init__(self, processors):
+    # Batching is opt-in: exposes of a batch are only marked as processed once the whole batch was sent
+    DEFAULT_BATCH_SIZE = 1
+    DEFAULT_BATCH_MAX_WAIT = 5
+
+    def __init__(self, processors, batch_size=1, batch_max_wait=None, metrics=None):
         self.processors = processors
+        self.batch_size = batch_size
+        self.batch_max_wait = batch_max_wait
+        self.metrics = metrics
 
     def process(self, exposes):
         """Process the sequences of exposes with the processor chain"""
-        return reduce((lambda exposes, processor: processor.process_exposes(exposes)), self.processors, exposes)
+        if self.metrics:
+            exposes = self.metrics.timed("crawl", exposes)
+        return reduce(self.apply_processor, self.processors, exposes)
+
+    def apply_processor(self, exposes, processor):
+        """Apply a single processor to the sequence. Processors implementing
+        process_batch receive micro-batches, all others see one expose at a time"""
+        if self.batch_size > 1 and processor.supports_batching():
+            batches = batched(exposes, self.batch_size, self.batch_max_wait)
+            processed = chain.from_iterable(map(processor.process_batch, batches))
+        else:
+            processed = processor.process_exposes(exposes)
+        if self.metrics:
+            return self.metrics.timed(type(processor).__name__, processed)
+        return processed
 
     @staticmethod
     def builder(config):
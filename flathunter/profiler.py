@@ -0,0 +1,112 @@
+"""Built-in sampling profiler. A background thread takes a snapshot of the
+   hunting thread's call stack at a fixed interval and counts the stacks per
+   stage of the processor chain. The counts are written in the folded stack
+   format read by flamegraph.pl, speedscope and inferno, one file per stage:
+
+   flamegraph.pl profiles/crawl.folded > crawl.svg"""
+import logging
+import os
+import re
+import sys
+import threading
+
+from flathunter.stage_metrics import StageMetrics
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread every `interval` seconds. Samples taken
+    outside a processor chain are attributed to the stage "other"
+
+    The profiled thread only pays for the stage bookkeeping of the chain; the
+    sampling itself runs on the profiler thread"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    OTHER_STAGE = "other"
+    MAX_DEPTH = 200
+
+    def __init__(self, interval=0.01, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+
+    @classmethod
+    def for_config(cls, config):
+        """Return a profiler if profiling is configured, otherwise None"""
+        settings = config.get("profiling") or dict()
+        if not settings.get("cycles"):
+            return None
+        return cls(settings.get("interval", 0.01))
+
+    def start(self):
+        """Start sampling"""
+        StageMetrics.attach_profiler()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling"""
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        # A profiler that was never started has nothing to stop
+        if self.thread.ident is not None:
+            self.thread.join()
+            StageMetrics.detach_profiler()
+
+    def run(self):
+        """Profiler loop"""
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """Record the current stack of the profiled thread"""
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stage = StageMetrics.current_stage(self.thread_id) or self.OTHER_STAGE
+        stack = []
+        while frame is not None and len(stack) < self.MAX_DEPTH:
+            stack.append(self.frame_name(frame))
+            frame = frame.f_back
+        key = (stage, ";".join(reversed(stack)))
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    @staticmethod
+    def frame_name(frame):
+        """Name of a stack frame in the folded output: file and function"""
+        code = frame.f_code
+        name = getattr(code, "co_qualname", code.co_name)
+        # Semicolons separate frames in the folded format
+        return ("%s:%s" % (os.path.basename(code.co_filename), name)).replace(";", ":")
+
+    def folded(self, stage=None):
+        """Folded stacks with their sample counts, of one stage or of all stages
+        (with the stage as root frame)"""
+        with self.lock:
+            counts = sorted(self.counts.items())
+        if stage is None:
+            return ["%s;%s %d" % (name, stack, count) for ((name, stack), count) in counts]
+        return ["%s %d" % (stack, count) for ((name, stack), count) in counts if name == stage]
+
+    def stages(self):
+        """Names of the stages with samples"""
+        with self.lock:
+            return sorted({stage for (stage, _) in self.counts})
+
+    def write(self, directory):
+        """Write all.folded and one <stage>.folded file per stage to `directory`"""
+        os.makedirs(directory, exist_ok=True)
+        files = {"all": self.folded()}
+        for stage in self.stages():
+            files[re.sub(r"[^\w.-]", "_", stage)] = self.folded(stage)
+        for (name, lines) in files.items():
+            with open(os.path.join(directory, name + ".folded"), "w", encoding="utf-8") as file:
+                file.write("".join(line + "\n" for line in lines))
+        self.__log__.info("Wrote %d profile samples of %d stages to %s", self.samples, len(files) - 1, directory)
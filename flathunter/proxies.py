@@ -1,12 +1,13 @@
 """ Gets proxies """
 import requests
-from lxml.html import fromstring
 
 
 def get_proxies():
     """
     Gets random, free proxies
     """
+    from lxml.html import fromstring
+
     url = "https://free-proxy-list.net/"
     response = requests.get(url)
     parser = fromstring(response.text)
@@ -0,0 +1,112 @@
+"""Archive of raw crawler responses. In record mode every fetched page is stored
+   compressed and content-addressed, so identical pages are only stored once; in
+   replay mode pages are served from the archive instead of the network, which
+   allows running flathunt offline and reproducing parsing problems"""
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3 as lite
+import threading
+import time
+
+
+class ResponseArchive:
+    """Directory of gzipped page bodies named by their SHA-256 digest, with an
+    SQLite index of the latest body fetched for each URL"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    MODE_RECORD = "record"
+    MODE_REPLAY = "replay"
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path, mode=MODE_RECORD):
+        if mode not in (self.MODE_RECORD, self.MODE_REPLAY):
+            raise ValueError("Unknown archive mode: %s" % mode)
+        self.path = path
+        self.mode = mode
+        self.recorded = 0
+        self.replayed = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        self.connection = lite.connect(os.path.join(path, "index.db"), check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "url TEXT PRIMARY KEY, "
+                "digest TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL)"
+            )
+
+    @classmethod
+    def for_config(cls, config):
+        """Return the process-wide archive configured in the archive section, or None"""
+        settings = config.get("archive")
+        if not settings or not settings.get("path"):
+            return None
+        key = (settings["path"], settings.get("mode", cls.MODE_RECORD))
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(*key)
+            return cls._shared[key]
+
+    @property
+    def replaying(self):
+        """True if pages are served from the archive instead of the network"""
+        return self.mode == self.MODE_REPLAY
+
+    def object_path(self, digest):
+        """Location of the compressed body with the given digest"""
+        return os.path.join(self.path, "objects", digest[:2], digest + ".gz")
+
+    def store(self, url, markup):
+        """Archive the body fetched for a URL"""
+        body = markup.encode("utf-8") if isinstance(markup, str) else bytes(markup)
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first, so a crash never leaves a truncated object
+            tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+            with gzip.open(tmp_path, "wb") as file:
+                file.write(body)
+            os.replace(tmp_path, path)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (url, digest, fetched_at) VALUES (?, ?, ?)",
+                (url, digest, time.time()),
+            )
+        return digest
+
+    def load(self, url):
+        """Return the archived body for a URL, or None if it was never recorded"""
+        with self.lock:
+            row = self.connection.execute("SELECT digest FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        with gzip.open(self.object_path(row[0]), "rb") as file:
+            return file.read()
+
+    def fetch(self, url, fetch):
+        """Return the body for a URL: from the archive when replaying, otherwise by
+        calling `fetch` and recording its result"""
+        if self.replaying:
+            markup = self.load(url)
+            if markup is None:
+                self.__log__.warning("No archived response for %s", url)
+                return ""
+            self.replayed += 1
+            return markup
+        markup = fetch()
+        if markup:
+            self.store(url, markup)
+            self.recorded += 1
+        return markup
+
+    def close(self):
+        """Close the index database"""
+        with self.lock:
+            self.connection.close()
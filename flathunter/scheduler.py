@@ -0,0 +1,173 @@
+"""Schedule the active filters so that each one is crawled at its own interval"""
+import heapq
+import itertools
+import logging
+import time
+
+
+class ScheduledFilter:
+    """An active filter, its crawl interval and the time it is next due"""
+
+    def __init__(self, filter_id, data, interval, due):
+        self.filter_id = filter_id
+        self.data = data
+        self.base_interval = interval
+        self.interval = interval
+        self.due = due
+        self.last_run = None
+
+
+class FilterScheduler:
+    """Priority queue of filters ordered by the time they are next due. Filters
+    joining the schedule are spread evenly over their interval, and each filter
+    keeps its phase afterwards, so crawls are staggered instead of bursting at
+    the start of a cycle"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    def __init__(self, default_interval=30 * 60, min_interval=60, adaptive=None, clock=time.time):
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.adaptive = adaptive
+        self.clock = clock
+        self.entries = {}
+        self.heap = []
+        self.sequence = itertools.count()
+        self.lags = []
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a scheduler from the loop.schedule section of a config. Filters without
+        a scraping interval are crawled every loop.sleeping_time seconds"""
+        loop = config.get("loop", dict())
+        settings = loop.get("schedule") or dict()
+        return cls(
+            default_interval=settings.get("default_interval", loop.get("sleeping_time", 30 * 60)),
+            min_interval=settings.get("min_interval", 60),
+            adaptive=settings.get("adaptive"),
+        )
+
+    def __len__(self):
+        return len(self.entries)
+
+    def interval_for(self, data):
+        """Crawl interval of a filter in seconds. The scraping_interval column is in minutes"""
+        minutes = data.get("scraping_interval")
+        interval = minutes * 60 if minutes else self.default_interval
+        return max(interval, self.min_interval)
+
+    def sync(self, filters):
+        """Bring the schedule in line with the given active filters (filter_id -> data).
+        Filters that are no longer active are dropped, and new filters are spread over
+        their interval. Returns the ids of the filters that were added"""
+        now = self.clock()
+        for filter_id in [filter_id for filter_id in self.entries if filter_id not in filters]:
+            del self.entries[filter_id]
+
+        added = [filter_id for filter_id in filters if filter_id not in self.entries]
+        for (idx, filter_id) in enumerate(added):
+            data = filters[filter_id]
+            interval = self.interval_for(data)
+            self.entries[filter_id] = ScheduledFilter(filter_id, data, interval, now + interval * idx / len(added))
+            self.push(self.entries[filter_id])
+
+        for (filter_id, data) in filters.items():
+            entry = self.entries[filter_id]
+            entry.data = data
+            interval = self.interval_for(data)
+            if interval != entry.base_interval:
+                entry.base_interval = interval
+                self.set_interval(entry, interval)
+        return added
+
+    def adapt(self, new_listings, window):
+        """Adapt the crawl intervals to the rate at which filters find new listings.
+        `new_listings` maps filter ids to the number of listings found in the last
+        `window` seconds. A filter is polled about once per `target` new listings,
+        but no faster than `min_factor` and no slower than `max_factor` times its
+        configured interval"""
+        if not self.adaptive:
+            return
+        target = self.adaptive.get("target", 1)
+        min_factor = self.adaptive.get("min_factor", 0.5)
+        max_factor = self.adaptive.get("max_factor", 4)
+        for entry in self.entries.values():
+            rate = new_listings.get(str(entry.filter_id), 0) / window
+            interval = target / rate if rate else float("inf")
+            interval = min(max(interval, entry.base_interval * min_factor), entry.base_interval * max_factor)
+            interval = max(interval, self.min_interval)
+            # Ignore small changes, so that filters are not rescheduled on every refresh
+            if abs(interval - entry.interval) > 0.1 * entry.interval:
+                self.__log__.info(
+                    "Polling filter %s every %ds (%.1f new listings per hour)", entry.filter_id, interval, rate * 3600
+                )
+                self.set_interval(entry, interval)
+
+    def set_interval(self, entry, interval):
+        """Change the interval of a scheduled filter, moving its next run accordingly"""
+        entry.interval = interval
+        if entry.last_run is not None:
+            entry.due = entry.last_run + interval
+            self.push(entry)
+
+    def push(self, entry):
+        # Superseded heap items are skipped when they reach the top
+        heapq.heappush(self.heap, (entry.due, next(self.sequence), entry.filter_id))
+
+    def peek(self):
+        """The next filter to become due, or None if there are no filters"""
+        while self.heap:
+            (due, _, filter_id) = self.heap[0]
+            entry = self.entries.get(filter_id)
+            if entry is not None and entry.due == due:
+                return entry
+            heapq.heappop(self.heap)
+        return None
+
+    def wait_time(self):
+        """Seconds until the next filter is due, or None if there are no filters"""
+        entry = self.peek()
+        if entry is None:
+            return None
+        return max(0, entry.due - self.clock())
+
+    def pop_due(self):
+        """Take the most overdue filter off the schedule, or return None if no filter
+        is due yet. Call `reschedule` once it has been crawled"""
+        entry = self.peek()
+        now = self.clock()
+        if entry is None or entry.due > now:
+            return None
+        heapq.heappop(self.heap)
+        entry.last_run = now
+        self.lags.append(now - entry.due)
+        return entry
+
+    def postpone(self, entry, delay):
+        """Put a filter taken off with `pop_due` back on the schedule without running
+        it, to be due again `delay` seconds from now. The next runs keep the new phase"""
+        if self.entries.get(entry.filter_id) is not entry:
+            return
+        entry.due = self.clock() + delay
+        self.push(entry)
+
+    def reschedule(self, entry):
+        """Schedule the next run of a filter taken off with `pop_due`. Runs that were
+        missed because the scheduler fell behind are skipped, not caught up on"""
+        if self.entries.get(entry.filter_id) is not entry:
+            return
+        now = self.clock()
+        due = entry.due + entry.interval
+        if due <= now:
+            missed = int((now - due) // entry.interval) + 1
+            self.__log__.warning("Filter %s is behind schedule, skipping %d runs", entry.filter_id, missed)
+            due += missed * entry.interval
+        entry.due = due
+        self.push(entry)
+
+    def lag_report(self):
+        """Return (runs, mean lag, max lag) for the runs since the last report"""
+        lags, self.lags = self.lags, []
+        if not lags:
+            return (0, 0.0, 0.0)
+        return (len(lags), sum(lags) / len(lags), max(lags))
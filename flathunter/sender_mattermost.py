@@ -5,6 +5,7 @@ import logging
 import requests
 
 from flathunter.abstract_processor import Processor
+from flathunter.message_renderer import MessageRenderer
 
 
 class SenderMattermost(Processor):
@@ -15,22 +16,11 @@ class SenderMattermost(Processor):
     def __init__(self, config):
         self.config = config
         self.webhook_url = self.config.get("mattermost", dict()).get("webhook_url", "")
+        self.renderer = MessageRenderer.for_config(self.config)
 
     def process_expose(self, expose):
         """Send a message to a user describing the expose"""
-        message = (
-            self.config.get("message", "")
-            .format(
-                title=expose["title"],
-                rooms=expose["rooms"],
-                size=expose["size"],
-                price=expose["price"],
-                url=expose["url"],
-                address=expose["address"],
-                durations="" if "durations" not in expose else expose["durations"],
-            )
-            .strip()
-        )
+        message = self.renderer.render(expose)
         self.send_msg(message)
         return expose
 
@@ -2,10 +2,16 @@
 import urllib.request
 import urllib.parse
 import urllib.error
+import hashlib
+import html
+import itertools
 import logging
 import requests
 
 from flathunter.abstract_processor import Processor
+from flathunter.message_renderer import MessageRenderer
+from flathunter.outbox import OutboxDispatcher, outbox_path
+from flathunter.telegram_delivery import TelegramDeliveryQueue
 
 
 class SenderTelegram(Processor):
@@ -13,6 +19,9 @@ class SenderTelegram(Processor):
 
     __log__ = logging.getLogger("flathunt")
 
+    MAX_MESSAGE_LENGTH = 4096
+    DIGEST_LINE = '<a href="{url}">{title}</a>\n{price} · {rooms} · {size}'
+
     def __init__(self, config, receivers=None, admin_config=False):
         self.config = config
         if admin_config:
@@ -30,52 +39,121 @@ class SenderTelegram(Processor):
             else:
                 self.receiver_ids = receivers
             self.admin_config = False
+        delivery_settings = self.config.get("telegram", dict()).get("delivery")
+        if delivery_settings:
+            self.delivery_queue = TelegramDeliveryQueue.shared(delivery_settings)
+        else:
+            self.delivery_queue = None
+        outbox_settings = self.config.get("telegram", dict()).get("outbox")
+        if outbox_settings:
+            dispatcher = OutboxDispatcher.shared(outbox_path(self.config), outbox_settings, delivery_settings)
+            self.outbox = dispatcher.outbox
+        else:
+            self.outbox = None
+        digest_settings = self.config.get("telegram", dict()).get("digest") or dict()
+        self.digest_threshold = None if admin_config else digest_settings.get("threshold")
+        self.digest_page_size = digest_settings.get("page_size", 10)
+        self.renderer = MessageRenderer.for_config(self.config, escape_html=True)
+
+    def process_exposes(self, exposes):
+        """Send one message per expose, or a paginated digest if the number of new
+        exposes reaches the configured digest threshold"""
+        if not self.digest_threshold:
+            return super().process_exposes(exposes)
+        return self.digest_exposes(iter(exposes))
+
+    def digest_exposes(self, exposes):
+        """Hold back the exposes until the digest threshold is reached, then send
+        digest pages as they fill up. At most the exposes up to the threshold and
+        those of one digest page are kept in memory"""
+        held = list(itertools.islice(exposes, self.digest_threshold))
+        if len(held) < self.digest_threshold:
+            for expose in held:
+                yield self.process_expose(expose)
+            return
+
+        self.__log__.info("Sending digest of at least %d new exposes", len(held))
+        page, length, pages, count = [], 0, 0, 0
+        for expose in itertools.chain(held, exposes):
+            entry = self.digest_entry(expose)
+            if page and (len(page) >= self.digest_page_size or length + len(entry) + 100 > self.MAX_MESSAGE_LENGTH):
+                # The total is not known until the last page
+                pages += 1
+                yield from self.send_digest_page(page, "<b>New listings</b> (%d)" % pages)
+                page, length = [], 0
+            page.append((expose, entry))
+            length += len(entry) + 2
+            count += 1
+        pages += 1
+        yield from self.send_digest_page(page, "<b>%d new listings</b> (%d/%d)" % (count, pages, pages))
+
+    def digest_entry(self, expose):
+        """Format an expose as an entry of a digest message"""
+        return self.DIGEST_LINE.format(
+            url=html.escape(expose["url"]),
+            title=html.escape(expose["title"]),
+            price=html.escape(str(expose["price"])),
+            rooms=html.escape(str(expose["rooms"])),
+            size=html.escape(str(expose["size"])),
+        )
+
+    def send_digest_page(self, page, header):
+        """Send a digest message of (expose, entry) pairs and return its exposes"""
+        exposes = [expose for (expose, _) in page]
+        message = "%s\n\n%s" % (header, "\n\n".join(entry for (_, entry) in page))
+        self.send_msg(message, dedup_key=self.digest_key(exposes), ask_ai=False)
+        return exposes
+
+    @staticmethod
+    def digest_key(exposes):
+        """Outbox dedup key for a digest page, derived from the listings on it, so a
+        re-run after a crash produces the same key whatever the page header says"""
+        listings = sorted("%s:%s" % (expose["crawler"], expose["id"]) for expose in exposes)
+        return "digest:" + hashlib.sha1(",".join(listings).encode("utf-8")).hexdigest()
 
     def process_expose(self, expose):
         """Send a message to a user describing the expose"""
-        message = (
-            self.config.get("message", "")
-            .format(
-                title=expose["title"],
-                rooms=expose["rooms"],
-                size=expose["size"],
-                price=expose["price"],
-                url=expose["url"],
-                address=expose["address"],
-                durations="" if "durations" not in expose else expose["durations"],
-            )
-            .strip()
-        )
-        self.send_msg(message)
+        message = self.renderer.render(expose)
+        self.send_msg(message, dedup_key="%s:%s" % (expose["crawler"], expose["id"]))
         return expose
 
-    def send_msg(self, message):
-        """Send messages to each of the receivers in receiver_ids, with an inline 'Ask AI' button"""
+    def send_msg(self, message, dedup_key=None, ask_ai=True):
+        """Send messages to each of the receivers in receiver_ids, with an inline 'Ask AI' button.
+        If an outbox or delivery queue is configured, messages are queued instead of sent inline.
+        The outbox stores a message with a given dedup_key only once per receiver"""
         if self.receiver_ids is None:
             return
 
         for chat_id in self.receiver_ids:
             if not chat_id:
                 continue
-            url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-
             payload = {
                 "chat_id": chat_id,
                 "text": message,
                 "parse_mode": "HTML",  # optional; use only if your message uses formatting
             }
-            if not self.admin_config:
+            if ask_ai and not self.admin_config:
                 payload["reply_markup"] = {
                     "inline_keyboard": [[{"text": "Ask AI", "callback_data": "ask_ai"}]]
                 }
 
-            self.__log__.debug("Sending payload: %s", payload)
-            resp = requests.post(url, json=payload)
-            self.__log__.debug("Got response (%i): %s", resp.status_code, resp.content)
+            if self.outbox is not None:
+                self.outbox.add(self.bot_token, payload, dedup_key)
+            elif self.delivery_queue is not None:
+                self.delivery_queue.enqueue(self.bot_token, payload)
+            else:
+                self.post_payload(payload)
 
-            data = resp.json()
+    def post_payload(self, payload):
+        """Send a single sendMessage payload and wait for the response"""
+        url = TelegramDeliveryQueue.API_URL.format(token=self.bot_token)
+        self.__log__.debug("Sending payload: %s", payload)
+        resp = requests.post(url, json=payload)
+        self.__log__.debug("Got response (%i): %s", resp.status_code, resp.content)
 
-            if resp.status_code != 200:
-                self.__log__.error(
-                    "When sending bot message, we got status %i with message: %s", resp.status_code, data
-                )
+        data = resp.json()
+
+        if resp.status_code != 200:
+            self.__log__.error(
+                "When sending bot message, we got status %i with message: %s", resp.status_code, data
+            )
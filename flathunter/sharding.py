@@ -0,0 +1,93 @@
+"""Share the active filters between several flathunt workers. Workers announce
+   themselves with a lease in the database; every worker places the live workers
+   on a consistent hash ring and crawls the filters that hash to itself. When a
+   worker stops renewing its lease, the others take over its filters"""
+import bisect
+import hashlib
+import logging
+import os
+import socket
+
+
+class HashRing:
+    """Consistent hash ring. Adding or removing a worker only moves the keys
+    between that worker and its neighbours on the ring"""
+
+    def __init__(self, workers, replicas=100):
+        self.ring = sorted(
+            (self.hash("%s#%d" % (worker, replica)), worker) for worker in workers for replica in range(replicas)
+        )
+        self.points = [point for (point, _) in self.ring]
+
+    @staticmethod
+    def hash(key):
+        """Stable 64 bit hash of a string"""
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def owner(self, key):
+        """The worker responsible for a key, or None if there are no workers"""
+        if not self.ring:
+            return None
+        idx = bisect.bisect(self.points, self.hash(str(key))) % len(self.ring)
+        return self.ring[idx][1]
+
+
+class WorkerLease:
+    """Lease of a worker in the worker_leases table. A worker is live for as long
+    as it keeps renewing its lease before `ttl` seconds have passed. The table is
+    part of the database schema (see the README) and is not created here"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    def __init__(self, supabase_client, worker_id, ttl=15 * 60):
+        self.supabase = supabase_client
+        self.worker_id = worker_id
+        self.ttl = int(ttl)
+        self.workers = [worker_id]
+
+    @classmethod
+    def from_config(cls, config, supabase_client):
+        """Create the lease for this process from the sharding section of a config,
+        or return None if sharding is not configured"""
+        settings = config.get("sharding")
+        if not settings:
+            return None
+        worker_id = settings.get("worker_id") or "%s-%d" % (socket.gethostname(), os.getpid())
+        return cls(supabase_client, worker_id, ttl=settings.get("lease_ttl", 15 * 60))
+
+    def renew(self):
+        """Extend the lease of this worker and return the ids of all live workers.
+        Expiry is computed with the database clock, so worker clocks need not agree"""
+        worker_id = self.worker_id.replace("'", "''")
+        self.supabase.execute_commit(
+            f"INSERT INTO worker_leases (worker_id, expires_at) "
+            f"VALUES ('{worker_id}', now() + interval '{self.ttl} seconds') "
+            f"ON CONFLICT (worker_id) DO UPDATE SET expires_at = EXCLUDED.expires_at"
+        )
+        rows = self.supabase.execute_select(
+            "SELECT worker_id FROM worker_leases WHERE expires_at > now() ORDER BY worker_id"
+        )
+        return [row["worker_id"] for row in rows]
+
+    def release(self):
+        """Give up the lease, so that other workers take over right away"""
+        worker_id = self.worker_id.replace("'", "''")
+        try:
+            self.supabase.execute_commit(f"DELETE FROM worker_leases WHERE worker_id = '{worker_id}'")
+        except Exception as e:
+            self.__log__.error(f"Error releasing lease of worker {self.worker_id}: {e}")
+
+    def owned(self, filters):
+        """Renew the lease and return the filters (filter_id -> data) this worker is responsible for"""
+        workers = self.renew()
+        if self.worker_id not in workers:
+            workers.append(self.worker_id)
+        self.workers = workers
+        ring = HashRing(workers)
+        owned = {filter_id: data for (filter_id, data) in filters.items() if ring.owner(filter_id) == self.worker_id}
+        self.__log__.info(f"Worker {self.worker_id} owns {len(owned)} of {len(filters)} filters ({len(workers)} workers)")
+        return owned
+
+    def is_leader(self):
+        """Whether this worker handles the once-per-deployment tasks, like the admin heartbeat"""
+        return HashRing(self.workers).owner("leader") == self.worker_id
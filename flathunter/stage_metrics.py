@@ -0,0 +1,231 @@
+"""Opt-in timing of the stages of a processor chain. Every stage (the crawl that
+   feeds the chain, and each processor) records the wall time spent in it, the
+   number of exposes it passed on and the errors it raised, so a slow filter run
+   can be attributed to crawling, the database or sending messages"""
+import json
+import logging
+import threading
+import time
+
+from flathunter.metrics import REGISTRY
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "flathunt_stage_seconds", "Time spent in a stage of the processor chain, per filter run", ["stage"]
+)
+
+
+class StageStats:
+    """Measurements of a single stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        """The measurements as a JSON-serialisable dict"""
+        return {
+            "stage": self.name,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 6),
+        }
+
+
+class StageMetrics:
+    """Per-stage measurements of one run of a processor chain. Stages are lazy
+    iterators feeding each other, so the time of a stage excludes the time spent
+    in the stages upstream of it"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    _sinks = []
+    _sinks_lock = threading.Lock()
+
+    # Stages currently running, innermost last, by thread. Only tracked while a profiler is attached
+    _active = {}
+    _profilers = 0
+    _profilers_lock = threading.Lock()
+
+    def __init__(self, labels=None, sinks=()):
+        self.labels = dict(labels or {})
+        self.sinks = list(sinks)
+        self.stages = []
+        self.started = time.time()
+        self._nested = []
+        self._error = None
+
+    @classmethod
+    def for_config(cls, config, labels=None):
+        """Return metrics for a chain run if instrumentation is enabled in the
+        processing section, otherwise None"""
+        processing = config.get("processing", dict()) or dict()
+        if not processing.get("instrument"):
+            return None
+        sinks = []
+        if processing.get("metrics_file"):
+            sinks.append(JsonLinesSink.shared(processing["metrics_file"]))
+        return cls(labels, sinks)
+
+    @classmethod
+    def current_stage(cls, thread_id):
+        """Name of the stage a thread is currently running, or None"""
+        stages = cls._active.get(thread_id)
+        return stages[-1] if stages else None
+
+    @classmethod
+    def attach_profiler(cls):
+        """Start tracking the stage every thread is running, for current_stage"""
+        with cls._profilers_lock:
+            cls._profilers += 1
+
+    @classmethod
+    def detach_profiler(cls):
+        """Stop tracking stages once no profiler is attached any more"""
+        with cls._profilers_lock:
+            cls._profilers -= 1
+            if not cls._profilers:
+                cls._active.clear()
+
+    @classmethod
+    def _enter(cls, name):
+        """Push a stage on the running thread's stack, if stages are tracked"""
+        if not cls._profilers:
+            return False
+        cls._active.setdefault(threading.get_ident(), []).append(name)
+        return True
+
+    @classmethod
+    def _leave(cls):
+        """Pop the innermost stage of the running thread, forgetting the thread once it runs none"""
+        thread_id = threading.get_ident()
+        stages = cls._active.get(thread_id)
+        if stages:
+            stages.pop()
+        if not stages:
+            cls._active.pop(thread_id, None)
+
+    @classmethod
+    def add_sink(cls, sink):
+        """Register a callable that receives the record of every instrumented run"""
+        with cls._sinks_lock:
+            cls._sinks.append(sink)
+
+    @classmethod
+    def remove_sink(cls, sink):
+        """Unregister a sink added with add_sink"""
+        with cls._sinks_lock:
+            cls._sinks.remove(sink)
+
+    def stage(self, name):
+        """Add a stage; names are made unique by numbering repeated ones"""
+        names = {stats.name for stats in self.stages}
+        unique, number = name, 1
+        while unique in names:
+            number += 1
+            unique = "%s#%d" % (name, number)
+        stats = StageStats(unique)
+        self.stages.append(stats)
+        return stats
+
+    def timed(self, name, exposes):
+        """Iterate over the output of a stage, timing every step"""
+        # The stage is added right away, so stages are listed in chain order
+        return self._timed(self.stage(name), iter(exposes))
+
+    def _timed(self, stats, iterator):
+        """Generator behind timed"""
+        while True:
+            started = time.perf_counter()
+            self._nested.append(0.0)
+            tracked = self._enter(stats.name)
+            try:
+                expose = next(iterator)
+            except StopIteration:
+                self._stop(stats, started)
+                return
+            except Exception as e:
+                self._stop(stats, started)
+                # Only the stage that raised the error counts it, not the ones it propagates through
+                if e is not self._error:
+                    self._error = e
+                    stats.errors += 1
+                raise
+            finally:
+                if tracked:
+                    self._leave()
+            self._stop(stats, started)
+            stats.items_out += 1
+            yield expose
+
+    def _stop(self, stats, started):
+        """Account a step of a stage, minus the time spent upstream during it"""
+        elapsed = time.perf_counter() - started
+        stats.seconds += elapsed - self._nested.pop()
+        if self._nested:
+            self._nested[-1] += elapsed
+
+    def record(self):
+        """The measurements of the run as a JSON-serialisable dict"""
+        stages = []
+        for (index, stats) in enumerate(self.stages):
+            # Every stage consumes the output of the one before it; the crawl has no input
+            stats.items_in = self.stages[index - 1].items_out if index else 0
+            stages.append(stats.as_dict())
+        return dict(
+            self.labels,
+            started_at=self.started,
+            seconds=round(sum(stats.seconds for stats in self.stages), 6),
+            stages=stages,
+        )
+
+    def report(self):
+        """Log the measurements and hand them to the sinks"""
+        record = self.record()
+        self.__log__.info(
+            "Stage timings%s: %s",
+            "".join(" %s=%s" % item for item in self.labels.items()),
+            ", ".join(
+                "%s %.3fs (%d in, %d out%s)"
+                % (stage["stage"], stage["seconds"], stage["items_in"], stage["items_out"],
+                   ", %d errors" % stage["errors"] if stage["errors"] else "")
+                for stage in record["stages"]
+            ),
+        )
+        for stage in self.stages:
+            STAGE_SECONDS.observe(stage.seconds, stage=stage.name)
+        with self._sinks_lock:
+            sinks = self.sinks + self._sinks
+        for sink in sinks:
+            try:
+                sink(record)
+            except Exception as e:
+                self.__log__.error("Failed to write stage metrics: %s", e)
+        return record
+
+
+class JsonLinesSink:
+    """Metrics sink appending one JSON record per line to a file"""
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, path):
+        """Return the process-wide sink for a file"""
+        with cls._shared_lock:
+            if path not in cls._shared:
+                cls._shared[path] = cls(path)
+            return cls._shared[path]
+
+    def __call__(self, record):
+        line = json.dumps(record, sort_keys=True)
+        with self.lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
@@ -5,13 +5,22 @@ Simplified Supabase client for reading table content
 """
 
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 
+from flathunter.metrics import REGISTRY
+
 __log__ = logging.getLogger(__name__)
 
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "flathunt_db_query_seconds",
+    "Time spent executing database queries",
+    ["operation"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
 
 class SupabaseClient:
     """Simplified Supabase client for reading table content"""
@@ -88,16 +97,9 @@ class SupabaseClient:
             query = f"SELECT {column_str} FROM {table_name}"
 
             # Add WHERE clause if filters provided
-            if filters:
-                where_conditions = []
-                for column, value in filters.items():
-                    if isinstance(value, str):
-                        where_conditions.append(f"{column} = '{value}'")
-                    else:
-                        where_conditions.append(f"{column} = {value}")
-
-                if where_conditions:
-                    query += " WHERE " + " AND ".join(where_conditions)
+            where_conditions = self._where_conditions(filters)
+            if where_conditions:
+                query += " WHERE " + " AND ".join(where_conditions)
 
             # Add LIMIT and OFFSET
             query += f" LIMIT {limit} OFFSET {offset}"
@@ -108,19 +110,90 @@ class SupabaseClient:
             __log__.error(f"Error reading table {table_name}: {e}")
             raise
 
-    def execute_select(self, query: str) -> List[Dict[str, Any]]:
+    def iter_table(
+        self,
+        table_name: str,
+        key: Union[str, Tuple[str, ...]] = "id",
+        page_size: int = 1000,
+        columns: Optional[List[str]] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        conditions: Optional[List[str]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        after: Optional[Any] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over all matching rows of a table, fetched page by page.
+
+        Pages are read with keyset pagination (WHERE key > last key ORDER BY key),
+        so later pages are as cheap as the first one and no row is skipped or
+        returned twice if the table changes between pages.
+
+        Args:
+            table_name: Name of the table to read
+            key: Unique column to paginate on, or a tuple of columns that are unique together
+            page_size: Number of rows fetched per query
+            columns: Specific columns to select (if None, selects all)
+            filters: Dictionary of column: value filters
+            conditions: Additional raw SQL conditions, optionally with :name bind parameters
+            params: Values of the bind parameters in the conditions
+            after: Only read rows with a key greater than this value (a tuple for a composite key)
+
+        Yields:
+            Dictionaries representing rows
+        """
+        key_columns = key if isinstance(key, tuple) else (key,)
+        column_str = "*" if not columns else ", ".join(columns)
+        last_key = after if after is None or isinstance(key, tuple) else (after,)
+        while True:
+            where_conditions = self._where_conditions(filters) + list(conditions or [])
+            page_params = dict(params or {})
+            if last_key is not None:
+                names = [f"after_{idx}" for idx in range(len(key_columns))]
+                # Row value comparison, so that ties on the first key column are broken by the next
+                where_conditions.append(
+                    f"({', '.join(key_columns)}) > ({', '.join(':' + name for name in names)})"
+                    if len(key_columns) > 1
+                    else f"{key_columns[0]} > :{names[0]}"
+                )
+                page_params.update(zip(names, last_key))
+
+            query = f"SELECT {column_str} FROM {table_name}"
+            if where_conditions:
+                query += " WHERE " + " AND ".join(where_conditions)
+            query += f" ORDER BY {', '.join(key_columns)} LIMIT {page_size}"
+
+            rows = self.execute_select(query, page_params)
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last_key = tuple(rows[-1][column] for column in key_columns)
+
+    def _where_conditions(self, filters: Optional[Dict[str, Any]]) -> List[str]:
+        """Build equality conditions for a dictionary of column: value filters"""
+        return [f"{column} = {self._literal(value)}" for column, value in (filters or {}).items()]
+
+    @staticmethod
+    def _literal(value: Any) -> str:
+        """Format a value as an SQL literal"""
+        if isinstance(value, (bool, int, float)):
+            return str(value)
+        escaped = str(value).replace("'", "''")
+        return f"'{escaped}'"
+
+    def execute_select(self, query: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Execute a SELECT SQL query and return results
 
         Args:
-            query: SQL query string
+            query: SQL query string, optionally with :name bind parameters
+            params: Values of the bind parameters
 
         Returns:
             List of dictionaries representing rows
         """
         try:
-            with self.get_session() as session:
-                result = session.execute(text(query))
+            with DB_QUERY_SECONDS.time(operation="select"), self.get_session() as session:
+                result = session.execute(text(query), params or {})
                 rows = []
                 for row in result:
                     # Convert row to dictionary
@@ -143,7 +216,7 @@ class SupabaseClient:
             query: SQL query string
         """
         try:
-            with self.get_session() as session:
+            with DB_QUERY_SECONDS.time(operation="commit"), self.get_session() as session:
                 session.execute(text(query))
                 session.commit()
 
@@ -0,0 +1,272 @@
+"""Outbound delivery queue for Telegram messages. Messages are enqueued without
+   blocking the processor chain and delivered by a pool of worker threads that
+   respect Telegram's global and per-chat rate limits"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+import requests
+
+from flathunter.metrics import REGISTRY
+
+SEND_QUEUE_DEPTH = REGISTRY.gauge("flathunt_send_queue_depth", "Telegram messages queued and not yet delivered")
+MESSAGES_DELIVERED = REGISTRY.counter(
+    "flathunt_telegram_messages_total", "Telegram messages delivered or given up on", ["outcome"]
+)
+
+
+class RateLimiter:
+    """Hands out send slots so that, per bot, at most `global_rate` messages are
+    sent in any one-second window and messages to the same chat are spaced by
+    at least 1 / `chat_rate` seconds"""
+
+    def __init__(self, global_rate=30, chat_rate=1):
+        self.global_rate = global_rate
+        self.chat_interval = 1.0 / chat_rate
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.next_chat = {}
+
+    def reserve(self, bot_token, chat_id, not_before=0):
+        """Reserve the next free slot for a chat and return the number of seconds
+        to wait until it is reached"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, not_before, self.next_chat.get((bot_token, chat_id), 0))
+
+            counts = self.windows.setdefault(bot_token, {})
+            for window in [window for window in counts if window < int(now)]:
+                del counts[window]
+            window = int(slot)
+            while counts.get(window, 0) >= self.global_rate:
+                window += 1
+                slot = max(slot, window)
+            counts[window] = counts.get(window, 0) + 1
+
+            self.next_chat[(bot_token, chat_id)] = slot + self.chat_interval
+            return slot - now
+
+    def defer(self, bot_token, chat_id, seconds):
+        """Block a chat for the given number of seconds (e.g. after a 429 response)"""
+        with self.lock:
+            key = (bot_token, chat_id)
+            self.next_chat[key] = max(self.next_chat.get(key, 0), time.monotonic() + seconds)
+
+
+class DelayQueue:
+    """Queue of jobs ordered by the time they become due. Jobs that are not due
+    yet wait in the queue, not in a worker, so a chat that has to wait does not
+    hold up the messages to other chats"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.heap = []
+        self.sequence = itertools.count()
+        self.unfinished_tasks = 0
+
+    def put(self, job):
+        """Add a job, due at its `not_before` time"""
+        with self.condition:
+            heapq.heappush(self.heap, (job.not_before, next(self.sequence), job))
+            self.unfinished_tasks += 1
+            self.condition.notify()
+
+    def get(self, timeout):
+        """Take the next due job off the queue, waiting up to `timeout` seconds for
+        one to become due. Returns None if there is none"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if self.heap and self.heap[0][0] <= now:
+                    return heapq.heappop(self.heap)[2]
+                if now >= deadline:
+                    return None
+                wait = deadline - now
+                if self.heap:
+                    wait = min(wait, self.heap[0][0] - now)
+                self.condition.wait(wait)
+
+    def task_done(self):
+        """Mark a job taken off the queue as handled"""
+        with self.condition:
+            self.unfinished_tasks -= 1
+
+
+class DeliveryJob:
+    """A single message waiting to be delivered to one chat"""
+
+    def __init__(self, bot_token, payload, callback=None):
+        self.bot_token = bot_token
+        self.payload = payload
+        self.callback = callback
+        self.attempts = 0
+        self.not_before = 0
+        # Whether a send slot was reserved for the job at its not_before time
+        self.reserved = False
+
+    @property
+    def chat_id(self):
+        """The chat this message is addressed to"""
+        return self.payload.get("chat_id")
+
+
+class TelegramDeliveryQueue:
+    """Queue of outbound Telegram messages, drained by a pool of worker threads"""
+
+    __log__ = logging.getLogger("flathunt")
+
+    API_URL = "https://api.telegram.org/bot{token}/sendMessage"
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, workers=4, global_rate=30, chat_rate=1, max_retries=5, timeout=10):
+        self.limiter = RateLimiter(global_rate, chat_rate)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.jobs = DelayQueue()
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.stopped = threading.Event()
+        self.threads = [
+            threading.Thread(target=self.run_worker, name="telegram-delivery-%d" % idx, daemon=True)
+            for idx in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    @classmethod
+    def shared(cls, settings=None):
+        """Return the process-wide delivery queue, creating it on first use. Rate
+        limits only hold if every sender in the process shares the same queue"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                settings = settings or dict()
+                cls._shared = cls(
+                    workers=settings.get("workers", 4),
+                    global_rate=settings.get("global_rate", 30),
+                    chat_rate=settings.get("chat_rate", 1),
+                    max_retries=settings.get("max_retries", 5),
+                    timeout=settings.get("timeout", 10),
+                )
+            return cls._shared
+
+    @classmethod
+    def shutdown_shared(cls, timeout=None):
+        """Drain and stop the process-wide delivery queue, if one was started"""
+        with cls._shared_lock:
+            shared, cls._shared = cls._shared, None
+        if shared is not None:
+            shared.close(timeout)
+
+    def enqueue(self, bot_token, payload, callback=None):
+        """Queue a sendMessage payload for delivery. Never blocks. If given, `callback`
+        is called with True once the message was delivered, or False if it was given up on"""
+        self.jobs.put(DeliveryJob(bot_token, payload, callback))
+
+    def pending(self):
+        """Number of messages not yet delivered"""
+        return self.jobs.unfinished_tasks
+
+    def join(self, timeout=None):
+        """Wait until all queued messages have been delivered or given up on.
+        Returns True if the queue was drained"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.jobs.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout=None):
+        """Deliver outstanding messages and stop the workers"""
+        if not self.join(timeout):
+            self.__log__.warning("Stopping Telegram delivery with %d messages still queued", self.pending())
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join(1)
+
+    def run_worker(self):
+        """Worker loop: take jobs off the queue and deliver them"""
+        while not self.stopped.is_set():
+            job = self.jobs.get(timeout=0.5)
+            if job is None:
+                continue
+            try:
+                self.deliver(job)
+            except Exception as e:
+                self.__log__.error("Unexpected error delivering Telegram message: %s", e)
+                self.finish(job, False)
+            finally:
+                self.jobs.task_done()
+
+    def deliver(self, job):
+        """Send a single job, rescheduling it if Telegram asks us to slow down"""
+        if not job.reserved:
+            delay = self.limiter.reserve(job.bot_token, job.chat_id, job.not_before)
+            if delay > 0:
+                # Hand the job back to the queue until its slot is reached
+                job.reserved = True
+                job.not_before = time.monotonic() + delay
+                self.jobs.put(job)
+                return
+        job.reserved = False
+        job.attempts += 1
+
+        try:
+            resp = requests.post(self.API_URL.format(token=job.bot_token), json=job.payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            self.__log__.warning("Sending Telegram message to %s failed: %s", job.chat_id, e)
+            self.retry(job, 2 ** job.attempts)
+            return
+
+        self.__log__.debug("Got response (%i): %s", resp.status_code, resp.content)
+        if resp.status_code == 200:
+            self.finish(job, True)
+            return
+
+        try:
+            data = resp.json()
+        except ValueError:
+            data = {}
+        if resp.status_code == 429:
+            retry_after = data.get("parameters", dict()).get("retry_after", 1)
+            self.__log__.warning("Rate limited by Telegram for chat %s, retrying in %ss", job.chat_id, retry_after)
+            self.limiter.defer(job.bot_token, job.chat_id, retry_after)
+            self.retry(job, retry_after)
+        elif resp.status_code >= 500:
+            self.retry(job, 2 ** job.attempts)
+        else:
+            self.__log__.error(
+                "When sending bot message, we got status %i with message: %s", resp.status_code, data
+            )
+            self.finish(job, False)
+
+    def retry(self, job, delay):
+        """Put a job back on the queue, to be sent no earlier than `delay` seconds from now"""
+        if job.attempts > self.max_retries:
+            self.__log__.error("Giving up on Telegram message to %s after %d attempts", job.chat_id, job.attempts)
+            self.finish(job, False)
+            return
+        job.not_before = time.monotonic() + delay
+        self.jobs.put(job)
+
+    def finish(self, job, delivered):
+        """Record the final outcome of a job and notify its callback"""
+        with self.lock:
+            if delivered:
+                self.sent += 1
+            else:
+                self.failed += 1
+        MESSAGES_DELIVERED.inc(outcome="sent" if delivered else "failed")
+        if job.callback is not None:
+            job.callback(delivered)
+
+
+SEND_QUEUE_DEPTH.set_function(
+    lambda: TelegramDeliveryQueue._shared.pending() if TelegramDeliveryQueue._shared is not None else 0
+)
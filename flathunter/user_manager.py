@@ -5,7 +5,8 @@ Simple user management for multi-user flat hunting
 """
 
 import logging
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional
 from flathunter.supabase_client import SupabaseClient
 
 __log__ = logging.getLogger(__name__)
@@ -14,6 +15,8 @@ __log__ = logging.getLogger(__name__)
 class UserManager:
     """Simple user manager that pulls paid users from filter_settings table"""
 
+    PAGE_SIZE = 1000
+
     def __init__(self, base_config):
         """
         Initialize UserManager
@@ -23,6 +26,12 @@ class UserManager:
         """
         self.base_config = base_config
         self.supabase_client = SupabaseClient(base_config)
+        schedule = base_config.get("loop", dict()).get("schedule") or dict()
+        self.full_refresh_interval = schedule.get("full_refresh_interval", 60 * 60)
+        self.filters = {}
+        # (updated_at, id) of the latest filter setting seen
+        self.last_updated = None
+        self.next_full_refresh = 0
 
     def get_active_filters(self) -> Dict[str, Dict[str, Any]]:
         """
@@ -32,27 +41,7 @@ class UserManager:
             Dictionary with filter_id as key and filter data as value.
         """
         try:
-            filters = {"is_paid": True}
-            filter_settings = self.supabase_client.read_table("filter_settings", filters=filters)
-
-            filters_dict = {}
-            for setting in filter_settings:
-                filter_id = setting.get("id")
-                user_id = setting.get("user_id")
-                receiver_ids = setting.get("receiver_ids")
-                filter_url = setting.get("filter_url")
-
-                # We need a filter_id, user_id, receiver_ids and a URL to work with.
-                if filter_id and user_id and receiver_ids and filter_url:
-                    filters_dict[filter_id] = {
-                        "filter_id": filter_id,
-                        "user_id": user_id,
-                        "filter_url": filter_url,
-                        "receiver_ids": receiver_ids,
-                        "is_paid": setting.get("is_paid", False),
-                        "scraping_interval": setting.get("scraping_interval", 30),
-                    }
-
+            filters_dict = self._load_active_filters()
             __log__.info(f"Retrieved {len(filters_dict)} active filters from database")
             return filters_dict
 
@@ -60,6 +49,111 @@ class UserManager:
             __log__.error(f"Error fetching active filters: {e}")
             return {}
 
+    def refresh_active_filters(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the active filters, only reading the filter settings that changed since the
+        last refresh. All active filters are reloaded every `full_refresh_interval`
+        seconds, to pick up deleted rows, and on every refresh if filter_settings has
+        no updated_at column. If reading from the database fails, the
+        filters from the previous refresh are returned. The filter data is copied,
+        so callers can change it without affecting the filters kept between refreshes.
+
+        Returns:
+            Dictionary with filter_id as key and filter data as value.
+        """
+        try:
+            if self.last_updated is None or time.monotonic() >= self.next_full_refresh:
+                self.filters = self._load_active_filters()
+                self.next_full_refresh = time.monotonic() + self.full_refresh_interval
+                __log__.info(f"Retrieved {len(self.filters)} active filters from database")
+            else:
+                changed = self._apply_changes()
+                if changed:
+                    __log__.info(f"Applied {changed} changed filter settings")
+
+        except Exception as e:
+            __log__.error(f"Error refreshing active filters: {e}")
+
+        return {filter_id: dict(filter_data) for (filter_id, filter_data) in self.filters.items()}
+
+    def _load_active_filters(self) -> Dict[str, Dict[str, Any]]:
+        """Read all active filters, page by page"""
+        filters_dict = {}
+        for setting in self.supabase_client.iter_table(
+            "filter_settings", filters={"is_paid": True}, page_size=self.PAGE_SIZE
+        ):
+            self._track_update(setting)
+            filter_data = self._filter_data(setting)
+            if filter_data:
+                filters_dict[filter_data["filter_id"]] = filter_data
+        return filters_dict
+
+    def _apply_changes(self) -> int:
+        """Read the filter settings updated since the last refresh and apply them"""
+        changed = 0
+        # Rows updated in the same instant are told apart by their id, so none is read twice or skipped
+        for setting in self.supabase_client.iter_table(
+            "filter_settings", key=("updated_at", "id"), page_size=self.PAGE_SIZE, after=self.last_updated
+        ):
+            self._track_update(setting)
+            filter_data = self._filter_data(setting)
+            if filter_data:
+                self.filters[filter_data["filter_id"]] = filter_data
+            else:
+                self.filters.pop(setting.get("id"), None)
+            changed += 1
+        return changed
+
+    def _track_update(self, setting: Dict[str, Any]):
+        """Remember the latest update timestamp seen, to read only newer changes next time"""
+        updated_at = setting.get("updated_at")
+        if updated_at is not None and (self.last_updated is None or (updated_at, setting["id"]) > self.last_updated):
+            self.last_updated = (updated_at, setting["id"])
+
+    @staticmethod
+    def _filter_data(setting: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Build the filter data for a row of filter_settings, or None if it is not active"""
+        filter_id = setting.get("id")
+        user_id = setting.get("user_id")
+        receiver_ids = setting.get("receiver_ids")
+        filter_url = setting.get("filter_url")
+
+        # We need a paid filter with a filter_id, user_id, receiver_ids and a URL to work with.
+        if not (setting.get("is_paid") and filter_id and user_id and receiver_ids and filter_url):
+            return None
+        return {
+            "filter_id": filter_id,
+            "user_id": user_id,
+            "filter_url": filter_url,
+            "receiver_ids": receiver_ids,
+            "is_paid": setting.get("is_paid", False),
+            "scraping_interval": setting.get("scraping_interval", 30),
+            "digest_threshold": setting.get("digest_threshold"),
+        }
+
+    def get_new_listing_counts(self, window: int) -> Dict[str, int]:
+        """
+        Count the listings each filter found recently, with a single aggregate query.
+
+        Args:
+            window: Length of the time window in seconds
+
+        Returns:
+            Dictionary with filter_id (as string) as key and the number of listings
+            created in the window as value.
+        """
+        try:
+            query = (
+                f"SELECT filter_id, COUNT(*) AS new_listings FROM listings "
+                f"WHERE created_at > now() - interval '{int(window)} seconds' GROUP BY filter_id"
+            )
+            rows = self.supabase_client.execute_select(query)
+            return {str(row["filter_id"]): row["new_listings"] for row in rows}
+
+        except Exception as e:
+            __log__.error(f"Error counting new listings: {e}")
+            return {}
+
     def close(self):
         """Close database connections"""
         if self.supabase_client:
@@ -0,0 +1,52 @@
+"""In-memory SQLite stand-in for the Supabase database, used by the tests of the
+   modules that query Supabase and by the end-to-end benchmark"""
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from flathunter.supabase_client import SupabaseClient
+
+
+class SqliteSupabaseClient(SupabaseClient):
+    """Runs the queries flathunt sends to Supabase against an in-memory SQLite
+    database, recording them. Tables can be created in the public schema, which
+    is attached as a database of its own"""
+
+    def __init__(self, *schema):
+        super().__init__()
+        self.db_url = "sqlite://"
+        self.queries = []
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.create_function("now", 0, lambda: datetime.now(timezone.utc).isoformat())
+        self.connection.execute("ATTACH DATABASE ':memory:' AS public")
+        for statement in schema:
+            self.connection.execute(statement)
+
+    @property
+    def round_trips(self):
+        """Number of queries sent to the database"""
+        return len(self.queries)
+
+    @staticmethod
+    def timestamp(moment):
+        """Format a datetime the way timestamps are stored in the SQLite tables"""
+        return moment.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    def execute_select(self, query, params=None):
+        params = {
+            name: self.timestamp(value) if isinstance(value, datetime) else value
+            for (name, value) in (params or {}).items()
+        }
+        with self.lock:
+            self.queries.append(query)
+            return [dict(row) for row in self.connection.execute(query, params)]
+
+    def execute_commit(self, query):
+        with self.lock, self.connection:
+            self.queries.append(query)
+            self.connection.execute(query)
+
+    def close(self):
+        self.connection.close()
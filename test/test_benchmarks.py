@@ -0,0 +1,35 @@
+import unittest
+from benchmarks.e2e import run_benchmark
+from benchmarks.parsers import PARSERS, regressions, run_benchmarks
+
+class EndToEndBenchmarkTest(unittest.TestCase):
+
+    def test_counts_work_done_per_cycle(self):
+        report = run_benchmark(filters=2, listings=5, cycles=2)
+        self.assertEqual(10, report['new_exposes'])
+        self.assertEqual(10, report['telegram_calls'])
+        self.assertEqual(4, report['page_fetches'])
+        # First cycle: load seen ids, save batch, mark batch; second cycle: load seen ids
+        self.assertEqual(8, report['db_round_trips'])
+        self.assertEqual(2, len(report['cycle_times']))
+        self.assertGreater(report['peak_memory'], 0)
+
+    def test_queued_delivery_is_drained(self):
+        report = run_benchmark(filters=2, listings=5, cycles=1, delivery="outbox")
+        self.assertEqual(10, report['telegram_calls'])
+
+class ParserBenchmarkTest(unittest.TestCase):
+
+    def test_every_parser_extracts_all_listings(self):
+        results = run_benchmarks(listings=5, repeat=1)
+        self.assertEqual(sorted(PARSERS), sorted(results))
+        for result in results.values():
+            self.assertGreater(result['listings_per_second'], 0)
+            self.assertGreater(result['peak_bytes_per_page'], 0)
+
+    def test_detects_regressions(self):
+        baseline = { 'CrawlSubito': { 'listings_per_second': 1000, 'peak_bytes_per_page': 1000 } }
+        self.assertEqual([], regressions({ 'CrawlSubito': { 'listings_per_second': 900,
+                                                             'peak_bytes_per_page': 1100 } }, baseline))
+        self.assertEqual(2, len(regressions({ 'CrawlSubito': { 'listings_per_second': 700,
+                                                                'peak_bytes_per_page': 1300 } }, baseline)))
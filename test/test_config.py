@@ -85,3 +85,27 @@ filters:
        config = Config(string=self.FILTERS_CONFIG)
        self.assertIsNotNone(config)
        self.assertEqual(config.database_location(), os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/.."))
+
+    def test_searchers_are_dispatched_by_host(self):
+       config = Config(string=self.DUMMY_CONFIG)
+       searchers = config.searchers_for_url(config.get('urls')[0])
+       self.assertEqual(['CrawlImmowelt'], [searcher.get_name() for searcher in searchers])
+       self.assertEqual([], config.searchers_for_url("https://www.example.com/search"))
+       self.assertEqual('CrawlIdealista', config.searchers_for_url("https://www.idealista.com/alquiler-viviendas/")[0].get_name())
+
+    def test_overlay_falls_back_to_base_config(self):
+       config = Config(string=self.FILTERS_CONFIG)
+       overlay = config.overlay({'urls': ["https://www.idealista.com/alquiler-viviendas/"]})
+       self.assertEqual(["https://www.idealista.com/alquiler-viviendas/"], overlay.get('urls'))
+       self.assertEqual(config.get('urls'), config['urls'])
+       self.assertEqual(100, overlay['filters']['max_size'])
+       self.assertEqual(config.database_location(), overlay.database_location())
+
+    def test_overlay_shares_lazily_created_searchers(self):
+       config = Config(string=self.DUMMY_CONFIG)
+       overlay = config.overlay({'oxylabs_job_id': 'job'})
+       searcher = overlay.searchers_for_url("https://www.idealista.com/alquiler-viviendas/")[0]
+       self.assertIs(overlay, searcher.config)
+       self.assertEqual('job', searcher.config.get('oxylabs_job_id'))
+       self.assertEqual(len(config.searchers()), len(overlay.searchers()))
+       self.assertIs(config, config.searchers_for_url("https://www.idealista.com/")[0].config)
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import unittest
+from flathunter.config import Config
+from flathunter.cycle_report import CycleReporter, aggregate, percentile, read_reports
+from flathunter.stage_metrics import StageMetrics
+
+class CycleReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "cycles.jsonl")
+        self.reporter = CycleReporter.for_config(Config(string="reporting:\n  cycle_report: %s\n" % self.path))
+
+    def tearDown(self):
+        self.reporter.close()
+        self.tempdir.cleanup()
+
+    def report_stages(self, filter_id, crawled, new, crawl_seconds, send_seconds):
+        metrics = StageMetrics({ 'user_id': 'user', 'filter_id': filter_id })
+        for (name, items, seconds) in [ ('crawl', crawled, crawl_seconds), ('Filter', new, 0.001),
+                                        ('SaveAllExposesProcessor', new, 0.01), ('SenderTelegram', new, send_seconds),
+                                        ('MarkAsProcessedProcessor', new, 0.02) ]:
+            stage = metrics.stage(name)
+            stage.items_out = items
+            stage.seconds = seconds
+        metrics.report()
+
+    def test_cycle_records_runs_with_stage_breakdown(self):
+        self.reporter.start_cycle(1)
+        self.report_stages(7, 20, 3, 1.5, 0.25)
+        self.reporter.record_run(7, 'user', 1000.0, 2.0, 4.5)
+        self.reporter.record_run(8, 'user', 1002.0, 0.5, 0.0, error="Connection refused")
+        self.reporter.finish_cycle()
+        self.assertIsNone(self.reporter.finish_cycle())
+
+        [record] = list(read_reports([ self.path ]))
+        self.assertEqual(1, record['cycle'])
+        [run, failed] = record['runs']
+        self.assertEqual(('7', 20, 3, 0), (run['filter_id'], run['listings'], run['new_listings'], run['errors']))
+        self.assertEqual((1.5, 0.03, 0.25), (run['fetch_seconds'], run['db_seconds'], run['send_seconds']))
+        self.assertEqual((1, "Connection refused", 0), (failed['errors'], failed['error'], failed['listings']))
+
+    def test_runs_are_aggregated_per_filter(self):
+        for (cycle, seconds) in enumerate([ 1.0, 3.0 ]):
+            self.reporter.start_cycle(cycle)
+            self.report_stages(7, 10, 2, seconds / 2, 0.1)
+            self.reporter.record_run(7, 'user', 1000.0, seconds, 0.0)
+            self.reporter.record_run(8, 'user', 1000.0, 0.2, 0.0)
+            self.reporter.finish_cycle()
+        summary = { row['filter_id']: row for row in aggregate(read_reports([ self.path ])) }
+        self.assertEqual(2, summary['7']['runs'])
+        self.assertEqual((2.0, 3.0, 1.0), (summary['7']['seconds'], summary['7']['max_seconds'], summary['7']['fetch_seconds']))
+        self.assertEqual((20, 4), (summary['7']['listings'], summary['7']['new_listings']))
+        self.assertEqual(0, summary['8']['listings'])
+
+    def test_reporter_is_only_created_when_configured(self):
+        self.assertIsNone(CycleReporter.for_config(Config(string="loop:\n  active: false\n")))
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 21))
+        self.assertEqual(19, percentile(values, 0.95))
+        self.assertEqual(10, percentile(values, 0.5))
+        self.assertEqual(20, percentile(values, 1))
+        self.assertEqual(7, percentile([7], 0.95))
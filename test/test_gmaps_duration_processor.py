@@ -1,9 +1,14 @@
+import json
 import unittest
+import tempfile
+import time
 import yaml
 import re
 import requests_mock
 from flathunter.hunter import Hunter
 from flathunter.config import Config
+from flathunter.duration_cache import DurationCache
+from flathunter.gmaps_duration_processor import GMapsDurationProcessor
 from flathunter.idmaintainer import IdMaintainer
 from dummy_crawler import DummyCrawler
 from test_util import count
@@ -47,4 +52,82 @@ durations:
         if len(without_durations) > 0:
             for expose in without_durations:
                 print("Got expose: ", expose)
-        self.assertTrue(len(without_durations) == 0, "Expected durations to be calculated")
\ No newline at end of file
+        self.assertTrue(len(without_durations) == 0, "Expected durations to be calculated")
+
+class GMapsDurationCacheTest(unittest.TestCase):
+
+    RESPONSE = '{"status": "OK", "rows": [ { "elements": [ { "distance": { "text": "far", "value": 123 }, "duration": { "text": "days", "value": 123 } } ] } ]}'
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.config = Config(string=GMapsDurationProcessorTest.DUMMY_CONFIG.replace(
+            "  enable: true\n", "  enable: true\n  cache:\n    path: %s/gmaps_cache.db\n" % self.tempdir.name))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    @requests_mock.Mocker()
+    def test_repeated_addresses_use_cache(self, m):
+        m.get(re.compile('maps.googleapis.com/maps/api/distancematrix/json'), text=self.RESPONSE)
+        processor = GMapsDurationProcessor(self.config)
+        first = processor.get_formatted_durations("1600 Pennsylvania Ave")
+        calls = m.call_count
+        self.assertEqual(3, calls)
+        self.assertEqual(first, processor.get_formatted_durations("  1600 pennsylvania ave "))
+        self.assertEqual(calls, m.call_count)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = DurationCache(":memory:", max_entries=2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        time.sleep(0.01)
+        cache.get("a")
+        cache.put("c", "3")
+        self.assertEqual("1", cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_cache_entries_expire(self):
+        cache = DurationCache(":memory:", ttl=0)
+        cache.put("a", "1")
+        self.assertIsNone(cache.get("a"))
+
+
+class GMapsDistanceMatrixBatchingTest(unittest.TestCase):
+
+    CONFIG = """
+google_maps_api:
+  key: SOME_KEY
+  url: https://maps.googleapis.com/maps/api/distancematrix/json?origins={origin}&destinations={dest}&mode={mode}&sensor=true&key={key}&arrival_time={arrival}
+  enable: true
+
+durations:
+  - destination: Office
+    name: Work
+    modes:
+      - gm_id: transit
+        title: Bus
+  - destination: Gym
+    name: Sport
+    modes:
+      - gm_id: transit
+        title: Bus
+    """
+
+    @staticmethod
+    def matrix_response(request, context):
+        origins = request.qs['origins'][0].split('|')
+        destinations = request.qs['destinations'][0].split('|')
+        return json.dumps({"status": "OK", "rows": [
+            {"elements": [{"distance": {"text": "%s-%s" % (origin, dest), "value": 1},
+                           "duration": {"text": "1 min", "value": 60}} for dest in destinations]}
+            for origin in origins]})
+
+    @requests_mock.Mocker()
+    def test_destinations_and_origins_share_requests(self, m):
+        m.get(re.compile('maps.googleapis.com/maps/api/distancematrix/json'), text=self.matrix_response)
+        processor = GMapsDurationProcessor(Config(string=self.CONFIG))
+        exposes = processor.process_batch([{'address': 'A'}, {'address': 'B'}, {'address': 'A'}])
+        self.assertEqual(1, m.call_count)
+        self.assertEqual("> Work (Bus): 1 min (a-office)\n> Sport (Bus): 1 min (a-gym)", exposes[0]['durations'])
+        self.assertEqual("> Work (Bus): 1 min (b-office)\n> Sport (Bus): 1 min (b-gym)", exposes[1]['durations'])
+        self.assertEqual(exposes[0]['durations'], exposes[2]['durations'])
@@ -0,0 +1,46 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from sqlite_supabase import SqliteSupabaseClient
+from flathunter.config import Config
+from flathunter.heartbeat import Heartbeat
+
+class HeartbeatTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = SqliteSupabaseClient(
+            "CREATE TABLE public.listings (property_id INTEGER, user_id TEXT, created_at TEXT)")
+        self.heartbeat = Heartbeat(Config(string="loop:\n  schedule:\n    heartbeat_recount_interval: 3600\n"))
+        self.heartbeat.supabase_client = self.client
+
+    def insert(self, property_id, user_id, age):
+        created_at = self.client.timestamp(datetime.now(timezone.utc) - age)
+        self.client.connection.execute("INSERT INTO public.listings VALUES (?, ?, ?)", (property_id, user_id, created_at))
+
+    def test_totals_are_counted_once_then_updated_incrementally(self):
+        self.insert(1, "alice", timedelta(days=2))
+        self.insert(2, "bob", timedelta(days=1))
+        self.insert(3, "bob", timedelta(minutes=5))
+        self.assertEqual((1, 1, 3, 2), self.heartbeat.listing_stats())
+        self.assertEqual(2, len(self.client.queries))
+
+        self.insert(4, "carol", timedelta(0))
+        self.insert(5, "bob", timedelta(0))
+        self.client.queries = []
+        self.assertEqual((3, 2, 5, 3), self.heartbeat.listing_stats())
+        self.assertEqual(1, len(self.client.queries))
+        self.assertIn("WHERE created_at > :window_start", self.client.queries[0])
+
+    def test_listings_ahead_of_the_app_clock_are_counted_once(self):
+        self.insert(1, "alice", timedelta(days=1))
+        self.heartbeat.listing_stats()
+        self.insert(2, "alice", timedelta(minutes=-5))
+        self.assertEqual((1, 1, 2, 1), self.heartbeat.listing_stats())
+        self.assertEqual((1, 1, 2, 1), self.heartbeat.listing_stats())
+
+    def test_totals_are_recounted_after_interval(self):
+        self.insert(1, "alice", timedelta(days=2))
+        self.heartbeat.listing_stats()
+        self.client.connection.execute("DELETE FROM public.listings")
+        self.assertEqual((0, 0, 1, 1), self.heartbeat.listing_stats())
+        self.heartbeat.next_recount = 0
+        self.assertEqual((0, 0, 0, 0), self.heartbeat.listing_stats())
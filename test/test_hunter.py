@@ -212,3 +212,65 @@ excluded_titles:
             for expose in unfiltered:
                 print("Got unfiltered expose: ", expose)
         self.assertTrue(len(unfiltered) == 0, "Expected flats with too few rooms to be filtered")
+
+
+class PagingCrawler(DummyCrawler):
+    """Crawler returning three pages of ten exposes each, recording the pages it loads"""
+
+    def __init__(self):
+        super().__init__()
+        self.pages_loaded = 0
+
+    def iter_results(self, search_url, max_pages=None):
+        for page_no in range(3):
+            self.pages_loaded += 1
+            yield from [ { 'id': page_no * 10 + idx, 'title': "Flat %d" % idx, 'crawler': self.get_name() }
+                         for idx in range(10) ]
+
+
+class StreamingIdWatch:
+
+    def __init__(self):
+        self.saved = 0
+
+    def save_exposes(self, exposes):
+        self.saved += len(exposes)
+
+    def mark_exposes_processed(self, exposes):
+        pass
+
+
+class StreamingHunterTest(unittest.TestCase):
+
+    CONFIG = """
+urls:
+  - https://www.example.com/search/flats-in-berlin
+processing:
+  batch_size: 5
+"""
+
+    def test_pages_are_loaded_as_exposes_are_consumed(self):
+        crawler = PagingCrawler()
+        config = Config(string=self.CONFIG)
+        config.set_searchers([ crawler ])
+        hunter = Hunter(config, StreamingIdWatch())
+        pages_seen = []
+        self.assertEqual(30, hunter.hunt(on_expose=lambda expose: pages_seen.append(crawler.pages_loaded)))
+        self.assertEqual(1, pages_seen[0])
+        self.assertEqual([ 1, 2, 3 ], sorted(set(pages_seen)))
+
+    def test_crawl_for_exposes_is_lazy(self):
+        crawler = PagingCrawler()
+        config = Config(string=self.CONFIG)
+        config.set_searchers([ crawler ])
+        exposes = Hunter(config, StreamingIdWatch()).crawl_for_exposes()
+        self.assertEqual(0, crawler.pages_loaded)
+        next(exposes)
+        self.assertEqual(1, crawler.pages_loaded)
+
+    def test_hunt_flats_returns_new_exposes(self):
+        config = Config(string=self.CONFIG)
+        config.set_searchers([ PagingCrawler() ])
+        id_watch = StreamingIdWatch()
+        self.assertEqual(30, len(Hunter(config, id_watch).hunt_flats()))
+        self.assertEqual(30, id_watch.saved)
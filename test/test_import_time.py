@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+class ImportTimeTest(unittest.TestCase):
+    """Loading the configuration must not pull in the heavy crawler dependencies;
+       they are imported the first time a crawler needs them"""
+
+    DEFERRED = [ 'selenium', 'bs4', 'random_user_agent', 'jsonpath_ng', 'lxml', 'sqlalchemy' ]
+
+    def imported_modules(self, module):
+        result = subprocess.run([ sys.executable, '-X', 'importtime', '-c', 'import %s' % module ],
+                                cwd=ROOT, capture_output=True, text=True, check=True)
+        modules = set()
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            name = line.rsplit('|', 1)[1].strip()
+            modules.add(name.split('.')[0])
+        return modules
+
+    def test_config_import_defers_heavy_dependencies(self):
+        modules = self.imported_modules('flathunter.config')
+        self.assertIn('flathunter', modules)
+        for dependency in self.DEFERRED:
+            self.assertNotIn(dependency, modules, "%s is imported eagerly" % dependency)
+
+    def test_user_agent_is_created_on_first_use(self):
+        from flathunter.abstract_crawler import Crawler
+        self.assertTrue(Crawler.HEADERS['User-Agent'])
+        self.assertIs(Crawler.user_agent_rotator(), Crawler.user_agent_rotator())
@@ -0,0 +1,39 @@
+import unittest
+from flathunter.message_renderer import MessageRenderer
+
+class MessageRendererTest(unittest.TestCase):
+
+    EXPOSE = { 'id': 1, 'crawler': 'Dummy', 'title': "Flat & <garden>", 'rooms': "2", 'size': "50 m^2",
+               'price': "1000 EUR", 'url': "https://www.example.com/1", 'address': "Street 1" }
+
+    def test_renders_template(self):
+        renderer = MessageRenderer("{title}\nPrice: {price}\n{durations}\n")
+        self.assertEqual("Flat & <garden>\nPrice: 1000 EUR", renderer.render(self.EXPOSE))
+
+    def test_escapes_html(self):
+        renderer = MessageRenderer("<b>{title}</b>", escape_html=True)
+        self.assertEqual("<b>Flat &amp; &lt;garden&gt;</b>", renderer.render(self.EXPOSE))
+
+    def test_renderer_is_shared_per_template(self):
+        config = { 'message': "{title} {url}" }
+        self.assertIs(MessageRenderer.for_config(config), MessageRenderer.for_config(dict(config)))
+        self.assertIsNot(MessageRenderer.for_config(config), MessageRenderer.for_config(config, escape_html=True))
+
+    def test_rendering_is_cached_per_expose(self):
+        renderer = MessageRenderer("{title}")
+        first = renderer.render(self.EXPOSE)
+        self.assertIs(first, renderer.render(dict(self.EXPOSE)))
+        self.assertEqual("Other", renderer.render(dict(self.EXPOSE, id=2, title="Other")))
+
+    def test_edited_expose_is_rendered_again(self):
+        renderer = MessageRenderer("{title}: {price}")
+        self.assertEqual("Flat & <garden>: 1000 EUR", renderer.render(self.EXPOSE))
+        self.assertEqual("Flat & <garden>: 900 EUR", renderer.render(dict(self.EXPOSE, price="900 EUR")))
+
+    def test_unknown_placeholders_are_rejected(self):
+        with self.assertRaises(KeyError):
+            MessageRenderer("{title} {floor}")
+
+    def test_format_specs_and_escaped_braces(self):
+        renderer = MessageRenderer("{{{title!r}}} {price:>10}")
+        self.assertEqual("{'Flat & <garden>'}   1000 EUR", renderer.render(self.EXPOSE))
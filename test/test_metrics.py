@@ -0,0 +1,112 @@
+import re
+import unittest
+from unittest import mock
+import requests
+from flathunt import LAST_RUN_TIMESTAMP, health_check, launch_flat_hunt_for_user
+from flathunter.abstract_crawler import PAGE_FETCH_ERRORS, PAGE_FETCHES, Crawler
+from flathunter.config import Config
+from flathunter.metrics import MetricsRegistry, MetricsServer
+
+class FailingCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+    def get_page_markup(self, search_url, driver=None, page_no=None):
+        return ""
+
+    def extract_data(self, soup):
+        return []
+
+class MetricsRegistryTest(unittest.TestCase):
+
+    def test_counters_and_gauges_are_rendered(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("test_fetches_total", "Fetches", ["crawler"])
+        counter.inc(crawler="Crawl\"Quoted\"")
+        counter.inc(2, crawler="Crawl\"Quoted\"")
+        registry.gauge("test_queue_depth", "Queue depth").set_function(lambda: 7)
+        text = registry.render()
+        self.assertIn("# TYPE test_fetches_total counter\n", text)
+        self.assertIn("test_fetches_total{crawler=\"Crawl\\\"Quoted\\\"\"} 3\n", text)
+        self.assertIn("test_queue_depth 7\n", text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "Durations", buckets=(1, 5))
+        for value in (0.5, 2, 2, 10):
+            histogram.observe(value)
+        text = registry.render()
+        self.assertIn("test_seconds_bucket{le=\"1.0\"} 1\n", text)
+        self.assertIn("test_seconds_bucket{le=\"5.0\"} 3\n", text)
+        self.assertIn("test_seconds_bucket{le=\"+Inf\"} 4\n", text)
+        self.assertIn("test_seconds_sum 14.5\n", text)
+        self.assertIn("test_seconds_count 4\n", text)
+
+    def test_labels_must_match(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("test_total", "Count", ["crawler"])
+        with self.assertRaises(ValueError):
+            counter.inc(filter_id="1")
+        with self.assertRaises(ValueError):
+            registry.counter("test_total", "Count")
+
+    def test_failing_gauge_does_not_break_scrape(self):
+        registry = MetricsRegistry()
+        registry.gauge("test_broken", "Broken").set_function(lambda: 1 / 0)
+        registry.gauge("test_working", "Working").set(1)
+        self.assertIn("test_working 1", registry.render())
+
+class MetricsServerTest(unittest.TestCase):
+
+    def test_serves_metrics_and_health(self):
+        registry = MetricsRegistry()
+        registry.counter("test_requests_total", "Requests").inc()
+        health = { 'healthy': True }
+        server = MetricsServer(0, "127.0.0.1", registry, lambda: (health['healthy'], "status"))
+        try:
+            base_url = "http://127.0.0.1:%d" % server.port
+            resp = requests.get(base_url + "/metrics", timeout=5)
+            self.assertEqual(200, resp.status_code)
+            self.assertIn("test_requests_total 1", resp.text)
+            self.assertEqual(200, requests.get(base_url + "/healthz", timeout=5).status_code)
+            health['healthy'] = False
+            self.assertEqual(503, requests.get(base_url + "/healthz", timeout=5).status_code)
+            self.assertEqual(404, requests.get(base_url + "/other", timeout=5).status_code)
+        finally:
+            server.close()
+
+    def test_server_is_only_started_when_configured(self):
+        self.assertIsNone(MetricsServer.for_config(Config(string="loop:\n  active: false\n")))
+
+class CrawlerMetricsTest(unittest.TestCase):
+
+    def test_empty_pages_count_as_fetch_errors(self):
+        fetches = PAGE_FETCHES.value(crawler="FailingCrawler")
+        errors = PAGE_FETCH_ERRORS.value(crawler="FailingCrawler")
+        FailingCrawler(Config(string="verbose: false\n")).get_results("https://www.example.com/search")
+        self.assertEqual(fetches + 1, PAGE_FETCHES.value(crawler="FailingCrawler"))
+        self.assertEqual(errors + 1, PAGE_FETCH_ERRORS.value(crawler="FailingCrawler"))
+
+class HealthCheckTest(unittest.TestCase):
+
+    def test_failed_runs_do_not_count_as_completed(self):
+        LAST_RUN_TIMESTAMP.set(0)
+        with mock.patch('flathunt.IdMaintainer'), mock.patch('flathunt.Hunter') as hunter:
+            hunter.return_value.hunt.side_effect = Exception("crawl failed")
+            self.assertEqual("crawl failed", launch_flat_hunt_for_user(None, 'user', 'filter', None))
+        healthy, _ = health_check(60, 0)()
+        self.assertFalse(healthy)
+        with mock.patch('flathunt.IdMaintainer'), mock.patch('flathunt.Hunter'):
+            self.assertIsNone(launch_flat_hunt_for_user(None, 'user', 'filter', None))
+        healthy, _ = health_check(60, 0)()
+        self.assertTrue(healthy)
+
+    def test_healthy_without_scheduled_filters(self):
+        LAST_RUN_TIMESTAMP.set(0)
+        filters = { 'count': 0 }
+        check = health_check(60, 0, lambda: filters['count'])
+        healthy, message = check()
+        self.assertTrue(healthy)
+        self.assertIn("no filters", message)
+        # Staleness counts from the time filters were scheduled again
+        filters['count'] = 1
+        self.assertTrue(check()[0])
@@ -0,0 +1,48 @@
+import unittest
+import requests_mock
+from flathunter.outbox import Outbox, OutboxDispatcher
+from flathunter.telegram_delivery import TelegramDeliveryQueue
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outbox = Outbox(":memory:")
+
+    def test_messages_are_deduplicated_per_chat(self):
+        self.assertTrue(self.outbox.add('token', {'chat_id': 1, 'text': 'a'}, 'Crawler:1'))
+        self.assertFalse(self.outbox.add('token', {'chat_id': 1, 'text': 'a'}, 'Crawler:1'))
+        self.assertTrue(self.outbox.add('token', {'chat_id': 2, 'text': 'a'}, 'Crawler:1'))
+        self.assertTrue(self.outbox.add('token', {'chat_id': 1, 'text': 'heartbeat'}))
+        self.assertTrue(self.outbox.add('token', {'chat_id': 1, 'text': 'heartbeat'}))
+        self.assertEqual({'pending': 4}, self.outbox.counts())
+
+    def test_in_flight_messages_are_recovered(self):
+        self.outbox.add('token', {'chat_id': 1, 'text': 'a'}, 'Crawler:1')
+        self.outbox.add('token', {'chat_id': 1, 'text': 'b'}, 'Crawler:2')
+        claimed = self.outbox.claim(10)
+        self.assertEqual(['a', 'b'], [payload['text'] for (_, _, payload) in claimed])
+        self.outbox.mark([claimed[0][0]], Outbox.STATUS_SENT)
+        self.assertEqual(1, self.outbox.recover())
+        self.assertEqual({'sent': 1, 'pending': 1}, self.outbox.counts())
+
+    def test_failed_messages_can_be_replayed(self):
+        self.outbox.add('token', {'chat_id': 1, 'text': 'a'})
+        (message_id, _, _), = self.outbox.claim(10)
+        self.outbox.mark([message_id], Outbox.STATUS_FAILED)
+        self.assertEqual(1, self.outbox.requeue_failed())
+        self.assertEqual(1, len(self.outbox.claim(10)))
+
+    @requests_mock.Mocker()
+    def test_dispatcher_drains_outbox(self, m):
+        m.post('https://api.telegram.org/bottoken/sendMessage', [
+            {'status_code': 200, 'json': {'ok': True}},
+            {'status_code': 400, 'json': {'ok': False}},
+        ])
+        for chat_id in [1, 2]:
+            self.outbox.add('token', {'chat_id': chat_id, 'text': 'a'}, 'Crawler:1')
+        delivery = TelegramDeliveryQueue(workers=1, global_rate=1000, chat_rate=1000)
+        dispatcher = OutboxDispatcher(self.outbox, delivery, interval=0.01)
+        dispatcher.start()
+        dispatcher.stop(timeout=5)
+        delivery.close(timeout=5)
+        self.assertEqual({'sent': 1, 'failed': 1}, self.outbox.counts())
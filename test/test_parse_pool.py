@@ -0,0 +1,46 @@
+import os
+import re
+import unittest
+from flathunter.abstract_crawler import Crawler
+from flathunter.config import Config
+from flathunter.parse_pool import ParsePool
+
+PAGE = "<ul>" + "".join('<li class="expose" data-id="%d">Flat %d</li>' % (i, i) for i in range(50)) + "</ul>"
+
+class ListingPageCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+    def get_page_markup(self, search_url, driver=None, page_no=None):
+        return PAGE
+
+    def extract_data(self, soup):
+        return [ { 'id': int(item['data-id']), 'title': item.text, 'crawler': self.get_name(), 'pid': os.getpid() }
+                 for item in soup.find_all("li", { "class": "expose" }) ]
+
+class ParsePoolTest(unittest.TestCase):
+
+    def tearDown(self):
+        ParsePool.shutdown_shared()
+
+    def test_pool_is_only_used_with_several_workers(self):
+        self.assertIsNone(ParsePool.for_config(Config(string="processing:\n  parse_workers: 1\n")))
+        self.assertIsNone(ParsePool.for_config(Config(string="urls: []\n")))
+
+    def test_pages_are_parsed_in_worker_processes(self):
+        config = Config(string="processing:\n  parse_workers: 2\n")
+        crawler = ListingPageCrawler(config)
+        exposes = crawler.get_results("https://www.example.com/search")
+        self.assertEqual(list(range(50)), [ expose['id'] for expose in exposes ])
+        self.assertEqual("ListingPageCrawler", exposes[0]['crawler'])
+        self.assertNotEqual(os.getpid(), exposes[0]['pid'])
+
+    def test_results_match_in_process_parsing(self):
+        crawler = ListingPageCrawler(Config(string="urls: []\n"))
+        in_process = crawler.get_results("https://www.example.com/search")
+        self.assertEqual(os.getpid(), in_process[0]['pid'])
+        pool = ParsePool(2)
+        try:
+            pooled = pool.extract(crawler, PAGE)
+        finally:
+            pool.close()
+        self.assertEqual([ (e['id'], e['title']) for e in in_process ], [ (e['id'], e['title']) for e in pooled ])
@@ -1,11 +1,19 @@
+import json
+import os
+import tempfile
+import time
 import unittest
 import yaml
 import re
 from flathunter.crawl_immowelt import CrawlImmowelt
 from flathunter.hunter import Hunter
 from flathunter.config import Config
-from flathunter.idmaintainer import IdMaintainer
-from flathunter.processor import ProcessorChain
+from flathunter.idmaintainer import AlreadySeenFilter, IdMaintainer
+from flathunter.abstract_processor import Processor
+from flathunter.default_processors import CrawlExposeDetails, LambdaProcessor
+from flathunter.filter import FilterBuilder
+from flathunter.processor import ProcessorChain, batched
+from flathunter.stage_metrics import StageMetrics
 from dummy_crawler import DummyCrawler
 from test_util import count
 
@@ -43,3 +51,176 @@ google_maps_api:
         exposes = chain.process(exposes)
         for expose in exposes:
             self.assertFalse(expose['address'].startswith('http'), "Expected addresses to be processed")
+
+
+class RecordingBatchProcessor(Processor):
+
+    def __init__(self):
+        self.batches = []
+
+    def process_batch(self, exposes):
+        self.batches.append(len(exposes))
+        return exposes
+
+
+class BatchProcessorTest(unittest.TestCase):
+
+    EXPOSES = [{'id': expose_id, 'title': "Flat %d" % expose_id} for expose_id in range(10)]
+
+    def test_batch_processor_receives_batches(self):
+        processor = RecordingBatchProcessor()
+        chain = ProcessorChain([processor], batch_size=4)
+        exposes = list(chain.process(self.EXPOSES))
+        self.assertEqual(exposes, self.EXPOSES)
+        self.assertEqual(processor.batches, [4, 4, 2])
+
+    def test_per_item_processors_are_unchanged(self):
+        config = Config(string=ProcessorTest.DUMMY_CONFIG)
+        chain = ProcessorChain.builder(config) \
+            .map(lambda expose: dict(expose, seen=True)) \
+            .build()
+        exposes = list(chain.process(self.EXPOSES))
+        self.assertEqual(len(exposes), len(self.EXPOSES))
+        self.assertTrue(all(expose['seen'] for expose in exposes))
+        self.assertFalse(LambdaProcessor(config, None).supports_batching())
+
+    def test_batches_flush_after_max_wait(self):
+        batches = list(batched(iter(self.EXPOSES), 100, max_wait=0))
+        self.assertEqual(len(batches), len(self.EXPOSES))
+
+    def test_batching_is_opt_in(self):
+        processor = RecordingBatchProcessor()
+        chain = ProcessorChain.builder(Config(string=ProcessorTest.DUMMY_CONFIG)).build()
+        chain.processors.append(processor)
+        list(chain.process(self.EXPOSES))
+        self.assertEqual([], processor.batches)
+
+    def test_duplicates_in_a_batch_are_filtered(self):
+        id_watch = RecordingIdWatch()
+        exposes = [{'id': expose_id, 'crawler': 'Dummy'} for expose_id in (1, 2, 1, 3, 2)]
+        chain = ProcessorChain.builder(Config(string=ProcessorTest.DUMMY_CONFIG)) \
+            .apply_filter(FilterBuilder().filter_already_seen(id_watch).build()) \
+            .build()
+        chain.batch_size = 5
+        self.assertEqual([1, 2, 3], [expose['id'] for expose in chain.process(exposes)])
+
+
+class DetailsCrawler(DummyCrawler):
+
+    def __init__(self):
+        super().__init__()
+        self.fetched = []
+
+    def get_expose_details(self, expose):
+        time.sleep(0.05)
+        self.fetched.append(expose['id'])
+        expose['from'] = "01.01.2030"
+        return expose
+
+
+class CrawlExposeDetailsTest(unittest.TestCase):
+
+    def test_details_are_fetched_concurrently_and_cached(self):
+        crawler = DetailsCrawler()
+        config = Config(string=ProcessorTest.DUMMY_CONFIG)
+        config.set_searchers([crawler])
+        exposes = [{'id': expose_id, 'crawler': 'DetailsCrawler', 'url': "https://www.example.com/expose/%d" % expose_id}
+                   for expose_id in range(8)]
+        processor = CrawlExposeDetails(config)
+        started = time.monotonic()
+        processor.process_batch([dict(expose) for expose in exposes])
+        self.assertLess(time.monotonic() - started, 0.05 * len(exposes))
+        cached = processor.process_batch([dict(expose) for expose in exposes])
+        self.assertEqual(8, len(crawler.fetched))
+        self.assertTrue(all(expose['from'] == "01.01.2030" for expose in cached))
+
+
+class SlowProcessor(Processor):
+
+    def process_expose(self, expose):
+        time.sleep(0.01)
+        if expose['id'] == 'broken':
+            raise ValueError("broken expose")
+        return expose
+
+
+class RecordingIdWatch:
+
+    user_id = 'user-1'
+    filter_id = 'filter-1'
+
+    def __init__(self):
+        self.saved = []
+
+    def save_expose(self, expose):
+        self.saved.append(expose)
+
+    def save_exposes(self, exposes):
+        self.saved.extend(exposes)
+
+    def mark_processed(self, expose_id, crawler):
+        pass
+
+    def mark_exposes_processed(self, exposes):
+        pass
+
+    def is_processed(self, expose_id, crawler):
+        return False
+
+    @property
+    def already_seen_filter(self):
+        return AlreadySeenFilter(self)
+
+
+class StageMetricsTest(unittest.TestCase):
+
+    EXPOSES = [{'id': expose_id, 'title': "Flat %d" % expose_id} for expose_id in range(5)]
+
+    def slow_source(self, exposes):
+        for expose in exposes:
+            time.sleep(0.02)
+            yield expose
+
+    def test_chain_is_not_instrumented_by_default(self):
+        config = Config(string=ProcessorTest.DUMMY_CONFIG)
+        self.assertIsNone(ProcessorChain.builder(config).instrument().build().metrics)
+
+    def test_stages_are_timed_exclusively(self):
+        metrics = StageMetrics({'filter_id': 'f1'})
+        chain = ProcessorChain([SlowProcessor(), RecordingBatchProcessor()], batch_size=2, metrics=metrics)
+        self.assertEqual(self.EXPOSES, list(chain.process(self.slow_source(self.EXPOSES))))
+        record = metrics.report()
+        self.assertEqual('f1', record['filter_id'])
+        stages = {stage['stage']: stage for stage in record['stages']}
+        self.assertEqual(['crawl', 'SlowProcessor', 'RecordingBatchProcessor'], [stage['stage'] for stage in record['stages']])
+        self.assertEqual((0, 5), (stages['crawl']['items_in'], stages['crawl']['items_out']))
+        self.assertEqual((5, 5), (stages['SlowProcessor']['items_in'], stages['SlowProcessor']['items_out']))
+        self.assertGreaterEqual(stages['crawl']['seconds'], 0.1)
+        self.assertGreaterEqual(stages['SlowProcessor']['seconds'], 0.05)
+        self.assertLess(stages['SlowProcessor']['seconds'], 0.1)
+        self.assertLess(stages['RecordingBatchProcessor']['seconds'], 0.05)
+
+    def test_errors_are_counted_by_the_failing_stage(self):
+        metrics = StageMetrics()
+        chain = ProcessorChain([SlowProcessor(), RecordingBatchProcessor()], batch_size=2, metrics=metrics)
+        with self.assertRaises(ValueError):
+            list(chain.process([{'id': 1}, {'id': 'broken'}]))
+        self.assertEqual([0, 1, 0], [stage['errors'] for stage in metrics.record()['stages']])
+
+    def test_hunter_writes_metrics_file(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "metrics.jsonl")
+            config = Config(string=ProcessorTest.DUMMY_CONFIG + "\nprocessing:\n  instrument: true\n  metrics_file: %s\n" % path)
+            config.set_searchers([DummyCrawler()])
+            received = []
+            StageMetrics.add_sink(received.append)
+            try:
+                exposes = Hunter(config, RecordingIdWatch()).hunt_flats()
+            finally:
+                StageMetrics.remove_sink(received.append)
+            with open(path) as file:
+                records = [json.loads(line) for line in file]
+            self.assertEqual(records, received)
+            self.assertEqual(1, len(records))
+            self.assertEqual(('user-1', 'filter-1'), (records[0]['user_id'], records[0]['filter_id']))
+            self.assertEqual(len(exposes), records[0]['stages'][-1]['items_out'])
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import time
+import unittest
+from flathunter.config import Config
+from flathunter.processor import ProcessorChain
+from flathunter.profiler import SamplingProfiler
+from flathunter.stage_metrics import StageMetrics
+
+def busy_source(count):
+    for idx in range(count):
+        started = time.perf_counter()
+        while time.perf_counter() - started < 0.01:
+            pass
+        yield { 'id': idx }
+
+class SamplingProfilerTest(unittest.TestCase):
+
+    def test_samples_are_attributed_to_stages(self):
+        profiler = SamplingProfiler(interval=0.001).start()
+        try:
+            chain = ProcessorChain([], metrics=StageMetrics())
+            self.assertEqual(20, len(list(chain.process(busy_source(20)))))
+        finally:
+            profiler.stop()
+        self.assertIn('crawl', profiler.stages())
+        crawl = profiler.folded('crawl')
+        self.assertTrue(any('test_profiler.py:busy_source' in line for line in crawl))
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in crawl))
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            profiler.write(tempdir)
+            self.assertIn('crawl.folded', os.listdir(tempdir))
+            with open(os.path.join(tempdir, 'all.folded')) as file:
+                self.assertTrue(all(line.split(';')[0] in profiler.stages() for line in file))
+
+    def test_only_the_profiled_thread_is_sampled(self):
+        profiler = SamplingProfiler(interval=0.001, thread_id=-1).start()
+        time.sleep(0.02)
+        profiler.stop()
+        self.assertEqual(0, profiler.samples)
+
+    def test_profiler_is_only_created_when_configured(self):
+        self.assertIsNone(SamplingProfiler.for_config(Config(string="loop:\n  active: false\n")))
+        self.assertIsNotNone(SamplingProfiler.for_config(Config(string="profiling:\n  cycles: 2\n")))
+
+    def test_stages_are_only_tracked_while_profiling(self):
+        chain = ProcessorChain([], metrics=StageMetrics())
+        exposes = chain.process(busy_source(2))
+        next(exposes)
+        self.assertEqual({}, StageMetrics._active)
+        profiler = SamplingProfiler(interval=0.001).start()
+        try:
+            list(exposes)
+            self.assertEqual({}, StageMetrics._active)
+        finally:
+            profiler.stop()
+        profiler.stop()
+        self.assertEqual(0, StageMetrics._profilers)
@@ -0,0 +1,57 @@
+import os
+import re
+import tempfile
+import unittest
+from flathunter.abstract_crawler import Crawler
+from flathunter.config import Config
+from flathunter.response_archive import ResponseArchive
+
+class PageCrawler(Crawler):
+    URL_PATTERN = re.compile(r'https://www\.example\.com')
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.fetched = []
+
+    def get_page_markup(self, search_url, driver=None, page_no=None):
+        self.fetched.append(search_url)
+        return '<ul><li class="expose">%s</li></ul>' % search_url
+
+    def extract_data(self, soup):
+        return [ { 'title': item.text } for item in soup.find_all("li", { "class": "expose" }) ]
+
+class ResponseArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def config(self, mode):
+        return Config(string="archive:\n  path: %s\n  mode: %s\n" % (self.path, mode))
+
+    def test_identical_bodies_are_stored_once(self):
+        archive = ResponseArchive(self.path)
+        digest = archive.store("https://www.example.com/1", "<html></html>")
+        self.assertEqual(digest, archive.store("https://www.example.com/2", b"<html></html>"))
+        self.assertEqual(b"<html></html>", archive.load("https://www.example.com/2"))
+        self.assertIsNone(archive.load("https://www.example.com/3"))
+        objects = [ name for (_, _, names) in os.walk(os.path.join(self.path, "objects")) for name in names ]
+        self.assertEqual([ digest + ".gz" ], objects)
+        archive.close()
+
+    def test_replays_recorded_pages_without_fetching(self):
+        recorder = PageCrawler(self.config("record"))
+        recorded = recorder.get_results("https://www.example.com/search")
+        self.assertEqual([ "https://www.example.com/search" ], recorder.fetched)
+
+        replayer = PageCrawler(self.config("replay"))
+        self.assertEqual(recorded, replayer.get_results("https://www.example.com/search"))
+        self.assertEqual([], replayer.get_results("https://www.example.com/other"))
+        self.assertEqual([], replayer.fetched)
+
+    def test_invalid_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ResponseArchive(self.path, "rewind")
@@ -0,0 +1,176 @@
+import unittest
+from flathunter.scheduler import FilterScheduler
+from flathunt import create_oxylab_jobs, take_oxylab_job
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class FilterSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = FilterScheduler(default_interval=600, min_interval=60, clock=self.clock)
+
+    def run_due(self):
+        ran = []
+        while True:
+            entry = self.scheduler.pop_due()
+            if entry is None:
+                return ran
+            ran.append(entry.filter_id)
+            self.scheduler.reschedule(entry)
+
+    def test_new_filters_are_spread_over_their_interval(self):
+        self.scheduler.sync({ 'a': { 'scraping_interval': 10 }, 'b': { 'scraping_interval': 10 } })
+        self.assertEqual(['a'], self.run_due())
+        self.assertEqual(300, self.scheduler.wait_time())
+        self.clock.now += 300
+        self.assertEqual(['b'], self.run_due())
+
+    def test_filters_run_at_their_own_interval(self):
+        self.scheduler.sync({ 'fast': { 'scraping_interval': 1 }, 'slow': { 'scraping_interval': 5 } })
+        ran = []
+        for _ in range(600):
+            ran += self.run_due()
+            self.clock.now += 1
+        self.assertEqual(10, ran.count('fast'))
+        self.assertEqual(2, ran.count('slow'))
+
+    def test_interval_is_bounded(self):
+        self.assertEqual(60, self.scheduler.interval_for({ 'scraping_interval': 0.1 }))
+        self.assertEqual(600, self.scheduler.interval_for({ 'scraping_interval': None }))
+
+    def test_removed_filters_are_dropped(self):
+        self.scheduler.sync({ 'a': {}, 'b': {} })
+        self.scheduler.sync({ 'b': {} })
+        self.clock.now += 600
+        self.assertEqual(['b'], self.run_due())
+        self.assertEqual(1, len(self.scheduler))
+
+    def test_changed_interval_moves_next_run(self):
+        self.scheduler.sync({ 'a': { 'scraping_interval': 10 } })
+        self.run_due()
+        self.scheduler.sync({ 'a': { 'scraping_interval': 2 } })
+        self.assertEqual(120, self.scheduler.wait_time())
+
+    def test_reports_lag_and_skips_missed_runs(self):
+        self.scheduler.sync({ 'a': { 'scraping_interval': 1 } })
+        self.clock.now += 150
+        self.assertEqual(['a'], self.run_due())
+        self.assertEqual((1, 150.0, 150.0), self.scheduler.lag_report())
+        self.assertEqual(30, self.scheduler.wait_time())
+        self.assertEqual((0, 0.0, 0.0), self.scheduler.lag_report())
+
+
+class AdaptiveSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = FilterScheduler(min_interval=60, clock=self.clock,
+                                         adaptive={ 'target': 1, 'min_factor': 0.5, 'max_factor': 4 })
+        self.scheduler.sync({ 1: { 'scraping_interval': 10 }, 2: { 'scraping_interval': 10 },
+                              3: { 'scraping_interval': 10 } })
+
+    def intervals(self):
+        return { filter_id: entry.interval for (filter_id, entry) in self.scheduler.entries.items() }
+
+    def test_hot_filters_are_polled_more_often(self):
+        self.scheduler.adapt({ '1': 240, '2': 6 }, 3600)
+        self.assertEqual({ 1: 300, 2: 600, 3: 2400 }, self.intervals())
+
+    def test_adapted_interval_survives_refresh(self):
+        self.scheduler.adapt({ '1': 240 }, 3600)
+        self.scheduler.sync({ 1: { 'scraping_interval': 10 } })
+        self.assertEqual(300, self.scheduler.entries[1].interval)
+
+    def test_adapt_is_disabled_by_default(self):
+        scheduler = FilterScheduler(clock=self.clock)
+        scheduler.sync({ 1: { 'scraping_interval': 10 } })
+        scheduler.adapt({}, 3600)
+        self.assertEqual(600, scheduler.entries[1].interval)
+
+class FakeOxylabClient:
+
+    def __init__(self):
+        self.created = []
+        self.status = 'done'
+
+    def create_job(self, payload):
+        self.created.append(payload['url'])
+        return { 'id': 'job-%d' % len(self.created) }
+
+    def check_job_status(self, job_id):
+        return self.status
+
+class OxylabJobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = FilterScheduler(default_interval=600, min_interval=60, clock=self.clock)
+        self.client = FakeOxylabClient()
+        self.jobs = {}
+
+    def test_every_run_gets_a_fresh_job(self):
+        self.scheduler.sync({ 'a': { 'filter_url': 'https://a', 'scraping_interval': 10 } })
+        job_ids = []
+        for _ in range(3):
+            create_oxylab_jobs(self.client, self.scheduler, self.jobs, 30)
+            entry = self.scheduler.pop_due()
+            job_ids.append(take_oxylab_job(self.client, self.jobs, entry.filter_id, 300, self.clock.now)[1])
+            self.scheduler.reschedule(entry)
+            self.clock.now += 600
+        self.assertEqual(['job-1', 'job-2', 'job-3'], job_ids)
+
+    def test_jobs_are_created_ahead_of_the_run(self):
+        self.scheduler.sync({ 'a': { 'filter_url': 'https://a', 'scraping_interval': 10 } })
+        entry = self.scheduler.pop_due()
+        self.scheduler.reschedule(entry)
+        self.assertEqual(self.clock.now + 570, create_oxylab_jobs(self.client, self.scheduler, self.jobs, 30))
+        self.assertEqual({}, self.jobs)
+        self.clock.now += 570
+        create_oxylab_jobs(self.client, self.scheduler, self.jobs, 30)
+        self.assertEqual(['a'], list(self.jobs))
+        self.assertIsNone(self.scheduler.pop_due())
+
+    def test_jobs_of_dropped_filters_are_forgotten(self):
+        self.scheduler.sync({ 'a': { 'filter_url': 'https://a' } })
+        create_oxylab_jobs(self.client, self.scheduler, self.jobs, 30)
+        self.scheduler.sync({})
+        create_oxylab_jobs(self.client, self.scheduler, self.jobs, 30)
+        self.assertEqual({}, self.jobs)
+
+    def test_pending_jobs_postpone_the_run_without_waiting(self):
+        self.scheduler.sync({ 'a': { 'filter_url': 'https://a' }, 'b': { 'filter_url': 'https://b' } })
+        create_oxylab_jobs(self.client, self.scheduler, self.jobs, 600)
+        self.client.status = 'pending'
+        entry = self.scheduler.pop_due()
+        self.assertEqual((False, 'job-1'), take_oxylab_job(self.client, self.jobs, 'a', 300, self.clock.now))
+        self.scheduler.postpone(entry, 5)
+        self.clock.now += 5
+        self.assertEqual('a', self.scheduler.pop_due().filter_id)
+        self.client.status = 'done'
+        self.assertEqual((True, 'job-1'), take_oxylab_job(self.client, self.jobs, 'a', 300, self.clock.now))
+
+    def test_pending_jobs_are_given_up_after_timeout(self):
+        self.scheduler.sync({ 'a': { 'filter_url': 'https://a' } })
+        create_oxylab_jobs(self.client, self.scheduler, self.jobs, 30)
+        self.client.status = 'pending'
+        self.clock.now += 300
+        self.assertEqual((True, None), take_oxylab_job(self.client, self.jobs, 'a', 300, self.clock.now))
+        self.assertEqual({}, self.jobs)
+
+    def test_jobs_of_moved_runs_are_dropped(self):
+        self.scheduler.sync({ 'a': { 'filter_url': 'https://a', 'scraping_interval': 10 } })
+        entry = self.scheduler.pop_due()
+        self.scheduler.reschedule(entry)
+        self.clock.now += 570
+        create_oxylab_jobs(self.client, self.scheduler, self.jobs, 30)
+        self.assertEqual(['a'], list(self.jobs))
+        self.scheduler.set_interval(entry, 1200)
+        create_oxylab_jobs(self.client, self.scheduler, self.jobs, 30)
+        self.assertEqual({}, self.jobs)
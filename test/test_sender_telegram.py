@@ -15,3 +15,43 @@ class SenderTelegramTest(unittest.TestCase):
     def test_send_no_message_if_no_receivers(self, m):
       sender = SenderTelegram({ "telegram": { "bot_token": "dummy_token", "receiver_ids": None }})
       self.assertEqual(None, sender.send_msg("result"), "Expected no message to be sent")
+
+
+class SenderTelegramDigestTest(unittest.TestCase):
+
+    CONFIG = { "telegram": { "bot_token": "dummy_token", "receiver_ids": [ 123 ], "digest": { "threshold": 3, "page_size": 2 } },
+               "message": "{title}" }
+
+    EXPOSES = [ { 'id': expose_id, 'crawler': 'Dummy', 'title': "Flat <%d>" % expose_id, 'url': "https://www.example.com/%d" % expose_id,
+                  'price': "1000", 'rooms': "2", 'size': "50", 'address': "Street" } for expose_id in range(5) ]
+
+    @requests_mock.Mocker()
+    def test_sends_single_messages_below_threshold(self, m):
+      m.post('https://api.telegram.org/botdummy_token/sendMessage', json={ "ok": True })
+      sender = SenderTelegram(self.CONFIG)
+      self.assertEqual(2, len(list(sender.process_exposes(self.EXPOSES[:2]))))
+      self.assertEqual(2, m.call_count)
+
+    @requests_mock.Mocker()
+    def test_sends_paginated_digest_above_threshold(self, m):
+      m.post('https://api.telegram.org/botdummy_token/sendMessage', json={ "ok": True })
+      sender = SenderTelegram(self.CONFIG)
+      self.assertEqual(5, len(list(sender.process_exposes(self.EXPOSES))))
+      self.assertEqual(3, m.call_count)
+      first_page = m.request_history[0].json()['text']
+      self.assertIn("New listings</b> (1)", first_page)
+      self.assertIn("5 new listings</b> (3/3)", m.request_history[2].json()['text'])
+      self.assertIn("Flat &lt;0&gt;", first_page)
+      self.assertNotIn("reply_markup", m.request_history[0].json())
+
+    @requests_mock.Mocker()
+    def test_digest_pages_are_sent_while_crawling(self, m):
+      m.post('https://api.telegram.org/botdummy_token/sendMessage', json={ "ok": True })
+      sender = SenderTelegram(self.CONFIG)
+      exposes = sender.process_exposes(iter(self.EXPOSES))
+      self.assertEqual(self.EXPOSES[0], next(exposes))
+      self.assertEqual(1, m.call_count)
+
+    def test_digest_key_depends_only_on_the_listings(self):
+      self.assertEqual(SenderTelegram.digest_key(self.EXPOSES[:2]), SenderTelegram.digest_key(self.EXPOSES[1::-1]))
+      self.assertNotEqual(SenderTelegram.digest_key(self.EXPOSES[:2]), SenderTelegram.digest_key(self.EXPOSES[:3]))
@@ -0,0 +1,62 @@
+import unittest
+from flathunter.sharding import HashRing, WorkerLease
+
+class LeaseTableClient:
+    """Pretends a fixed set of workers hold live leases"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.commits = []
+
+    def execute_commit(self, query):
+        self.commits.append(query)
+
+    def execute_select(self, query):
+        return [ { 'worker_id': worker } for worker in self.workers ]
+
+class HashRingTest(unittest.TestCase):
+
+    def test_keys_are_spread_over_workers(self):
+        ring = HashRing([ 'a', 'b', 'c' ])
+        owners = [ ring.owner(key) for key in range(3000) ]
+        for worker in [ 'a', 'b', 'c' ]:
+            self.assertGreater(owners.count(worker), 700)
+
+    def test_removing_a_worker_only_moves_its_keys(self):
+        before = HashRing([ 'a', 'b', 'c' ])
+        after = HashRing([ 'a', 'b' ])
+        for key in range(1000):
+            if before.owner(key) != 'c':
+                self.assertEqual(before.owner(key), after.owner(key))
+
+    def test_empty_ring_has_no_owner(self):
+        self.assertIsNone(HashRing([]).owner(1))
+
+class WorkerLeaseTest(unittest.TestCase):
+
+    def test_workers_split_filters(self):
+        filters = { filter_id: {} for filter_id in range(100) }
+        client = LeaseTableClient([ 'a', 'b' ])
+        owned_a = WorkerLease(client, 'a').owned(filters)
+        owned_b = WorkerLease(client, 'b').owned(filters)
+        self.assertEqual(set(filters), set(owned_a) | set(owned_b))
+        self.assertFalse(set(owned_a) & set(owned_b))
+
+    def test_worker_takes_over_expired_leases(self):
+        filters = { filter_id: {} for filter_id in range(100) }
+        lease = WorkerLease(LeaseTableClient([ 'a', 'b' ]), 'a')
+        self.assertLess(len(lease.owned(filters)), 100)
+        lease.supabase.workers = [ 'a' ]
+        self.assertEqual(100, len(lease.owned(filters)))
+        self.assertTrue(lease.is_leader())
+
+    def test_sharding_is_optional(self):
+        self.assertIsNone(WorkerLease.from_config({}, LeaseTableClient([])))
+
+    def test_lease_does_not_change_the_schema(self):
+        client = LeaseTableClient([ 'a' ])
+        lease = WorkerLease(client, 'a')
+        self.assertEqual([], client.commits)
+        lease.owned({ 1: {} })
+        lease.release()
+        self.assertFalse([ query for query in client.commits if 'CREATE' in query.upper() ])
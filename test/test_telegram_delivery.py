@@ -0,0 +1,65 @@
+import unittest
+import requests_mock
+from flathunter.telegram_delivery import RateLimiter, TelegramDeliveryQueue
+
+class TelegramDeliveryTest(unittest.TestCase):
+
+    URL = 'https://api.telegram.org/botdummy_token/sendMessage'
+
+    def test_rate_limiter_spaces_messages_per_chat(self):
+        limiter = RateLimiter(global_rate=100, chat_rate=2)
+        self.assertAlmostEqual(0, limiter.reserve('token', 1), delta=0.01)
+        self.assertAlmostEqual(0.5, limiter.reserve('token', 1), delta=0.01)
+        self.assertAlmostEqual(0, limiter.reserve('token', 2), delta=0.01)
+
+    def test_rate_limiter_caps_messages_per_second(self):
+        limiter = RateLimiter(global_rate=3, chat_rate=1000)
+        delays = [limiter.reserve('token', chat_id) for chat_id in range(4)]
+        self.assertTrue(all(delay < 1 for delay in delays[:3]))
+        self.assertTrue(delays[3] > 0)
+        self.assertAlmostEqual(0, limiter.reserve('other_token', 1), delta=0.01)
+
+    @requests_mock.Mocker()
+    def test_messages_are_delivered(self, m):
+        m.post(self.URL, text='{"ok": true}')
+        delivery = TelegramDeliveryQueue(workers=2, global_rate=1000, chat_rate=1000)
+        for chat_id in range(5):
+            delivery.enqueue('dummy_token', {'chat_id': chat_id, 'text': 'hello'})
+        delivery.close(timeout=5)
+        self.assertEqual(5, delivery.sent)
+        self.assertEqual(5, m.call_count)
+
+    @requests_mock.Mocker()
+    def test_retry_after_is_honoured(self, m):
+        m.post(self.URL, [
+            {'status_code': 429, 'json': {'ok': False, 'parameters': {'retry_after': 0.1}}},
+            {'status_code': 200, 'json': {'ok': True}},
+        ])
+        delivery = TelegramDeliveryQueue(workers=1, global_rate=1000, chat_rate=1000)
+        delivery.enqueue('dummy_token', {'chat_id': 123, 'text': 'hello'})
+        delivery.close(timeout=5)
+        self.assertEqual(1, delivery.sent)
+        self.assertEqual(2, m.call_count)
+
+    @requests_mock.Mocker()
+    def test_client_errors_are_not_retried(self, m):
+        m.post(self.URL, status_code=400, json={'ok': False})
+        delivery = TelegramDeliveryQueue(workers=1)
+        delivery.enqueue('dummy_token', {'chat_id': 123, 'text': 'hello'})
+        delivery.close(timeout=5)
+        self.assertEqual(1, delivery.failed)
+        self.assertEqual(1, m.call_count)
+
+    @requests_mock.Mocker()
+    def test_waiting_chat_does_not_block_other_chats(self, m):
+        m.post(self.URL, [
+            {'status_code': 429, 'json': {'ok': False, 'parameters': {'retry_after': 30}}},
+            {'status_code': 200, 'json': {'ok': True}},
+        ])
+        delivery = TelegramDeliveryQueue(workers=1, global_rate=1000, chat_rate=1000)
+        delivery.enqueue('dummy_token', {'chat_id': 1, 'text': 'hello'})
+        delivery.enqueue('dummy_token', {'chat_id': 2, 'text': 'hello'})
+        self.assertFalse(delivery.join(timeout=1))
+        self.assertEqual(1, delivery.sent)
+        self.assertEqual(1, delivery.pending())
+        delivery.close(timeout=0)
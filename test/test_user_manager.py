@@ -0,0 +1,60 @@
+import unittest
+from sqlite_supabase import SqliteSupabaseClient
+from flathunter.config import Config
+from flathunter.user_manager import UserManager
+
+class UserManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = SqliteSupabaseClient(
+            "CREATE TABLE filter_settings (id INTEGER PRIMARY KEY, user_id TEXT, filter_url TEXT, "
+            "receiver_ids TEXT, is_paid BOOLEAN, scraping_interval INTEGER, updated_at TEXT)")
+        self.manager = UserManager(Config(string="loop:\n  schedule:\n    full_refresh_interval: 3600\n"))
+        self.manager.supabase_client = self.client
+        self.manager.PAGE_SIZE = 10
+
+    def upsert(self, filter_id, updated_at, is_paid=True):
+        self.client.connection.execute("INSERT OR REPLACE INTO filter_settings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                       (filter_id, "user", "https://www.example.com/%d" % filter_id, "1",
+                                        is_paid, 10, updated_at))
+
+    def test_reads_all_filters_in_pages(self):
+        for filter_id in range(1, 26):
+            self.upsert(filter_id, "2024-01-01 00:00:00")
+        self.upsert(26, "2024-01-01 00:00:00", is_paid=False)
+        filters = self.manager.get_active_filters()
+        self.assertEqual(25, len(filters))
+        self.assertEqual(3, len(self.client.queries))
+        self.assertIn("id > :after_0", self.client.queries[-1])
+
+    def test_refresh_applies_changes_only(self):
+        for filter_id in range(1, 4):
+            self.upsert(filter_id, "2024-01-01 00:00:00")
+        self.assertEqual({ 1, 2, 3 }, set(self.manager.refresh_active_filters()))
+
+        self.upsert(2, "2024-01-02 00:00:00", is_paid=False)
+        self.upsert(4, "2024-01-02 00:00:00")
+        self.client.queries = []
+        self.assertEqual({ 1, 3, 4 }, set(self.manager.refresh_active_filters()))
+        self.assertEqual(1, len(self.client.queries))
+        self.assertIn("(updated_at, id) > (:after_0, :after_1)", self.client.queries[0])
+
+    def test_unchanged_filters_are_not_read_again(self):
+        self.upsert(1, "2024-01-01 00:00:00")
+        self.upsert(2, "2024-01-01 00:00:00")
+        self.manager.refresh_active_filters()
+        self.assertEqual(0, self.manager._apply_changes())
+        self.upsert(3, "2024-01-01 00:00:00")
+        self.assertEqual(1, self.manager._apply_changes())
+        self.assertEqual({ 1, 2, 3 }, set(self.manager.filters))
+
+    def test_refresh_keeps_filters_on_error(self):
+        self.upsert(1, "2024-01-01 00:00:00")
+        self.manager.refresh_active_filters()
+        self.client.connection.close()
+        self.assertEqual({ 1 }, set(self.manager.refresh_active_filters()))
+
+    def test_refreshed_filters_are_copies(self):
+        self.upsert(1, "2024-01-01 00:00:00")
+        self.manager.refresh_active_filters()[1]["oxylabs_job_id"] = "job"
+        self.assertNotIn("oxylabs_job_id", self.manager.refresh_active_filters()[1])